@@ -24,7 +24,6 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     'sorl.thumbnail',
-    'debug_toolbar',
     'social_django',
 
     'posts.apps.PostsConfig',
@@ -33,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.query_accounting.QueryAccountingMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,10 +41,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
 ]
 
+QUERY_COUNT_WARNING = 20
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
     'social_core.backends.yandex.YandexOAuth2',
@@ -61,6 +63,10 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+THUMBNAIL_PREGENERATE_WORKERS = int(
+    os.getenv('THUMBNAIL_PREGENERATE_WORKERS', 2)
+)
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -101,21 +107,95 @@ TEMPLATES = [
 ]
 
 
-# WSGI_APPLICATION = 'blog.wsgi.application'
+WSGI_APPLICATION = 'blog.wsgi.application'
+
+ASGI_APPLICATION = 'blog.asgi.application'
+
+# Асинхронные версии страниц для чтения (posts.async_views); имеет
+# смысл под ASGI-сервером.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='false').lower() == 'true'
+
+# Панель отладки синхронная: под ASGI она перевела бы всю цепочку
+# middleware в поток, поэтому подключается только без ASYNC_VIEWS.
+if not ASYNC_VIEWS:
+    INSTALLED_APPS.insert(
+        INSTALLED_APPS.index('social_django'), 'debug_toolbar'
+    )
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index(
+            'social_django.middleware.SocialAuthExceptionMiddleware'
+        ),
+        'debug_toolbar.middleware.DebugToolbarMiddleware'
+    )
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 5000,
+                'cache_size': -64 * 1024,
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
 
+# Реплики только для чтения: пути к файлам через пробел. Локально их
+# наполняет команда sync_replicas.
+DATABASE_REPLICAS = []
+
+for number, name in enumerate(os.getenv('DB_REPLICAS', '').split(), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'OPTIONS': {
+            **DATABASES['default']['OPTIONS'],
+            'pragmas': {
+                **DATABASES['default']['OPTIONS']['pragmas'],
+                'query_only': 'ON',
+            },
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+REPLICA_PIN_SECONDS = 5
+
+# Страница, собранная по данным реплики, могла отстать от версии
+# кеша, под которой сохранится, поэтому хранится недолго.
+REPLICA_PAGE_CACHE_TIMEOUT = 30
+
+SQLITE_LOCK_RETRIES = 4
+
+SQLITE_LOCK_RETRY_DELAY = 0.05
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+            'STALE_TTL': 60,
+        },
     }
 }
 
+# Кеш тестов - во временном каталоге, а не в CACHE_LOCATION.
+TEST_RUNNER = 'core.testing.TestRunner'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
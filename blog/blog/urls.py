@@ -15,8 +15,9 @@ handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.csrf_failure'
 
 if settings.DEBUG:
-    import debug_toolbar
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )
+if settings.DEBUG and 'debug_toolbar' in settings.INSTALLED_APPS:
+    import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
@@ -0,0 +1,362 @@
+"""
+Кеш в файле SQLite, общий для всех процессов на одном хосте.
+
+LocMemCache у каждого воркера свой: попадания падают с ростом числа
+воркеров, а сброс кеша в одном процессе не виден остальным. Этот
+бэкенд хранит записи в одном файле (WAL, одновременное чтение),
+вытесняет давно не читанные записи при превышении MAX_ENTRIES или
+MAX_SIZE и защищает от «стада»: истекшую запись пересчитывает только
+один процесс, остальные в это время получают устаревшую копию.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_STALE_TTL = 30
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_WAIT_TIMEOUT = 2
+WAIT_INTERVAL = 0.05
+ACCESS_GRANULARITY = 1
+CULL_TARGET = 0.9
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    '''CREATE TABLE IF NOT EXISTS cache_lock (
+        key TEXT PRIMARY KEY,
+        expires REAL NOT NULL
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries + 1, size = size + NEW.size WHERE id = 1;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries - 1, size = size - OLD.size WHERE id = 1;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET size = size - OLD.size + NEW.size WHERE id = 1;
+    END''',
+)
+
+UPSERT = '''
+    INSERT INTO cache (key, value, expires, accessed, size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value,
+        expires = excluded.expires,
+        accessed = excluded.accessed,
+        size = excluded.size
+'''
+
+
+class SQLiteCache(BaseCache):
+    """
+    Параметры OPTIONS:
+    MAX_ENTRIES - максимум записей (как у остальных бэкендов);
+    MAX_SIZE - максимальный суммарный размер значений в байтах;
+    STALE_TTL - сколько секунд после истечения отдавать устаревшую
+    копию, пока один процесс пересчитывает запись;
+    LOCK_TIMEOUT - через сколько секунд брошенная блокировка пересчета
+    считается свободной (при следующей записи она удаляется);
+    WAIT_TIMEOUT - сколько get_or_set ждет чужого пересчета, если
+    устаревшей копии нет.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', DEFAULT_MAX_SIZE))
+        self._stale_ttl = float(options.get('STALE_TTL', DEFAULT_STALE_TTL))
+        self._lock_timeout = float(
+            options.get('LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+        )
+        self._wait_timeout = float(
+            options.get('WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT)
+        )
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        """Соединение на поток и процесс: после fork открываем заново."""
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path,
+            timeout=self._lock_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _acquire(self, key):
+        """Пытается взять блокировку пересчета ключа."""
+
+        now = time.time()
+        cursor = self._db.execute(
+            '''INSERT INTO cache_lock (key, expires) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET expires = excluded.expires
+            WHERE cache_lock.expires < ?''',
+            (key, now + self._lock_timeout, now)
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, key):
+        self._db.execute('DELETE FROM cache_lock WHERE key = ?', (key,))
+
+    def _lookup(self, key, lock_missing=False):
+        """
+        Возвращает (значение или None, найдено ли, взята ли блокировка).
+        Устаревшая копия отдается всем, кроме процесса, взявшего
+        блокировку: он получает промах и пересчитывает запись. На
+        отсутствующий ключ блокировку берет только get_or_set
+        (lock_missing): после простого get значение могут и не записать.
+        """
+
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)
+        ).fetchone()
+        if row is not None:
+            value, expires, accessed = row
+            if expires is None or expires > now:
+                if now - accessed > ACCESS_GRANULARITY:
+                    self._db.execute(
+                        'UPDATE cache SET accessed = ? WHERE key = ?',
+                        (now, key)
+                    )
+                return pickle.loads(value), True, False
+            if now - expires < self._stale_ttl:
+                if self._acquire(key):
+                    return None, False, True
+                return pickle.loads(value), True, False
+        if not (lock_missing and self._acquire(key)):
+            return None, False, False
+        # Между чтением и блокировкой значение мог записать прежний
+        # владелец блокировки: запись снимает ее вместе с вставкой.
+        row = self._db.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, now)
+        ).fetchone()
+        if row is not None:
+            self._release(key)
+            return pickle.loads(row[0]), True, False
+        return None, False, True
+
+    def get(self, key, default=None, version=None):
+        value, found, _ = self._lookup(self._key(key, version))
+        return value if found else default
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        """
+        Пересчитывает отсутствующее значение только в одном процессе;
+        остальные ждут его до WAIT_TIMEOUT секунд.
+        """
+
+        db_key = self._key(key, version)
+        value, found, acquired = self._lookup(db_key, lock_missing=True)
+        if found:
+            return value
+        if not acquired:
+            deadline = time.time() + self._wait_timeout
+            while time.time() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                value, found, acquired = self._lookup(
+                    db_key, lock_missing=True
+                )
+                if found:
+                    return value
+                if acquired:
+                    break
+        if callable(default):
+            default = default()
+        if default is not None:
+            self.set(key, default, timeout=timeout, version=version)
+        else:
+            self._release(db_key)
+        return default
+
+    def get_many(self, keys, version=None):
+        key_map = {self._key(key, version): key for key in keys}
+        if not key_map:
+            return {}
+        now = time.time()
+        placeholders = ', '.join('?' * len(key_map))
+        rows = self._db.execute(
+            f'''SELECT key, value, accessed FROM cache
+            WHERE key IN ({placeholders})
+            AND (expires IS NULL OR expires > ?)''',
+            (*key_map, now)
+        ).fetchall()
+        # Как в get: прочитанное не должно вытесняться первым.
+        touched = [
+            key for key, _, accessed in rows
+            if now - accessed > ACCESS_GRANULARITY
+        ]
+        if touched:
+            self._db.execute(
+                f'''UPDATE cache SET accessed = ?
+                WHERE key IN ({', '.join('?' * len(touched))})''',
+                (now, *touched)
+            )
+        return {key_map[key]: pickle.loads(value) for key, value, _ in rows}
+
+    def _write(self, key, value, timeout, only_new=False):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if only_new:
+                row = db.execute(
+                    'SELECT expires FROM cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and (row[0] is None or row[0] > now):
+                    db.execute('ROLLBACK')
+                    return False
+            db.execute(UPSERT, (key, data, expires, now, len(data)))
+            db.execute('DELETE FROM cache_lock WHERE key = ?', (key,))
+            self._cull(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return True
+
+    def _cull(self, db, now):
+        """
+        Убирает истекшие блокировки пересчета (их таблица маленькая)
+        и вытесняет давно не читанные записи при переполнении.
+        """
+
+        db.execute('DELETE FROM cache_lock WHERE expires < ?', (now,))
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats WHERE id = 1'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires < ?', (now - self._stale_ttl,)
+        )
+        while True:
+            entries, size = db.execute(
+                'SELECT entries, size FROM cache_stats WHERE id = 1'
+            ).fetchone()
+            excess = max(
+                entries - int(self._max_entries * CULL_TARGET),
+                1 if size > self._max_size * CULL_TARGET else 0,
+            )
+            if excess <= 0 or entries == 0:
+                return
+            db.execute(
+                '''DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed LIMIT ?
+                )''',
+                (max(excess, entries // self._cull_frequency),)
+            )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(self._key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(
+            self._key(key, version), value, timeout, only_new=True
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._db.execute(
+            '''UPDATE cache SET expires = ? WHERE key = ?
+            AND (expires IS NULL OR expires > ?)''',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time())
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._release(key)
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self._db.execute(
+            '''SELECT 1 FROM cache WHERE key = ?
+            AND (expires IS NULL OR expires > ?)''',
+            (self._key(key, version), time.time())
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов: чтение и запись в одной транзакции."""
+
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                '''SELECT value FROM cache WHERE key = ?
+                AND (expires IS NULL OR expires > ?)''',
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (data, len(data), key)
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+        self._db.execute('DELETE FROM cache_lock')
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами того же потока.
+        pass
@@ -0,0 +1,45 @@
+"""
+Одновременные обращения к базе и кешу из async view.
+
+ORM в Django 3.2 синхронный. gather() запускает независимые функции
+каждую в своем потоке: пока одна ждет SQLite (модуль sqlite3
+отпускает GIL), выполняются остальные. Контекст (маршрутизация
+по репликам, учет запросов) переходит в потоки вместе с contextvars.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+from core.query_accounting import inherit_counters
+
+
+def _shared_connection_required():
+    # Базу в памяти (тесты) видит только свое соединение: другие
+    # потоки не увидят незафиксированных данных.
+    return any(
+        connection.is_in_memory_db() for connection in connections.all()
+        if connection.vendor == 'sqlite'
+    )
+
+
+def _in_worker(func):
+    def run():
+        inherit_counters()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather(*funcs):
+    """Результаты функций без аргументов в том же порядке."""
+
+    if _shared_connection_required():
+        return [await sync_to_async(func)() for func in funcs]
+    return await asyncio.gather(*(
+        sync_to_async(_in_worker(func), thread_sensitive=False)()
+        for func in funcs
+    ))
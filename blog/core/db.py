@@ -0,0 +1,64 @@
+"""
+Повтор записи при конкуренции за блокировку SQLite.
+
+Даже с WAL писатель в базе один: если очередь busy_timeout не успела
+дойти до запроса, SQLite отвечает «database is locked». Такой запрос
+безопасно повторить целиком, если его запись была в одной транзакции,
+которую SQLite уже откатил.
+"""
+
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_RETRIES = 4
+DEFAULT_LOCK_RETRY_DELAY = 0.05
+MAX_LOCK_RETRY_DELAY = 1.0
+
+
+def is_locked_error(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def retry_on_locked(func=None, *, using=DEFAULT_DB_ALIAS):
+    """
+    Повторяет функцию, если база занята, с экспоненциальной паузой
+    и случайным разбросом, чтобы повторы не столкнулись снова. Число
+    повторов - SQLITE_LOCK_RETRIES, первая пауза -
+    SQLITE_LOCK_RETRY_DELAY секунд. Внутри внешней транзакции повтор
+    невозможен: ошибка пробрасывается сразу.
+    """
+
+    if func is None:
+        return functools.partial(retry_on_locked, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(
+            settings, 'SQLITE_LOCK_RETRIES', DEFAULT_LOCK_RETRIES
+        )
+        delay = getattr(
+            settings, 'SQLITE_LOCK_RETRY_DELAY', DEFAULT_LOCK_RETRY_DELAY
+        )
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if (not is_locked_error(error) or attempt == retries
+                        or connections[using].in_atomic_block):
+                    raise
+                pause = random.uniform(
+                    0, min(MAX_LOCK_RETRY_DELAY, delay * 2 ** attempt)
+                )
+                logger.warning(
+                    '%s: база занята, повтор %d через %.3f с',
+                    func.__qualname__, attempt + 1, pause
+                )
+                time.sleep(pause)
+    return wrapper
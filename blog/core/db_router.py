@@ -0,0 +1,135 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в DATABASE_REPLICAS. Маршрутизация включается
+только внутри HTTP-запроса (ReplicaRoutingMiddleware): команды
+и фоновые задачи всегда работают с основной базой и читают то, что
+только что записали. Внутри запроса чтение уходит на основную базу,
+если запрос изменяющий, если он уже что-то записал, если идет
+транзакция или если у клиента есть cookie PIN_COOKIE. Cookie ставится
+после любой записи на REPLICA_PIN_SECONDS: реплика могла еще
+не получить изменения, а пользователь должен сразу увидеть свою
+запись.
+"""
+
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'use_primary_db'
+DEFAULT_PIN_SECONDS = 5
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# Сессия создается при входе и читается каждым следующим запросом:
+# с отстающей реплики пользователь выглядел бы вышедшим.
+PRIMARY_ONLY_APPS = ('sessions',)
+
+_state = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Состояние маршрутизации одного HTTP-запроса."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica_used = False
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_used():
+    """Читал ли текущий запрос с реплики (данные могли отставать)."""
+
+    state = _state.get()
+    return state is not None and state.replica_used
+
+
+@contextmanager
+def routing(pinned=False):
+    """Включает чтение с реплик внутри блока."""
+
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        aliases = replicas()
+        if (state is None or state.pinned or not aliases
+                or model._meta.app_label in PRIMARY_ONLY_APPS
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        state.replica_used = True
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с данными.
+        return db not in replicas()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Отмечает границы запроса для PrimaryReplicaRouter и после записи
+    закрепляет клиента за основной базой через cookie. В async-цепочке
+    состояние маршрутизации доходит до потоков sync_to_async через
+    contextvars, а запись в потоке видна здесь: объект состояния общий.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(
+            settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS
+        )
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with routing(self.pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        with routing(self.pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(state, response)
+
+    def pinned(self, request):
+        return (
+            request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        )
+
+    def pin(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=self.pin_seconds,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.db_router import PRIMARY, replicas
+
+LOCK_TIMEOUT = 30
+
+
+def copy_database(source, path):
+    """
+    Копирует базу через backup API SQLite: страницы пишутся в файл
+    реплики в одной транзакции, читатели реплики видят либо старую,
+    либо новую копию целиком.
+    """
+
+    target = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики из DATABASE_REPLICAS. '
+        'Заменяет репликацию при локальной проверке чтения с реплик: '
+        'запустите один раз до старта сервера и с --interval рядом с ним.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование раз в столько секунд.'
+        )
+
+    def sync(self):
+        primary = connections[PRIMARY]
+        primary.ensure_connection()
+        for alias in replicas():
+            start = time.perf_counter()
+            copy_database(
+                primary.connection, connections[alias].settings_dict['NAME']
+            )
+            self.stdout.write(
+                f'{alias}: {(time.perf_counter() - start) * 1000:.0f} ms'
+            )
+
+    def handle(self, *args, **options):
+        if connections[PRIMARY].vendor != 'sqlite':
+            raise CommandError('Поддерживается только SQLite.')
+        if not replicas():
+            raise CommandError(
+                'Реплики не настроены: задайте DB_REPLICAS.'
+            )
+        self.sync()
+        while options['interval'] > 0:
+            time.sleep(options['interval'])
+            self.sync()
@@ -0,0 +1,144 @@
+"""
+Учет SQL-запросов: сколько их выполнено и сколько времени они заняли.
+
+count_queries() считает запросы внутри блока кода на всех
+подключениях к базам, QueryAccountingMiddleware делает то же для
+каждого запроса к сайту: пишет итог в лог с именем view и отдает его
+в заголовке Server-Timing, который видно во вкладке Network браузера.
+Счетчики активных блоков лежат в contextvars, а каждое соединение
+при открытии получает обертку, которая берет их оттуда: так учитываются
+и запросы из потоков sync_to_async и gather, куда контекст
+переходит вместе с запросом.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARNING_THRESHOLD = 20
+
+_active_stats = ContextVar('active_query_stats', default=())
+
+
+class QueryStats:
+    """Число и суммарное время запросов одного блока count_queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+
+    def __repr__(self):
+        return f'<QueryStats: {self.count} queries, {self.duration:.4f}s>'
+
+
+def _count_active(execute, sql, params, many, context):
+    stats = _active_stats.get()
+    if not stats:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for counter in stats:
+            counter.add(duration)
+
+
+def _install(connection):
+    if _count_active not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_active)
+
+
+@receiver(connection_created)
+def install_counter(sender, connection, **kwargs):
+    """Соединение, открытое в любом потоке, сразу умеет считать."""
+
+    _install(connection)
+
+
+@contextmanager
+def count_queries():
+    """Считает запросы ко всем базам, выполненные внутри блока."""
+
+    stats = QueryStats()
+    inherit_counters()
+    token = _active_stats.set((*_active_stats.get(), stats))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+def inherit_counters():
+    """
+    Подключает счетчики внешних блоков count_queries к соединениям
+    текущего потока, даже еще не открытым: у каждого потока свои
+    соединения с базой, а сами счетчики приходят через contextvars.
+    """
+
+    for connection in connections.all():
+        _install(connection)
+
+
+class QueryAccountingMiddleware:
+    """
+    Считает запросы к базе на каждый HTTP-запрос. Если их больше
+    QUERY_COUNT_WARNING, пишет предупреждение: так N+1 заметен
+    еще до жалоб на медленные страницы. Работает и в async-цепочке
+    middleware: под ASGI запрос не переводится в поток ради нее.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(
+            settings, 'QUERY_COUNT_WARNING', DEFAULT_WARNING_THRESHOLD
+        )
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with count_queries() as stats:
+            response = self.get_response(request)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        with count_queries() as stats:
+            response = await self.get_response(request)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.1f};'
+            f'desc="{stats.count} queries"'
+        )
+        level = logging.WARNING if stats.count > self.threshold else (
+            logging.DEBUG
+        )
+        logger.log(
+            level, '%s: %d queries, %.1f ms',
+            view_name, stats.count, stats.duration * 1000
+        )
+        return response
@@ -0,0 +1,46 @@
+"""
+Бэкенд SQLite для боевой нагрузки.
+
+Стандартный бэкенд открывает базу в режиме журнала DELETE: писатель
+блокирует всех читателей, а отложенная транзакция, которая сначала
+читает, а потом пишет, получает «database is locked», не дожидаясь
+busy_timeout. Здесь при каждом подключении выполняются PRAGMA из
+OPTIONS['pragmas'] (WAL, synchronous, размеры кеша и mmap,
+busy_timeout), а при OPTIONS['transaction_mode'] = 'IMMEDIATE'
+транзакции atomic() сразу берут блокировку записи и ждут ее в очереди
+busy_timeout. Название опции совпадает с появившейся в Django 5.1.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def transaction_mode(self):
+        return self.settings_dict['OPTIONS'].get(
+            'transaction_mode', 'DEFERRED'
+        ).upper()
+
+    def get_connection_params(self):
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict['OPTIONS'].get('pragmas', {})
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,67 @@
+"""Запуск тестов и помощники для тестов с бюджетом SQL-запросов."""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.query_accounting import count_queries
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Кеш тестов живет во временном каталоге: файловый кеш из CACHES
+    общий для процессов, и тесты иначе писали бы в кеш проекта.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_directory = tempfile.mkdtemp()
+        self._cache_settings = override_settings(CACHES={
+            alias: {
+                **params,
+                'LOCATION': os.path.join(
+                    self._cache_directory, f'{alias}.sqlite3'
+                ),
+            }
+            for alias, params in settings.CACHES.items()
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Примесь к TestCase: бюджет запросов задается для имени URL,
+    и тест падает, если view выполнил больше запросов, чем разрешено.
+    В отличие от assertNumQueries проверяется верхняя граница,
+    поэтому оптимизации не ломают тест.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, label=''):
+        with count_queries() as stats:
+            yield stats
+        if stats.count > budget:
+            self.fail(
+                f'{label}: {stats.count} queries, budget is {budget} '
+                f'({stats.duration * 1000:.1f} ms)'
+            )
+
+    def assertBudgetsCoverUrls(self, budgets, urlpatterns, namespace):
+        """Каждому именованному URL приложения назначен бюджет."""
+
+        names = {
+            f'{namespace}:{pattern.name}'
+            for pattern in urlpatterns if pattern.name
+        }
+        missing = sorted(names - set(budgets))
+        self.assertFalse(missing, f'Нет бюджета запросов для {missing}')
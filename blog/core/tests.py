@@ -0,0 +1,441 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+
+from core import db_router
+
+from core.cache_backends import SQLiteCache
+from core.concurrency import gather
+from core.db import retry_on_locked
+from core.query_accounting import QueryAccountingMiddleware, count_queries
+from core.management.commands.sync_replicas import copy_database
+from core.sqlite_backend.base import DatabaseWrapper
+
+TEST_KEY = 'test_key'
+TEST_VALUE = {'text': 'Test value'}
+SHORT_TIMEOUT = 0.05
+MAX_ENTRIES = 10
+REPLICA = 'replica'
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 1234,
+    'cache_size': -2048,
+}
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        options.setdefault('MAX_ENTRIES', MAX_ENTRIES)
+        options.setdefault('STALE_TTL', 60)
+        options.setdefault('WAIT_TIMEOUT', 2)
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': options}
+        )
+
+    def test_values_shared_between_instances(self):
+        """Второй экземпляр (другой процесс) видит те же записи."""
+
+        self.cache.set(TEST_KEY, TEST_VALUE)
+        other = self.make_cache()
+        self.assertEqual(other.get(TEST_KEY), TEST_VALUE)
+        self.assertEqual(other.get_many([TEST_KEY, 'missing']),
+                         {TEST_KEY: TEST_VALUE})
+        other.delete(TEST_KEY)
+        self.assertIsNone(self.cache.get(TEST_KEY))
+
+    def test_add_and_incr(self):
+        """add не перезаписывает живую запись, incr атомарен."""
+
+        self.assertTrue(self.cache.add(TEST_KEY, 1))
+        self.assertFalse(self.cache.add(TEST_KEY, 5))
+        threads = [
+            threading.Thread(target=self.cache.incr, args=(TEST_KEY,))
+            for _ in range(MAX_ENTRIES)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get(TEST_KEY), MAX_ENTRIES + 1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_entry_recomputed_by_one_caller(self):
+        """
+        Истекшую запись пересчитывает первый обратившийся,
+        остальные получают устаревшую копию.
+        """
+
+        self.cache.set(TEST_KEY, TEST_VALUE, timeout=SHORT_TIMEOUT)
+        time.sleep(SHORT_TIMEOUT * 2)
+        self.assertIsNone(self.cache.get(TEST_KEY))
+        self.assertEqual(self.make_cache().get(TEST_KEY), TEST_VALUE)
+        self.cache.set(TEST_KEY, 'fresh')
+        self.assertEqual(self.make_cache().get(TEST_KEY), 'fresh')
+
+    def test_get_or_set_computes_once(self):
+        """Отсутствующее значение вычисляется одним из конкурентов."""
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(SHORT_TIMEOUT * 4)
+            return TEST_VALUE
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    self.cache.get_or_set(TEST_KEY, compute)
+                )
+            ) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [TEST_VALUE] * 4)
+
+    def test_misses_leave_no_locks(self):
+        """
+        Простой get не оставляет блокировок на отсутствующие ключи,
+        а брошенные блокировки удаляются при следующей записи.
+        """
+
+        for i in range(MAX_ENTRIES * 5):
+            self.cache.get(f'{TEST_KEY}_{i}')
+        self.assertEqual(self.lock_rows(), 0)
+        self.assertEqual(
+            self.make_cache().get_or_set(
+                f'{TEST_KEY}_0', TEST_VALUE, timeout=SHORT_TIMEOUT
+            ),
+            TEST_VALUE
+        )
+        time.sleep(SHORT_TIMEOUT * 2)
+        # Устаревшую копию пересчитывает взявший блокировку, но так
+        # и не записавший новое значение.
+        cache = self.make_cache(LOCK_TIMEOUT=SHORT_TIMEOUT)
+        self.assertIsNone(cache.get(f'{TEST_KEY}_0'))
+        self.assertEqual(self.lock_rows(), 1)
+        time.sleep(SHORT_TIMEOUT * 2)
+        cache.set(TEST_KEY, TEST_VALUE)
+        self.assertEqual(self.lock_rows(), 0)
+
+    def lock_rows(self):
+        return self.cache._db.execute(
+            'SELECT COUNT(*) FROM cache_lock'
+        ).fetchone()[0]
+
+    def test_least_recently_used_evicted(self):
+        """При переполнении вытесняются давно не читанные записи."""
+
+        self.cache.set(TEST_KEY, TEST_VALUE)
+        for i in range(MAX_ENTRIES * 2):
+            self.cache.set(f'{TEST_KEY}_{i}', i)
+            self.cache._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                (time.time() + 1000, self.cache.make_key(TEST_KEY))
+            )
+        entries = self.cache._db.execute(
+            'SELECT entries FROM cache_stats'
+        ).fetchone()[0]
+        self.assertLessEqual(entries, MAX_ENTRIES)
+        self.assertEqual(self.cache.get(TEST_KEY), TEST_VALUE)
+        self.assertIsNone(self.cache.get(f'{TEST_KEY}_0'))
+
+    def test_get_many_marks_hits_accessed(self):
+        """Попадание в get_many, как и в get, отмечает время чтения."""
+
+        self.cache.set(TEST_KEY, TEST_VALUE)
+        self.cache._db.execute('UPDATE cache SET accessed = 0')
+        self.assertEqual(
+            self.cache.get_many([TEST_KEY, f'{TEST_KEY}_missing']),
+            {TEST_KEY: TEST_VALUE}
+        )
+        accessed = self.cache._db.execute(
+            'SELECT accessed FROM cache WHERE key = ?',
+            (self.cache.make_key(TEST_KEY),)
+        ).fetchone()[0]
+        self.assertAlmostEqual(accessed, time.time(), delta=1)
+
+    def test_size_bound(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+
+        cache = self.make_cache(MAX_SIZE=4096, MAX_ENTRIES=1000)
+        for i in range(50):
+            cache.set(f'{TEST_KEY}_{i}', 'x' * 500)
+        size = cache._db.execute('SELECT size FROM cache_stats').fetchone()[0]
+        self.assertLessEqual(size, 4096)
+
+
+class QueryAccountingTest(TestCase):
+    def test_count_queries(self):
+        """count_queries считает запросы внутри блока."""
+
+        with count_queries() as stats:
+            User.objects.count()
+            User.objects.exists()
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.duration, 0)
+
+    def test_server_timing_header(self):
+        """Middleware отдает число запросов в Server-Timing."""
+
+        response = self.client.get('/')
+        self.assertRegex(
+            response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries"$'
+        )
+
+    def test_async_middleware_counts_thread_queries(self):
+        """
+        В async-цепочке middleware остается async и видит запросы,
+        выполненные view в потоке sync_to_async.
+        """
+
+        async def view(request):
+            await sync_to_async(User.objects.count)()
+            return HttpResponse()
+
+        middleware = QueryAccountingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': self.path,
+            'OPTIONS': {'transaction_mode': 'immediate', 'pragmas': PRAGMAS},
+        })
+
+    def tearDown(self):
+        self.wrapper.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_pragmas_applied_on_connect(self):
+        """PRAGMA из OPTIONS выполняются на каждом новом соединении."""
+
+        self.wrapper.ensure_connection()
+        db = self.wrapper.connection
+        self.assertEqual(
+            db.execute('PRAGMA journal_mode').fetchone()[0], 'wal'
+        )
+        self.assertEqual(db.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(
+            db.execute('PRAGMA busy_timeout').fetchone()[0], 1234
+        )
+        self.assertEqual(db.execute('PRAGMA cache_size').fetchone()[0], -2048)
+
+    def test_immediate_transaction_takes_write_lock(self):
+        """Транзакция сразу берет блокировку записи."""
+
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaisesMessage(
+                    sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.wrapper.connection.rollback()
+
+
+@override_settings(SQLITE_LOCK_RETRIES=2, SQLITE_LOCK_RETRY_DELAY=0)
+class RetryOnLockedTest(SimpleTestCase):
+    def flaky(self, failures, message='database is locked'):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return len(calls)
+        return write, calls
+
+    def test_retries_until_success(self):
+        """Занятая база - повод повторить запись."""
+
+        write, _ = self.flaky(failures=2)
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(write(), 3)
+
+    def test_gives_up_after_retries(self):
+        """Число повторов ограничено."""
+
+        write, calls = self.flaky(failures=5)
+        with self.assertLogs('core.db', 'WARNING'):
+            with self.assertRaises(OperationalError):
+                write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_not_retried(self):
+        """Прочие ошибки базы пробрасываются сразу."""
+
+        write, calls = self.flaky(failures=1, message='no such table')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class DatabaseRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def request(self, method='get', cookies=None, write=False):
+        """Запрос через middleware; view сообщает, откуда читал."""
+
+        routes = []
+
+        def view(request):
+            routes.append(self.router.db_for_read(User))
+            if write:
+                self.router.db_for_write(User)
+                routes.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/')
+        request.COOKIES.update(cookies or {})
+        response = db_router.ReplicaRoutingMiddleware(view)(request)
+        return routes, response
+
+    def test_outside_request_reads_primary(self):
+        """Команды и фоновые задачи читают основную базу."""
+
+        self.assertEqual(self.router.db_for_read(User), db_router.PRIMARY)
+
+    def test_get_reads_replica(self):
+        routes, response = self.request()
+        self.assertEqual(routes, [REPLICA])
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_write_pins_request_and_client(self):
+        """После записи чтение идет с основной базы, ставится cookie."""
+
+        routes, response = self.request(write=True)
+        self.assertEqual(routes, [REPLICA, db_router.PRIMARY])
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_async_write_pins_client(self):
+        """Запись из потока sync_to_async видна async middleware."""
+
+        routes = []
+
+        def write():
+            routes.append(self.router.db_for_read(User))
+            self.router.db_for_write(User)
+
+        async def view(request):
+            await sync_to_async(write)()
+            return HttpResponse()
+
+        middleware = db_router.ReplicaRoutingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.factory.get('/'))
+        self.assertEqual(routes, [REPLICA])
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_post_and_pinned_client_read_primary(self):
+        for kwargs in ({'method': 'post'},
+                       {'cookies': {db_router.PIN_COOKIE: '1'}}):
+            with self.subTest(**kwargs):
+                routes, _ = self.request(**kwargs)
+                self.assertEqual(routes, [db_router.PRIMARY])
+
+    def test_sessions_read_primary(self):
+        """Только что созданная сессия может еще не дойти до реплики."""
+
+        with db_router.routing():
+            self.assertEqual(
+                self.router.db_for_read(Session), db_router.PRIMARY
+            )
+
+    def test_replicas_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'posts'))
+        self.assertTrue(self.router.allow_migrate(db_router.PRIMARY, 'posts'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_cookie_without_replicas(self):
+        _, response = self.request(write=True)
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_copy_database(self):
+        """Реплика получает копию основной базы."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = sqlite3.connect(os.path.join(directory, 'primary.sqlite3'))
+        self.addCleanup(source.close)
+        source.execute('CREATE TABLE post (text TEXT)')
+        source.execute("INSERT INTO post VALUES ('Тестовый пост')")
+        source.commit()
+        path = os.path.join(directory, 'replica.sqlite3')
+        copy_database(source, path)
+        replica = sqlite3.connect(path)
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT text FROM post').fetchall(),
+            [('Тестовый пост',)]
+        )
+
+
+class GatherTest(TestCase):
+    def query(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return threading.get_ident()
+
+    def test_results_in_order(self):
+        self.assertEqual(
+            async_to_sync(gather)(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3]
+        )
+
+    def test_in_memory_database_uses_calling_thread(self):
+        """Базу в памяти в тестах видит только соединение теста."""
+
+        self.assertEqual(
+            async_to_sync(gather)(self.query), [threading.get_ident()]
+        )
+
+    @mock.patch(
+        'core.concurrency._shared_connection_required', return_value=False
+    )
+    def test_queries_in_worker_threads_counted(self, _):
+        """Запросы из рабочих потоков попадают в count_queries."""
+
+        with count_queries() as stats:
+            idents = async_to_sync(gather)(self.query, self.query)
+        self.assertNotIn(threading.get_ident(), idents)
+        self.assertEqual(stats.count, 2)
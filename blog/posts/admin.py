@@ -1,15 +1,65 @@
 from django.contrib import admin
-from posts.models import Post, Group, Comment, Follow
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from posts import export, search
+from posts.models import Post, Group, Comment, Follow, Likes
+
+
+def _export_response(modeladmin, request, queryset, file_format):
+    """
+    Выгрузка выбранных объектов потоком. Браузеру, который принимает
+    gzip, она передается сжатой.
+    """
+
+    chunks = export.export_chunks(queryset, file_format)
+    compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = StreamingHttpResponse(
+        export.gzip_chunks(chunks) if compress else chunks,
+        content_type=export.CONTENT_TYPES[file_format]
+    )
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = (
+        f'attachment; filename="{queryset.model._meta.model_name}.'
+        f'{file_format}"'
+    )
+    return response
+
+
+@admin.action(description='Выгрузить в CSV')
+def export_csv(modeladmin, request, queryset):
+    return _export_response(modeladmin, request, queryset, export.CSV)
+
+
+@admin.action(description='Выгрузить в JSONL')
+def export_jsonl(modeladmin, request, queryset):
+    return _export_response(modeladmin, request, queryset, export.JSONL)
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
+    actions = (export_csv, export_jsonl)
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту через индекс FTS5 вместо LIKE '%...%'."""
+
+        match = search.build_match_query(search_term)
+        if not match or not search.is_supported():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(
+            pk__in=RawSQL(search.matching_ids_sql(), [match])
+        ), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -20,6 +70,7 @@ class GroupAdmin(admin.ModelAdmin):
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
+    actions = (export_csv, export_jsonl)
     list_display = ('pk', 'post', 'text', 'author', 'created')
     search_fields = ('text',)
     list_editable = ('text',)
@@ -31,6 +82,15 @@ class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
     search_fields = ('user', 'author')
     list_filter = ('user', 'author')
+    actions = (export_csv, export_jsonl)
+
+
+@admin.register(Likes)
+class LikesAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'post')
+    list_select_related = ('user', 'post')
+    raw_id_fields = ('user', 'post')
+    actions = (export_csv, export_jsonl)
 
 
 # admin.site.register(Post, PostAdmin)
@@ -0,0 +1,281 @@
+"""
+JSON API только для чтения: записи, комментарии, группы и лента
+подписок.
+
+Строки выбираются через values() - без создания моделей, а параметр
+fields сужает список колонок (и JOIN: автор и группа присоединяются,
+только если их запросили). Списки отдаются StreamingHttpResponse
+пачками элементов и листаются курсором по (дата, pk), как HTML-ленты.
+Картинка, как и на страницах, отдается только заранее готовыми
+вариантами: оригинал в полном размере наружу не уходит.
+"""
+
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from posts.models import Comment, Group, Post, TimelineEntry
+from posts.thumbnails import get_ready_thumbnails
+from posts.utils import CURSOR_PARAM, POSTS_PER_PAGE, CursorPaginator
+
+FIELDS_PARAM = 'fields'
+LIMIT_PARAM = 'limit'
+MAX_PAGE_SIZE = 100
+STREAM_CHUNK_SIZE = 100
+CONTENT_TYPE = 'application/json'
+
+# Имя поля в ответе -> путь для values().
+POST_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated': 'updated',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'likes_count': 'likes_count',
+    'comments_count': 'comments_count',
+}
+TIMELINE_FIELDS = {
+    **{name: f'post__{path}' for name, path in POST_FIELDS.items()},
+    # Эти поля денормализованы в ленту и не требуют JOIN.
+    'id': 'post_id',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+}
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'post': 'post_id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+GROUP_FIELDS = {
+    'id': 'pk',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+}
+
+logger = logging.getLogger(__name__)
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _image_variants(name, row, path):
+    """
+    Готовые варианты картинки для srcset: адрес, размеры и тип. Они
+    создаются при загрузке, а пока не готовы, список пуст - запрос
+    API картинки не ресайзит.
+    """
+
+    if not name:
+        return None
+    try:
+        thumbnails = get_ready_thumbnails(name, row[f'{path}_width'])
+    except Exception:
+        logger.exception('Не удалось получить варианты %s', name)
+        return []
+    return [
+        {
+            'url': thumbnail.url,
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+            'type': f'image/{image_format.lower()}',
+        }
+        for image_format, thumbnail in thumbnails
+    ]
+
+
+CONVERTERS = {'image': _image_variants}
+# Колонки, которые конвертеру нужны рядом с самим полем.
+CONVERTER_PATHS = {'image': ('{path}_width',)}
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def selected_fields(request, fields):
+    """
+    Пары (имя, путь) из параметра fields в порядке запроса, по
+    умолчанию - все поля. Для неизвестного имени - ValueError.
+    """
+
+    requested = request.GET.get(FIELDS_PARAM)
+    if not requested:
+        return list(fields.items())
+    names = list(dict.fromkeys(
+        name.strip() for name in requested.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in fields]
+    if unknown or not names:
+        raise ValueError(
+            f'Неизвестные поля: {", ".join(unknown)}. '
+            f'Доступны: {", ".join(fields)}'
+        )
+    return [(name, fields[name]) for name in names]
+
+
+def page_size(request):
+    value = request.GET.get(LIMIT_PARAM)
+    if value is None:
+        return POSTS_PER_PAGE
+    if not value.isdigit() or not 0 < int(value) <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit - число от 1 до {MAX_PAGE_SIZE}')
+    return int(value)
+
+
+def value_paths(selected):
+    """Пути для values(): выбранные поля и колонки их конвертеров."""
+
+    paths = []
+    for name, path in selected:
+        paths.append(path)
+        paths += [
+            extra.format(path=path) for extra in CONVERTER_PATHS.get(name, ())
+        ]
+    return paths
+
+
+def _item(row, selected):
+    item = {}
+    for name, path in selected:
+        value = row[path]
+        converter = CONVERTERS.get(name)
+        item[name] = (
+            value if converter is None else converter(value, row, path)
+        )
+    return item
+
+
+def _results(rows, selected):
+    """Элементы массива results, склеенные пачками по STREAM_CHUNK_SIZE."""
+
+    chunk = []
+    for index, row in enumerate(rows):
+        chunk.append(
+            f'{"," if index else ""}{_encoder.encode(_item(row, selected))}'
+        )
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk)
+
+
+def _page_chunks(request, page, selected):
+    yield '{"results":['
+    yield from _results(page, selected)
+    links = {
+        'next': (
+            request.build_absolute_uri(page.next_url)
+            if page.has_next() else None
+        ),
+        'previous': (
+            request.build_absolute_uri(page.previous_url)
+            if page.has_previous() else None
+        ),
+    }
+    yield f'],{_encoder.encode(links)[1:]}'
+
+
+def stream_page(request, queryset, fields, key):
+    """
+    Страница queryset по курсору из запроса. Страница выбирается
+    сразу (один запрос с LIMIT), а JSON пишется в ответ по мере
+    сериализации элементов.
+    """
+
+    try:
+        selected = selected_fields(request, fields)
+        per_page = page_size(request)
+    except ValueError as error:
+        return _error(str(error))
+    paths = dict.fromkeys(['pk', key, *value_paths(selected)])
+    page = CursorPaginator(
+        queryset.values(*paths), per_page, key=key
+    ).get_page(request.GET.get(CURSOR_PARAM), query_params=request.GET)
+    return StreamingHttpResponse(
+        _page_chunks(request, page, selected), content_type=CONTENT_TYPE
+    )
+
+
+def _list_chunks(rows, selected):
+    yield '{"results":['
+    yield from _results(rows, selected)
+    yield ']}'
+
+
+@require_safe
+def posts(request):
+    """Записи от новых к старым, с фильтрами group=<slug>, author=<имя>."""
+
+    queryset = Post.objects.all()
+    if request.GET.get('group'):
+        queryset = queryset.filter(group__slug=request.GET['group'])
+    if request.GET.get('author'):
+        queryset = queryset.filter(author__username=request.GET['author'])
+    return stream_page(request, queryset, POST_FIELDS, 'pub_date')
+
+
+@require_safe
+def post(request, post_id):
+    """Одна запись."""
+
+    try:
+        selected = selected_fields(request, POST_FIELDS)
+    except ValueError as error:
+        return _error(str(error))
+    row = Post.objects.filter(pk=post_id).values(
+        *value_paths(selected)
+    ).first()
+    if row is None:
+        return _error('Запись не найдена', status=404)
+    return JsonResponse(
+        _item(row, selected), encoder=DjangoJSONEncoder,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@require_safe
+def comments(request, post_id):
+    """Комментарии записи от новых к старым."""
+
+    if not Post.objects.filter(pk=post_id).exists():
+        return _error('Запись не найдена', status=404)
+    return stream_page(
+        request, Comment.objects.filter(post_id=post_id), COMMENT_FIELDS,
+        'created'
+    )
+
+
+@require_safe
+def groups(request):
+    """
+    Все группы по названию. Их немного, поэтому без курсора: строки
+    читаются итератором и уходят клиенту пачками.
+    """
+
+    try:
+        selected = selected_fields(request, GROUP_FIELDS)
+    except ValueError as error:
+        return _error(str(error))
+    rows = Group.objects.order_by('title', 'pk').values(
+        *(path for _, path in selected)
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    return StreamingHttpResponse(
+        _list_chunks(rows, selected), content_type=CONTENT_TYPE
+    )
+
+
+@require_safe
+def follow(request):
+    """Лента подписок вошедшего пользователя."""
+
+    if not request.user.is_authenticated:
+        return _error('Требуется вход', status=401)
+    return stream_page(
+        request, TimelineEntry.objects.filter(user=request.user),
+        TIMELINE_FIELDS, 'pub_date'
+    )
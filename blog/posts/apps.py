@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        import posts.signals  # noqa: F401
+        from posts.search import install_after_migrate
+
+        post_migrate.connect(install_after_migrate, sender=self)
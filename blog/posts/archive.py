@@ -0,0 +1,54 @@
+"""Архив записей по месяцам."""
+
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from posts import caching
+from posts.models import MonthlyArchive
+
+ARCHIVE_MONTHS = 12
+ARCHIVE_CACHE_KEY = 'archive_months'
+ARCHIVE_CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def period_range(year, month=None):
+    """
+    Границы [начало, конец) года или месяца в текущем часовом поясе.
+    Для несуществующего месяца или года - ValueError.
+    """
+
+    if month is None:
+        start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    elif month == 12:
+        start, end = datetime(year, 12, 1), datetime(year + 1, 1, 1)
+    else:
+        start, end = datetime(year, month, 1), datetime(year, month + 1, 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def month_of(moment):
+    moment = timezone.localtime(moment)
+    return moment.year, moment.month
+
+
+def _load_months():
+    return list(
+        MonthlyArchive.objects.filter(posts_count__gt=0).order_by(
+            '-year', '-month'
+        )[:ARCHIVE_MONTHS]
+    )
+
+
+def get_archive_months():
+    """
+    Последние ARCHIVE_MONTHS месяцев, в которых есть записи, от новых
+    к старым. Один запрос к маленькой таблице на промах кеша.
+    """
+
+    return cache.get_or_set(
+        caching.versioned_key(ARCHIVE_CACHE_KEY, [caching.GLOBAL]),
+        _load_months,
+        ARCHIVE_CACHE_TIMEOUT
+    )
@@ -0,0 +1,156 @@
+"""
+Асинхронные версии страниц для чтения.
+
+Под ASGI запрос не держит поток, пока ждет базу и кеш, а независимые
+выборки страницы (запись, ее комментарии и лайк читателя; лента и
+рекомендуемые записи) идут одновременно через core.concurrency.gather.
+Шаблоны рендерятся в потоке: их теги обращаются к базе. Ключи кеша
+те же, что у posts.views, так что версии делят закешированные
+страницы. Подключаются вместо синхронных при ASYNC_VIEWS.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+
+from core.concurrency import gather
+from posts import caching
+from posts.authors import get_author
+from posts.featured import get_featured_posts
+from posts.forms import CommentForm
+from posts.likes import liked_post_ids
+from posts.models import Follow, Group, Post
+from posts.timeline import get_timeline
+from posts.utils import get_pages
+from posts.views import (PAGE_CACHE_TIMEOUT, _get_comments, group_scopes,
+                         index_scopes, post_scopes, profile_scopes)
+
+render_async = sync_to_async(render)
+
+
+@caching.conditional_page(index_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='index_page',
+    scopes=index_scopes
+)
+async def index(request):
+    """Главная страница."""
+
+    page_obj, featured_posts = await gather(
+        lambda: get_pages(
+            request, Post.objects.select_related('author', 'group').all()
+        ),
+        get_featured_posts,
+    )
+    return await render_async(
+        request,
+        'posts/index.html',
+        {'page_obj': page_obj, 'featured_posts': featured_posts}
+    )
+
+
+@caching.conditional_page(group_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='group_page',
+    scopes=group_scopes
+)
+async def group_posts(request, slug):
+    """Страница сообщества."""
+
+    group, page_obj = await gather(
+        lambda: get_object_or_404(Group, slug=slug),
+        lambda: get_pages(
+            request,
+            Post.objects.filter(group__slug=slug).select_related(
+                'author', 'group'
+            )
+        ),
+    )
+    return await render_async(
+        request,
+        'posts/group_list.html',
+        {'page_obj': page_obj, 'group': group}
+    )
+
+
+def _is_following(user, username):
+    """Как в posts.views.profile: свой профиль и гость «подписаны»."""
+
+    if not user.is_authenticated or user.username == username:
+        return True
+    return Follow.objects.filter(
+        user=user, author__username=username
+    ).exists()
+
+
+@caching.conditional_page(profile_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='profile_page',
+    scopes=profile_scopes
+)
+async def profile(request, username):
+    """Страница профиля."""
+
+    author, page_obj, following = await gather(
+        lambda: get_author(username),
+        lambda: get_pages(
+            request,
+            Post.objects.filter(author__username=username).select_related(
+                'group'
+            )
+        ),
+        lambda: _is_following(request.user, username),
+    )
+    if author is None:
+        raise Http404('Такого автора нет')
+    context = {'author': author, 'page_obj': page_obj}
+    if following:
+        context['following'] = True
+    return await render_async(request, 'posts/profile.html', context)
+
+
+@caching.conditional_page(post_scopes)
+async def post_detail(request, post_id):
+    """Страница записи."""
+
+    post, comments, liked_ids = await gather(
+        lambda: get_object_or_404(
+            Post.objects.select_related('author__stats', 'group'),
+            pk=post_id
+        ),
+        lambda: _get_comments(request, post_id),
+        lambda: liked_post_ids(request.user, [post_id]),
+    )
+    post.liked = post.pk in liked_ids
+    return await render_async(
+        request,
+        'posts/post_detail.html',
+        {
+            'post': post,
+            'comments': comments,
+            'form': CommentForm(request.POST or None),
+        }
+    )
+
+
+def _timeline_page(request):
+    if not request.user.is_authenticated:
+        return None
+    page_obj = get_pages(request, get_timeline(request.user))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    return page_obj
+
+
+async def follow_index(request):
+    """Страница подписок."""
+
+    page_obj = await sync_to_async(_timeline_page)(request)
+    if page_obj is None:
+        return redirect_to_login(request.get_full_path())
+    return await render_async(
+        request, 'posts/follow.html', {'page_obj': page_obj}
+    )
@@ -0,0 +1,38 @@
+"""Автор для страницы профиля."""
+
+from django.core.cache import cache
+
+from posts import caching
+from posts.models import User
+
+AUTHOR_CACHE_KEY = 'profile_author'
+AUTHOR_CACHE_TIMEOUT = 60 * 60 * 6
+# Только то, что нужно странице профиля: кеш общий для процессов
+# и лежит на диске, хеш пароля, почта и права туда не попадают.
+AUTHOR_FIELDS = (
+    'username', 'first_name', 'last_name', 'stats__posts_count',
+)
+
+
+def _load_author(username):
+    return User.objects.select_related('stats').only(
+        *AUTHOR_FIELDS
+    ).filter(username=username).first()
+
+
+def get_author(username):
+    """
+    Автор со счетчиком записей (author.stats) или None, с полями
+    AUTHOR_FIELDS. Один запрос на промах кеша; ключ версионирован
+    областью автора, поэтому новая или удаленная запись сразу
+    обновляет счетчик.
+    """
+
+    return cache.get_or_set(
+        caching.versioned_key(
+            f'{AUTHOR_CACHE_KEY}:{username}',
+            [caching.author_scope(username)]
+        ),
+        lambda: _load_author(username),
+        AUTHOR_CACHE_TIMEOUT
+    )
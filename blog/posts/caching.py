@@ -0,0 +1,353 @@
+"""
+Версионированные ключи кеша.
+
+Вместо коротких TTL у каждой области (вся лента, группа, автор,
+запись) есть счетчик версии. Версия входит в ключ закешированной
+страницы, а сигналы моделей поднимают версию при изменениях, так что
+страницы можно хранить часами и при этом сразу показывать новое.
+Те же версии дают ETag, а время последнего подъема - Last-Modified
+для условных GET (conditional_page).
+"""
+
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from core import db_router
+
+GLOBAL = 'global'
+VERSION_KEY_PREFIX = 'cache_version'
+MODIFIED_KEY_PREFIX = 'cache_modified'
+DEFAULT_REPLICA_PAGE_TIMEOUT = 30
+# Метка рендера страницы, пропущенной кешем (_render_once).
+RENDERING = 'rendering'
+RENDERED = 'rendered'
+RENDER_WAIT_TIMEOUT = 2
+RENDER_WAIT_INTERVAL = 0.05
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def _version_key(scope):
+    return f'{VERSION_KEY_PREFIX}:{scope}'
+
+
+def _modified_key(scope):
+    return f'{MODIFIED_KEY_PREFIX}:{scope}'
+
+
+def _initial_version():
+    # Версия, вытесненная из кеша, не должна начаться заново с
+    # числа, под которым уже лежат старые страницы.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    """Текущие версии областей одним походом в кеш."""
+
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for scope, key in zip(scopes, keys):
+        if key not in versions:
+            # Новая область считается только что измененной.
+            if cache.add(key, _initial_version(), None):
+                cache.set(_modified_key(scope), time.time(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_last_modified(scopes):
+    """
+    Время последнего изменения областей или None, если оно неизвестно
+    (запись вытеснена из кеша).
+    """
+
+    keys = [_modified_key(scope) for scope in scopes]
+    modified = cache.get_many(keys)
+    if len(modified) < len(keys):
+        return None
+    return max(modified.values())
+
+
+def bump(*scopes):
+    """Поднимает версии областей, делая их кеш недействительным."""
+
+    scopes = set(scopes)
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+    now = time.time()
+    cache.set_many({_modified_key(scope): now for scope in scopes}, None)
+
+
+def versioned_key(prefix, scopes):
+    """Ключ, который меняется вместе с версиями областей."""
+
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    return f'{prefix}.{versions}'
+
+
+def _limit_replica_page(response):
+    """
+    Страница с реплики могла быть собрана до того, как туда дошло
+    изменение, поднявшее версию: такую храним не дольше
+    REPLICA_PAGE_CACHE_TIMEOUT секунд.
+    """
+
+    if db_router.replica_used():
+        patch_cache_control(response, max_age=getattr(
+            settings, 'REPLICA_PAGE_CACHE_TIMEOUT',
+            DEFAULT_REPLICA_PAGE_TIMEOUT
+        ))
+    return response
+
+
+def _page_scopes(request, page_scopes):
+    if request.user.is_authenticated:
+        return [*page_scopes, user_scope(request.user.pk)]
+    return page_scopes
+
+
+def _visitor(request):
+    # Ключ из одних версий не различает пользователей: их области
+    # могли получить одинаковые номера версий.
+    if request.user.is_authenticated:
+        return f'user{request.user.pk}'
+    return 'anonymous'
+
+
+def _page_key_prefix(request, key_prefix, page_scopes):
+    return versioned_key(
+        f'{key_prefix}.{_visitor(request)}',
+        _page_scopes(request, page_scopes)
+    )
+
+
+def _page_middleware(request, view_func, timeout, key_prefix, page_scopes):
+    return CacheMiddleware(
+        view_func, page_timeout=timeout,
+        key_prefix=_page_key_prefix(request, key_prefix, page_scopes)
+    )
+
+
+def _render_key(middleware, request):
+    # Новая версия области дает новый ключ страницы, которого еще нет
+    # ни у кого: ключ рендера тоже версионирован и один на адрес.
+    path = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'{middleware.key_prefix}.rendered.{request.method}.{path}'
+
+
+def _render_once(middleware, request, render):
+    """
+    Рендерит страницу, пропущенную кешем, через get_or_set: при
+    блокирующем бэкенде (SQLiteCache) после подъема версии страницу
+    собирает один процесс, остальные ждут его и берут ее из кеша.
+    Если страница в кеш не попала (ответ не кешируется или истекло
+    ожидание), ее рендерят сами.
+    """
+
+    rendered = []
+
+    def render_page():
+        rendered.append(render())
+        return RENDERED
+
+    cache.get_or_set(
+        _render_key(middleware, request), render_page,
+        middleware.cache_timeout
+    )
+    if rendered:
+        return rendered[0]
+    response = middleware.process_request(request)
+    return response if response is not None else render()
+
+
+async def _render_once_async(middleware, request, render):
+    """
+    То же для async view. Ждать в get_or_set значит занять поток, а
+    рендер ведущего идет через те же потоки: ведущий берется через
+    cache.add, остальные ждут его в цикле событий.
+    """
+
+    key = _render_key(middleware, request)
+    if await sync_to_async(cache.add)(key, RENDERING, RENDER_WAIT_TIMEOUT):
+        try:
+            return await render()
+        finally:
+            await sync_to_async(cache.set)(
+                key, RENDERED, middleware.cache_timeout
+            )
+    deadline = time.monotonic() + RENDER_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(RENDER_WAIT_INTERVAL)
+        if await sync_to_async(cache.get)(key) != RENDERING:
+            break
+    response = await sync_to_async(middleware.process_request)(request)
+    return response if response is not None else await render()
+
+
+def cache_page_versioned(timeout, key_prefix, scopes):
+    """
+    Аналог cache_page, у которого key_prefix дополняется версиями
+    областей. scopes получает аргументы view и возвращает список
+    областей, от которых зависит страница. Для вошедшего пользователя
+    к ним добавляется его собственная область, а в ключ - его id: на
+    страницах есть его имя, лайки и кнопки подписки. Промах
+    рендерится в одном процессе (_render_once). Подходит и для async
+    view: кеш опрашивается в потоке.
+    """
+
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            return _cache_async_page(view_func, timeout, key_prefix, scopes)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            middleware = _page_middleware(
+                request, view_func, timeout, key_prefix,
+                scopes(*args, **kwargs)
+            )
+            response = middleware.process_request(request)
+            if response is not None:
+                return response
+
+            def render():
+                response = view_func(request, *args, **kwargs)
+                return middleware.process_response(
+                    request, _limit_replica_page(response)
+                )
+            return _render_once(middleware, request, render)
+        return wrapper
+    return decorator
+
+
+def _cache_async_page(view_func, timeout, key_prefix, scopes):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        def lookup():
+            middleware = _page_middleware(
+                request, view_func, timeout, key_prefix,
+                scopes(*args, **kwargs)
+            )
+            return middleware, middleware.process_request(request)
+
+        middleware, response = await sync_to_async(lookup)()
+        if response is not None:
+            return response
+
+        async def render():
+            response = await view_func(request, *args, **kwargs)
+            return await sync_to_async(middleware.process_response)(
+                request, _limit_replica_page(response)
+            )
+        return await _render_once_async(middleware, request, render)
+    return wrapper
+
+
+def page_validators(request, page_scopes):
+    """
+    ETag и Last-Modified страницы без запросов к базе и рендеринга.
+    ETag зависит от версий областей, посетителя, адреса с параметрами
+    и cookie CSRF (в формах страницы его токен). Last-Modified
+    с точностью до секунды: если изменение было в текущую секунду,
+    заголовок не отдается, иначе второе изменение в ту же секунду
+    осталось бы незамеченным.
+    """
+
+    page_scopes = _page_scopes(request, page_scopes)
+    digest = hashlib.md5('|'.join([
+        request.get_full_path(),
+        _visitor(request),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *(str(version) for version in get_versions(page_scopes)),
+    ]).encode()).hexdigest()
+    last_modified = get_last_modified(page_scopes)
+    if last_modified is not None and time.time() - last_modified < 1:
+        last_modified = None
+    return f'"{digest}"', last_modified and int(last_modified)
+
+
+def _check_conditional(request, scopes, args, kwargs):
+    """Валидаторы страницы и готовый ответ 304/412, если он уместен."""
+
+    if request.method not in ('GET', 'HEAD'):
+        return None, None, None
+    etag, last_modified = page_validators(request, scopes(*args, **kwargs))
+    return etag, last_modified, get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def _add_validators(response, etag, last_modified):
+    if response.status_code != 200:
+        return response
+    patch_cache_control(response, no_cache=True, max_age=0)
+    # Свой Last-Modified view (например, у лент) не учитывает версии.
+    if response.has_header('Last-Modified'):
+        del response['Last-Modified']
+    if etag and not db_router.replica_used():
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_page(scopes):
+    """
+    Условный GET: на If-None-Match / If-Modified-Since отвечает 304,
+    не вызывая view. scopes - как у cache_page_versioned. Ответ
+    помечается no-cache: браузер хранит страницу, но каждый раз
+    сверяет ее с сервером. Страницам, прочитанным с реплики, валидаторы
+    не выдаются: данные могли отставать от версий.
+    """
+
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                etag, last_modified, response = await sync_to_async(
+                    _check_conditional
+                )(request, scopes, args, kwargs)
+                if response is not None:
+                    return response
+                response = await view_func(request, *args, **kwargs)
+                return _add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            etag, last_modified, response = _check_conditional(
+                request, scopes, args, kwargs
+            )
+            if response is not None:
+                return response
+            return _add_validators(
+                view_func(request, *args, **kwargs), etag, last_modified
+            )
+        return wrapper
+    return decorator
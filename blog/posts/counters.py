@@ -0,0 +1,173 @@
+"""
+Денормализованные счетчики записей, лайков, комментариев и архива
+по месяцам.
+"""
+
+from django.db.models import Count, F
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from posts.archive import month_of, period_range
+from posts.models import (AuthorStats, Comment, Likes, MonthlyArchive, Post,
+                          User)
+
+LIKES = 'likes_count'
+COMMENTS = 'comments_count'
+
+
+def _shift(queryset, field, delta):
+    if delta < 0:
+        # Счетчик мог разъехаться с таблицей: не уходим ниже нуля.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_post_counter(post_id, field, delta):
+    """Атомарно сдвигает счетчик лайков или комментариев записи."""
+
+    _shift(Post.objects.filter(pk=post_id), field, delta)
+
+
+def change_posts_count(author_id, delta):
+    """Атомарно сдвигает счетчик записей автора."""
+
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    # Без строки уменьшать нечего; к тому же при удалении автора его
+    # записи уходят каскадом, и новая строка сослалась бы на удаленного.
+    if _shift(stats, 'posts_count', delta) or delta < 0 or stats.exists():
+        return
+    # Первая запись автора: строку заводим сразу с точным значением.
+    AuthorStats.objects.get_or_create(
+        author_id=author_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=author_id).count()
+        }
+    )
+
+
+def change_month_count(pub_date, delta):
+    """Атомарно сдвигает счетчик записей месяца, в который попал pub_date."""
+
+    year, month = month_of(pub_date)
+    months = MonthlyArchive.objects.filter(year=year, month=month)
+    if _shift(months, 'posts_count', delta) or months.exists():
+        return
+    # Первая запись месяца: строку заводим сразу с точным значением.
+    start, end = period_range(year, month)
+    MonthlyArchive.objects.get_or_create(
+        year=year,
+        month=month,
+        defaults={
+            'posts_count': Post.objects.filter(
+                pub_date__gte=start, pub_date__lt=end
+            ).count()
+        }
+    )
+
+
+def _counts(model, field, ids):
+    # order_by() убирает Meta.ordering: иначе поле сортировки попадает
+    # в GROUP BY и каждая дата считается отдельно.
+    return dict(
+        model.objects.filter(**{f'{field}__in': ids}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def repair_post_counters(batch_size, dry_run=False):
+    """
+    Сверяет счетчики записей с таблицами лайков и комментариев
+    пачками по batch_size и исправляет разъехавшиеся.
+    Возвращает количество исправленных записей.
+    """
+
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk').only(
+                'pk', LIKES, COMMENTS
+            )[:batch_size]
+        )
+        if not batch:
+            return fixed
+        last_pk = batch[-1].pk
+        ids = [post.pk for post in batch]
+        likes = _counts(Likes, 'post_id', ids)
+        comments = _counts(Comment, 'post_id', ids)
+        drifted = []
+        for post in batch:
+            real = (likes.get(post.pk, 0), comments.get(post.pk, 0))
+            if (post.likes_count, post.comments_count) != real:
+                post.likes_count, post.comments_count = real
+                drifted.append(post)
+        if drifted and not dry_run:
+            Post.objects.bulk_update(drifted, [LIKES, COMMENTS])
+        fixed += len(drifted)
+
+
+def repair_author_counters(batch_size, dry_run=False):
+    """То же для счетчиков записей авторов."""
+
+    fixed = 0
+    last_pk = 0
+    while True:
+        ids = list(
+            User.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return fixed
+        last_pk = ids[-1]
+        real = _counts(Post, 'author_id', ids)
+        stored = {
+            stats.author_id: stats
+            for stats in AuthorStats.objects.filter(author_id__in=ids)
+        }
+        drifted = []
+        missing = []
+        for author_id in ids:
+            count = real.get(author_id, 0)
+            stats = stored.get(author_id)
+            if stats is None:
+                if count:
+                    missing.append(
+                        AuthorStats(author_id=author_id, posts_count=count)
+                    )
+            elif stats.posts_count != count:
+                stats.posts_count = count
+                drifted.append(stats)
+        if not dry_run:
+            AuthorStats.objects.bulk_update(drifted, ['posts_count'])
+            AuthorStats.objects.bulk_create(missing, ignore_conflicts=True)
+        fixed += len(drifted) + len(missing)
+
+
+def repair_archive_counters(dry_run=False):
+    """
+    Пересчитывает архив по месяцам одним GROUP BY по всей таблице
+    записей: месяцев мало, пачки не нужны. Возвращает количество
+    исправленных месяцев.
+    """
+
+    real = {
+        (row['year'], row['month']): row['total']
+        for row in Post.objects.order_by().annotate(
+            year=ExtractYear('pub_date'), month=ExtractMonth('pub_date')
+        ).values('year', 'month').annotate(total=Count('pk'))
+    }
+    drifted = []
+    for stored in MonthlyArchive.objects.all():
+        count = real.pop((stored.year, stored.month), 0)
+        if stored.posts_count != count:
+            stored.posts_count = count
+            drifted.append(stored)
+    missing = [
+        MonthlyArchive(year=year, month=month, posts_count=count)
+        for (year, month), count in real.items()
+    ]
+    if not dry_run:
+        MonthlyArchive.objects.bulk_update(drifted, ['posts_count'])
+        MonthlyArchive.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(drifted) + len(missing)
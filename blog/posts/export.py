@@ -0,0 +1,92 @@
+"""
+Потоковая выгрузка записей, комментариев, лайков и подписок
+в CSV и JSONL.
+
+Строки читаются values_list(...).iterator(chunk_size=...) по
+первичному ключу и сразу превращаются в текст, поэтому память не
+зависит от размера таблицы. Выгружаются только собственные колонки
+таблицы (внешние ключи - как id): без JOIN это один проход по индексу.
+"""
+
+import csv
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.models import Comment, Follow, Likes, Post
+
+DEFAULT_CHUNK_SIZE = 2000
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+COLUMNS = {
+    Post: (
+        'id', 'author_id', 'group_id', 'text', 'pub_date', 'updated',
+        'image', 'likes_count', 'comments_count',
+    ),
+    Comment: ('id', 'post_id', 'author_id', 'text', 'created'),
+    Likes: ('id', 'post_id', 'user_id'),
+    Follow: ('id', 'user_id', 'author_id'),
+}
+DATASETS = {
+    'posts': Post,
+    'comments': Comment,
+    'likes': Likes,
+    'follows': Follow,
+}
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(columns, rows):
+    for row in rows:
+        yield f'{_encoder.encode(dict(zip(columns, row)))}\n'
+
+
+def export_chunks(queryset, file_format=CSV, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Текст выгрузки queryset кусками по chunk_size строк таблицы.
+    Модель queryset должна быть в COLUMNS.
+    """
+
+    columns = COLUMNS[queryset.model]
+    rows = queryset.order_by('pk').values_list(*columns).iterator(
+        chunk_size=chunk_size
+    )
+    lines = (_csv_lines if file_format == CSV else _jsonl_lines)(
+        columns, rows
+    )
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def gzip_chunks(chunks):
+    """Сжимает поток текстовых кусков в gzip, не собирая его целиком."""
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,33 @@
+"""Рекомендуемые записи для шапки главной страницы."""
+
+from django.core.cache import cache
+
+from posts import caching
+from posts.models import Post
+
+FEATURED_POSTS_COUNT = 3
+FEATURED_CACHE_KEY = 'featured_posts'
+FEATURED_CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def _load_featured_posts():
+    return list(
+        Post.objects.select_related('author', 'group').order_by(
+            '-pub_date', '-pk'
+        )[:FEATURED_POSTS_COUNT]
+    )
+
+
+def get_featured_posts():
+    """
+    Последние FEATURED_POSTS_COUNT записей с авторами и группами.
+    Один запрос на промах кеша; записей может быть меньше или ни одной.
+    Ключ версионирован общей областью, так что новая запись сразу
+    попадает в шапку.
+    """
+
+    return cache.get_or_set(
+        caching.versioned_key(FEATURED_CACHE_KEY, [caching.GLOBAL]),
+        _load_featured_posts,
+        FEATURED_CACHE_TIMEOUT
+    )
@@ -0,0 +1,132 @@
+"""
+RSS и Atom ленты сообществ и авторов.
+
+Читалки опрашивают ленты часто, поэтому лента собирается одним
+запросом по составному индексу (group|author, -pub_date) с .only()
+и кешируется под версиями тех же областей, что и страницы группы
+и профиля. Повторный опрос с If-None-Match получает 304 без единого
+запроса к базе.
+"""
+
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from posts import caching
+from posts.models import Group, Post, User
+from posts.views import group_scopes, profile_scopes
+
+FEED_ITEMS = 20
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+TITLE_WORDS = 8
+ITEM_FIELDS = ('text', 'pub_date', 'updated', 'author_id', 'group_id')
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _author_name(user):
+    return user.get_full_name() or user.username
+
+
+class PostFeed(Feed):
+    """Общие поля записей в ленте."""
+
+    def item_title(self, item):
+        return Truncator(item.text).words(TITLE_WORDS)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=[item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_updateddate(self, item):
+        return item.updated
+
+
+class GroupFeed(PostFeed):
+    """Новые записи сообщества."""
+
+    def get_object(self, request, slug):
+        return get_object_or_404(
+            Group.objects.only('title', 'slug', 'description'), slug=slug
+        )
+
+    def title(self, obj):
+        return f'Записи сообщества {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', args=[obj.slug])
+
+    def items(self, obj):
+        return Post.objects.filter(group=obj).select_related(
+            'author'
+        ).only(
+            *ITEM_FIELDS, *(f'author__{field}' for field in AUTHOR_FIELDS)
+        ).order_by('-pub_date')[:FEED_ITEMS]
+
+    def item_author_name(self, item):
+        return _author_name(item.author)
+
+    def item_author_link(self, item):
+        return reverse('posts:profile', args=[item.author.username])
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+    subtitle = GroupFeed.description
+
+
+class AuthorFeed(PostFeed):
+    """Новые записи автора."""
+
+    def get_object(self, request, username):
+        return get_object_or_404(
+            User.objects.only(*AUTHOR_FIELDS), username=username
+        )
+
+    def title(self, obj):
+        return f'Записи пользователя {_author_name(obj)}'
+
+    def description(self, obj):
+        return self.title(obj)
+
+    def link(self, obj):
+        return reverse('posts:profile', args=[obj.username])
+
+    def author_name(self, obj):
+        return _author_name(obj)
+
+    def author_link(self, obj):
+        return self.link(obj)
+
+    def items(self, obj):
+        return Post.objects.filter(author=obj).only(
+            *ITEM_FIELDS
+        ).order_by('-pub_date')[:FEED_ITEMS]
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+    subtitle = AuthorFeed.description
+
+
+def _cached_feed(feed, key_prefix, scopes):
+    return caching.conditional_page(scopes)(
+        caching.cache_page_versioned(
+            FEED_CACHE_TIMEOUT, key_prefix=key_prefix, scopes=scopes
+        )(feed)
+    )
+
+
+group_rss = _cached_feed(GroupFeed(), 'group_rss', group_scopes)
+group_atom = _cached_feed(GroupAtomFeed(), 'group_atom', group_scopes)
+profile_rss = _cached_feed(AuthorFeed(), 'profile_rss', profile_scopes)
+profile_atom = _cached_feed(AuthorAtomFeed(), 'profile_atom', profile_scopes)
@@ -0,0 +1,26 @@
+"""Лайки текущего пользователя для записей на странице."""
+
+from posts.models import Likes
+
+
+def liked_post_ids(user, post_ids):
+    """Какие из записей post_ids лайкнул user - один запрос."""
+
+    if not user.is_authenticated or not post_ids:
+        return set()
+    return set(Likes.objects.filter(
+        user=user, post_id__in=post_ids
+    ).values_list('post_id', flat=True))
+
+
+def mark_liked(posts, user):
+    """
+    Одним запросом отмечает записи, которые лайкнул user, атрибутом
+    post.liked. Число лайков уже лежит в post.likes_count.
+    """
+
+    posts = list(posts)
+    liked_ids = liked_post_ids(user, [post.pk for post in posts])
+    for post in posts:
+        post.liked = post.pk in liked_ids
+    return posts
@@ -0,0 +1,21 @@
+"""Помощники команд, загружающих данные через bulk_create."""
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """
+    bulk_create перетирает поля с auto_now и auto_now_add текущим
+    временем. Внутри блока эти поля сохраняют переданные значения:
+    заполнить их должен сам вызывающий.
+    """
+
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
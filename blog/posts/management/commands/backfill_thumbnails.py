@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails, has_thumbnails
+
+DEFAULT_CHUNK_SIZE = 16
+
+
+def _init_worker():
+    django.setup()
+    # Соединения родителя процессу не годятся, откроем свои.
+    for connection in connections.all():
+        connection.close()
+
+
+def _generate(name, image_width):
+    try:
+        generate_thumbnails(name, image_width)
+    except Exception as error:
+        return name, str(error)
+    return name, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает недостающие миниатюры картинок записей '
+        'параллельно на всех ядрах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Сколько процессов запускать.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Сколько картинок отдавать процессу за раз.'
+        )
+
+    def handle(self, *args, **options):
+        images = (
+            Post.objects.exclude(image='')
+            .values_list('image', 'image_width').distinct().iterator()
+        )
+        missing = [
+            (name, image_width) for name, image_width in images
+            if not has_thumbnails(name, image_width)
+        ]
+        if not missing:
+            self.stdout.write(self.style.SUCCESS('Все миниатюры на месте'))
+            return
+        workers = max(1, min(options['workers'], len(missing)))
+        if workers == 1:
+            results = [_generate(*image) for image in missing]
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(
+                    workers, initializer=_init_worker) as pool:
+                results = list(pool.map(
+                    _generate, *zip(*missing),
+                    chunksize=options['chunk_size']
+                ))
+        failed = [(name, error) for name, error in results if error]
+        for name, error in failed:
+            self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(missing) - len(failed)}, '
+            f'с ошибками: {len(failed)}'
+        ))
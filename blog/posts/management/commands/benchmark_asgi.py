@@ -0,0 +1,186 @@
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from posts.management.commands.benchmark_views import (CLIENT_ADDRESS,
+                                                       git_revision,
+                                                       percentile)
+from posts.management.targets import heavy_targets
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS = 400
+SERVERS = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность WSGI (синхронные view '
+        'в потоках) и ASGI (асинхронные view в цикле событий) при '
+        'одновременных запросах к основным страницам. Каждый сервер '
+        'замеряется в отдельном процессе: ASYNC_VIEWS читается при '
+        'импорте URL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+            help='Сколько запросов выполняется одновременно.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=DEFAULT_REQUESTS,
+            help='Сколько запросов отправить всего.'
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Разрешить кеш страниц (по умолчанию каждый URL '
+                 'уникален и view выполняется целиком).'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--server', choices=SERVERS,
+            help='Замерить один сервер в этом процессе и вывести JSON.'
+        )
+
+    def requests(self, total, warm):
+        """Очередь (url, пользователь) по кругу из основных страниц."""
+
+        targets = itertools.cycle(heavy_targets().values())
+        for number in range(total):
+            url, user = next(targets)
+            if not warm:
+                url += f'{"&" if "?" in url else "?"}nocache={number}'
+            yield url, user
+
+    def make_client(self, client_class, user):
+        client = client_class(REMOTE_ADDR=CLIENT_ADDRESS)
+        if user is not None:
+            client.force_login(user)
+        return client
+
+    def run_wsgi(self, requests, concurrency):
+        local = threading.local()
+
+        def fetch(request):
+            url, user = request
+            # Как у потокового WSGI-сервера: у каждого потока свой клиент.
+            clients = local.__dict__.setdefault('clients', {})
+            if user not in clients:
+                clients[user] = self.make_client(Client, user)
+            client = clients[user]
+            start = time.perf_counter()
+            response = client.get(url)
+            return response.status_code, time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(fetch, requests))
+
+    def run_asgi(self, requests, concurrency):
+        clients = {
+            user: self.make_client(AsyncClient, user)
+            for user in {user for _, user in requests}
+        }
+
+        async def worker(queue, results):
+            while not queue.empty():
+                url, user = queue.get_nowait()
+                start = time.perf_counter()
+                response = await clients[user].get(url)
+                results.append(
+                    (response.status_code, time.perf_counter() - start)
+                )
+
+        async def main():
+            queue = asyncio.Queue()
+            for request in requests:
+                queue.put_nowait(request)
+            results = []
+            await asyncio.gather(*(
+                worker(queue, results) for _ in range(concurrency)
+            ))
+            return results
+
+        return asyncio.run(main())
+
+    def measure(self, server, options):
+        if (server == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError(
+                f'Для {server} запустите с ASYNC_VIEWS='
+                f'{str(server == "asgi").lower()}'
+            )
+        requests = list(self.requests(options['requests'], options['warm']))
+        run = self.run_asgi if server == 'asgi' else self.run_wsgi
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            start = time.perf_counter()
+            results = run(requests, options['concurrency'])
+            elapsed = time.perf_counter() - start
+        failed = [status for status, _ in results if status != 200]
+        if failed:
+            raise CommandError(f'{server}: ответы с ошибкой: {failed[:5]}')
+        timings = [duration * 1000 for _, duration in results]
+        return {
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+
+    def run_child(self, server, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+            'benchmark_asgi', '--server', server,
+            '--concurrency', str(options['concurrency']),
+            '--requests', str(options['requests']),
+        ]
+        if options['warm']:
+            command.append('--warm')
+        env = {
+            **os.environ, 'ASYNC_VIEWS': str(server == 'asgi').lower()
+        }
+        completed = subprocess.run(
+            command, env=env, capture_output=True, text=True
+        )
+        if completed.returncode:
+            raise CommandError(f'{server}: {completed.stderr.strip()}')
+        return json.loads(completed.stdout.splitlines()[-1])
+
+    def handle(self, *args, **options):
+        options['concurrency'] = max(1, options['concurrency'])
+        if options['server']:
+            self.stdout.write(
+                json.dumps(self.measure(options['server'], options))
+            )
+            return
+        results = {}
+        for server in SERVERS:
+            results[server] = self.run_child(server, options)
+            self.stdout.write(
+                f'{server}: {results[server]["requests_per_second"]} '
+                f'запросов/с, p50 {results[server]["p50_ms"]} ms, '
+                f'p95 {results[server]["p95_ms"]} ms'
+            )
+        before = results['wsgi']['requests_per_second']
+        if before:
+            self.stdout.write(
+                f'asgi/wsgi: '
+                f'x{results["asgi"]["requests_per_second"] / before:.2f}'
+            )
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'warm_cache': options['warm'],
+                'results': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
@@ -0,0 +1,138 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from core.query_accounting import count_queries
+from posts.management.targets import heavy_targets
+from posts.models import Follow, Post, User
+
+DEFAULT_ITERATIONS = 50
+DEFAULT_WARMUP = 3
+# Адрес не из INTERNAL_IPS: иначе при DEBUG в ответы встраивается
+# debug toolbar и замер показывает в основном его накладные расходы.
+CLIENT_ADDRESS = '192.0.2.1'
+
+
+def percentile(samples, percent):
+    """Процентиль по линейной интерполяции, как numpy.percentile."""
+
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[
+        percent - 1
+    ]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа основных страниц (p50/p95) на текущих '
+        'данных и сохраняет результат в JSON для сравнения коммитов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=DEFAULT_ITERATIONS
+        )
+        parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения.'
+        )
+
+    def measure(self, client, url, iterations, warmup, cold):
+        timings = []
+        queries = 0
+        for step in range(warmup + iterations):
+            if cold:
+                cache.clear()
+            with count_queries() as stats:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f'{url}: код ответа {response.status_code}')
+            if step >= warmup:
+                timings.append(elapsed * 1000)
+                queries = max(queries, stats.count)
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': queries,
+        }
+
+    def handle(self, *args, **options):
+        iterations = max(1, options['iterations'])
+        results = {}
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, (url, user) in heavy_targets().items():
+                client = Client(REMOTE_ADDR=CLIENT_ADDRESS)
+                if user is not None:
+                    client.force_login(user)
+                results[name] = self.measure(
+                    client, url, iterations, options['warmup'],
+                    options['cold']
+                )
+                self.stdout.write(
+                    f'{name}: p50 {results[name]["p50_ms"]} ms, '
+                    f'p95 {results[name]["p95_ms"]} ms, '
+                    f'запросов {results[name]["queries"]}'
+                )
+        report = {
+            'revision': git_revision(),
+            'created': timezone.now().isoformat(),
+            'iterations': iterations,
+            'cold_cache': options['cold'],
+            'database': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['results']
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                percent = 0
+                if before[metric]:
+                    change = result[metric] - before[metric]
+                    percent = change / before[metric] * 100
+                self.stdout.write(
+                    f'{name} {metric}: {before[metric]} -> {result[metric]} '
+                    f'({percent:+.1f}%)'
+                )
@@ -0,0 +1,227 @@
+import json
+import multiprocessing
+import random
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import (OperationalError, close_old_connections, connection,
+                       connections)
+from django.test import Client
+from django.urls import reverse
+
+from core.db import is_locked_error
+from posts.management.commands.benchmark_views import (CLIENT_ADDRESS,
+                                                       git_revision,
+                                                       percentile)
+from posts.models import Post, User
+
+DEFAULT_DURATION = 10
+DEFAULT_WRITERS = 8
+DEFAULT_READERS = 4
+HOT_POSTS = 200
+# Время на запуск процессов и вход: замер у всех начинается разом.
+START_DELAY = 3
+MODES = ('baseline', 'production')
+# Стандартный бэкенд Django: журнал DELETE, отложенные транзакции,
+# новое соединение на каждый запрос и никаких повторов.
+BASELINE_PROFILE = {
+    'OPTIONS': {
+        'transaction_mode': 'DEFERRED',
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    },
+    'CONN_MAX_AGE': 0,
+    'SQLITE_LOCK_RETRIES': 0,
+}
+
+
+def production_profile():
+    database = settings.DATABASES['default']
+    return {
+        'OPTIONS': database.get('OPTIONS', {}),
+        'CONN_MAX_AGE': database.get('CONN_MAX_AGE', 0),
+        'SQLITE_LOCK_RETRIES': getattr(settings, 'SQLITE_LOCK_RETRIES', 0),
+    }
+
+
+def _init_worker(profile):
+    django.setup()
+    database = connections['default'].settings_dict
+    database['OPTIONS'] = profile['OPTIONS']
+    database['CONN_MAX_AGE'] = profile['CONN_MAX_AGE']
+    settings.SQLITE_LOCK_RETRIES = profile['SQLITE_LOCK_RETRIES']
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    connections.close_all()
+
+
+def _work(user_id, post_ids, start_at, duration):
+    """
+    Писатель (user_id задан) ставит и снимает лайки, читатель
+    открывает страницы тех же записей. Соединения закрываются после
+    каждого запроса так же, как по сигналу request_finished.
+    """
+
+    client = Client(REMOTE_ADDR=CLIENT_ADDRESS)
+    if user_id is not None:
+        client.force_login(User.objects.get(pk=user_id))
+    close_old_connections()
+    time.sleep(max(0, start_at - time.time()))
+    latencies = []
+    errors = 0
+    while time.time() < start_at + duration:
+        post_id = random.choice(post_ids)
+        if user_id is None:
+            urls = [reverse('posts:post_detail', args=[post_id])]
+        else:
+            urls = [
+                reverse('posts:post_like', args=[post_id]),
+                reverse('posts:post_unlike', args=[post_id]),
+            ]
+        for url in urls:
+            start = time.perf_counter()
+            try:
+                client.get(url)
+            except OperationalError as error:
+                if not is_locked_error(error):
+                    raise
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+            finally:
+                close_old_connections()
+    return user_id is not None, latencies, errors
+
+
+def summarize(latencies, errors, duration):
+    return {
+        'per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'mean_ms': (
+            round(statistics.fmean(latencies), 3) if latencies else None
+        ),
+        'locked_errors': errors,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает базу одновременными лайками и чтением записей '
+        'в нескольких процессах и сравнивает пропускную способность '
+        'стандартных настроек SQLite и боевого профиля. Меняет данные: '
+        'запускать на базе после seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers', type=int, default=DEFAULT_WRITERS,
+            help='Процессов, ставящих лайки.'
+        )
+        parser.add_argument(
+            '--readers', type=int, default=DEFAULT_READERS,
+            help='Процессов, читающих записи.'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=DEFAULT_DURATION,
+            help='Секунд на каждый режим.'
+        )
+        parser.add_argument(
+            '--mode', choices=MODES, action='append',
+            help='Какие режимы замерять (по умолчанию оба).'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def set_journal_mode(self, mode):
+        """Режим журнала хранится в файле базы, его меняют без читателей."""
+
+        connections.close_all()
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {mode}')
+        connections.close_all()
+
+    def run(self, profile, writer_ids, post_ids, readers, duration):
+        self.set_journal_mode(
+            profile['OPTIONS'].get('pragmas', {}).get('journal_mode', 'DELETE')
+        )
+        start_at = time.time() + START_DELAY
+        tasks = [
+            (user_id, post_ids, start_at, duration)
+            for user_id in [*writer_ids, *[None] * readers]
+        ]
+        with multiprocessing.Pool(
+                len(tasks), initializer=_init_worker,
+                initargs=(profile,)) as pool:
+            results = pool.starmap(_work, tasks, chunksize=1)
+        report = {}
+        for role, is_writer in (('writes', True), ('reads', False)):
+            latencies = []
+            errors = 0
+            for writer, worker_latencies, worker_errors in results:
+                if writer == is_writer:
+                    latencies.extend(worker_latencies)
+                    errors += worker_errors
+            report[role] = summarize(latencies, errors, duration)
+        return report
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер рассчитан на SQLite')
+        post_ids = list(
+            Post.objects.order_by('-pub_date').values_list(
+                'pk', flat=True
+            )[:HOT_POSTS]
+        )
+        # Писатели - пользователи без лайков на этих записях: снимая
+        # свой лайк, они не трогают настоящие.
+        writer_ids = list(
+            User.objects.exclude(liker__post_id__in=post_ids)
+            .order_by('pk').values_list('pk', flat=True)[:options['writers']]
+        )
+        if not post_ids or len(writer_ids) < options['writers']:
+            raise CommandError(
+                'Недостаточно данных, сначала выполните seed_data'
+            )
+        profiles = {
+            'baseline': BASELINE_PROFILE, 'production': production_profile()
+        }
+        results = {}
+        try:
+            for mode in options['mode'] or MODES:
+                results[mode] = self.run(
+                    profiles[mode], writer_ids, post_ids,
+                    options['readers'], options['duration']
+                )
+                for role, result in results[mode].items():
+                    self.stdout.write(
+                        f'{mode} {role}: {result["per_second"]}/с, '
+                        f'p50 {result["p50_ms"]} ms, '
+                        f'p95 {result["p95_ms"]} ms, '
+                        f'ошибок блокировки {result["locked_errors"]}'
+                    )
+        finally:
+            self.set_journal_mode(
+                production_profile()['OPTIONS'].get('pragmas', {}).get(
+                    'journal_mode', 'DELETE'
+                )
+            )
+        if len(results) == len(MODES):
+            for role in ('writes', 'reads'):
+                before = results['baseline'][role]['per_second']
+                after = results['production'][role]['per_second']
+                if before:
+                    self.stdout.write(
+                        f'{role}: x{after / before:.2f} к стандартным '
+                        f'настройкам'
+                    )
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'writers': options['writers'],
+                'readers': options['readers'],
+                'duration': options['duration'],
+                'results': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
@@ -0,0 +1,119 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.db_router import PIN_COOKIE
+from posts.management.commands.benchmark_views import CLIENT_ADDRESS
+from posts.archive import month_of
+from posts.management.targets import heavy_targets
+from posts.models import Post
+
+# «SCAN posts_post» без индекса - полный проход по таблице
+# (в старых SQLite - «SCAN TABLE posts_post»).
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Ранжирование FTS5 (bm25) не индексируется: все совпадения
+# сортируются всегда, флаг тут ничего не подскажет.
+VIRTUAL_TABLE = 'VIRTUAL TABLE'
+SEARCH_QUERY = 'a'
+# Кеш перед каждой страницей очищается, а вход пишет сессию: и то,
+# и другое - в отдельном LocMemCache, а не в общем кеше сайта.
+CHECK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'check_query_plans',
+    },
+}
+CHECK_SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для запросов основных страниц '
+        'и отмечает полные проходы по таблицам и сортировки во '
+        'временном B-дереве.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ignore-table', action='append', default=[],
+            help='Таблица, полный проход по которой допустим.'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться с ошибкой, если найдены проблемы.'
+        )
+
+    def targets(self):
+        targets = heavy_targets()
+        post_url = targets['post_detail'][0]
+        post_id = int(post_url.rstrip('/').rsplit('/', 1)[-1])
+        targets['search'] = (
+            f'{reverse("posts:search")}?q={SEARCH_QUERY}', None
+        )
+        targets['comments'] = (
+            reverse('posts:comments', args=[post_id]), None
+        )
+        year, month = month_of(Post.objects.values_list(
+            'pub_date', flat=True
+        ).first())
+        targets['archive'] = (
+            reverse('posts:archive_month', args=[year, month]), None
+        )
+        return targets
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def problems(self, plan, ignored):
+        """Полные проходы по таблицам и сортировки всей выборки."""
+
+        full_text = any(VIRTUAL_TABLE in step for step in plan)
+        for step in plan:
+            match = FULL_SCAN.match(step)
+            if match and match['table'] not in ignored:
+                yield step
+            elif step.startswith(TEMP_SORT) and not full_text:
+                yield step
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Поддерживается только SQLite.')
+        ignored = set(options['ignore_table'])
+        found = 0
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                CACHES=CHECK_CACHES,
+                SESSION_ENGINE=CHECK_SESSION_ENGINE):
+            for name, (url, user) in self.targets().items():
+                client = Client(REMOTE_ADDR=CLIENT_ADDRESS)
+                # Планы смотрим на основной базе, без реплик.
+                client.cookies[PIN_COOKIE] = '1'
+                if user is not None:
+                    client.force_login(user)
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url)
+                for query in queries.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan = self.explain(sql)
+                    if not any(self.problems(plan, ignored)):
+                        continue
+                    found += 1
+                    self.stdout.write(self.style.WARNING(f'{name}: {sql}'))
+                    for step in plan:
+                        self.stdout.write(f'    {step}')
+        if found and options['strict']:
+            raise CommandError(f'Проблемных запросов: {found}')
+        style = self.style.WARNING if found else self.style.SUCCESS
+        self.stdout.write(style(f'Проблемных запросов: {found}'))
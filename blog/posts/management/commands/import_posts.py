@@ -0,0 +1,308 @@
+import json
+import sys
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching
+from posts.counters import (repair_archive_counters, repair_author_counters,
+                            repair_post_counters)
+from posts.management.bulk import explicit_timestamps
+from posts.models import Comment, Group, Likes, Post, User
+from posts.timeline import fan_out_posts
+
+DEFAULT_BATCH_SIZE = 5000
+ROW_TYPES = ('post', 'comment', 'like')
+# Соответствие id записи в файле -> pk живет во временной таблице
+# базы, а не в памяти: память не растет с размером файла.
+ID_TABLE = 'import_post_ids'
+ID_LOOKUP_CHUNK = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает записи, комментарии и лайки из JSONL (по объекту '
+        'на строку, поле type - post, comment или like). Файл читается '
+        'построчно, строки вставляются через bulk_create пачками, каждая '
+        'пачка - в своей транзакции. Авторы и группы ищутся по username '
+        'и slug, комментарии и лайки ссылаются на id записи из того же '
+        'файла. Даты pub_date, updated и created сохраняются как есть.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL или - для stdin.')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Сколько строк вставлять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать недостающих пользователей без пароля.'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options['batch_size'])
+        self.create_users = options['create_users']
+        self.now = timezone.now()
+        # Таблицы поиска текущей пачки: username -> pk, slug -> pk,
+        # id записи в файле -> pk. После пачки очищаются.
+        self.user_ids = {}
+        self.group_ids = {}
+        self.post_ids = {}
+        self.buffers = {row_type: [] for row_type in ROW_TYPES}
+        self.created = {row_type: 0 for row_type in ROW_TYPES}
+        self.skipped = 0
+        self.authors = set()
+        self.groups = set()
+        self.start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {ID_TABLE} '
+                '(source TEXT PRIMARY KEY, post_id INTEGER NOT NULL)'
+            )
+        try:
+            if options['path'] == '-':
+                self.load(sys.stdin)
+            else:
+                try:
+                    with open(options['path'], encoding='utf-8') as lines:
+                        self.load(lines)
+                except OSError as error:
+                    raise CommandError(error)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {ID_TABLE}')
+        self.stdout.write('Пересборка счетчиков...')
+        repair_post_counters(self.batch_size)
+        repair_author_counters(self.batch_size)
+        repair_archive_counters()
+        # Сигналы при bulk_create не срабатывают: версии кеша
+        # поднимаем сами.
+        caching.bump(
+            caching.GLOBAL,
+            *(caching.author_scope(username) for username in self.authors),
+            *(caching.group_scope(slug) for slug in self.groups)
+        )
+        self.report(self.style.SUCCESS)
+
+    def load(self, lines):
+        with explicit_timestamps(
+                Post._meta.get_field('pub_date'),
+                Post._meta.get_field('updated'),
+                Comment._meta.get_field('created')):
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    if row.get('type') not in ROW_TYPES:
+                        raise ValueError(f'неизвестный type {row.get("type")}')
+                except (ValueError, AttributeError) as error:
+                    self.skip(number, error)
+                    continue
+                row['line'] = number
+                self.buffers[row['type']].append(row)
+                if sum(map(len, self.buffers.values())) >= self.batch_size:
+                    self.flush()
+            self.flush()
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Строка {number} пропущена: {reason}')
+
+    def report(self, style=str):
+        elapsed = time.perf_counter() - self.start
+        total = sum(self.created.values())
+        self.stdout.write(style(
+            f'Записей - {self.created["post"]}, '
+            f'комментариев - {self.created["comment"]}, '
+            f'лайков - {self.created["like"]}, '
+            f'пропущено строк - {self.skipped}; '
+            f'{total / elapsed if elapsed else 0:.0f} строк/с'
+        ))
+
+    def flush(self):
+        """Вставляет накопленные строки одной транзакцией."""
+
+        posts, comments, likes = (
+            self.buffers[row_type] for row_type in ROW_TYPES
+        )
+        if not (posts or comments or likes):
+            return
+        with transaction.atomic():
+            self.resolve_users([
+                row.get(field) for row in [*posts, *comments, *likes]
+                for field in ('author', 'user')
+            ])
+            self.resolve_groups([row.get('group') for row in posts])
+            self.insert_posts(posts)
+            self.resolve_posts(
+                [row.get('post') for row in [*comments, *likes]]
+            )
+            self.insert_comments(comments)
+            self.insert_likes(likes)
+        for lookup in (*self.buffers.values(), self.user_ids, self.group_ids,
+                       self.post_ids):
+            lookup.clear()
+        self.report()
+
+    def resolve_users(self, usernames):
+        missing = {name for name in usernames if name} - set(self.user_ids)
+        if not missing:
+            return
+        self.user_ids.update(
+            User.objects.filter(username__in=missing).values_list(
+                'username', 'pk'
+            )
+        )
+        missing -= set(self.user_ids)
+        if missing and self.create_users:
+            password = make_password(None)
+            User.objects.bulk_create([
+                User(username=username, password=password)
+                for username in missing
+            ])
+            self.user_ids.update(
+                User.objects.filter(username__in=missing).values_list(
+                    'username', 'pk'
+                )
+            )
+
+    def resolve_groups(self, slugs):
+        missing = {slug for slug in slugs if slug} - set(self.group_ids)
+        if missing:
+            self.group_ids.update(
+                Group.objects.filter(slug__in=missing).values_list(
+                    'slug', 'pk'
+                )
+            )
+
+    def resolve_posts(self, sources):
+        """Находит pk записей, на которые ссылаются строки пачки."""
+
+        missing = list({
+            json.dumps(source) for source in sources if source is not None
+        })
+        with connection.cursor() as cursor:
+            for start in range(0, len(missing), ID_LOOKUP_CHUNK):
+                chunk = missing[start:start + ID_LOOKUP_CHUNK]
+                cursor.execute(
+                    f'SELECT source, post_id FROM {ID_TABLE} '
+                    f'WHERE source IN ({", ".join(["%s"] * len(chunk))})',
+                    chunk
+                )
+                self.post_ids.update(
+                    (json.loads(source), post_id)
+                    for source, post_id in cursor.fetchall()
+                )
+
+    def remember_posts(self, sources, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {ID_TABLE} (source, post_id) '
+                'VALUES (%s, %s)',
+                [
+                    (json.dumps(source), post_id)
+                    for source, post_id in zip(sources, post_ids)
+                    if source is not None
+                ]
+            )
+
+    def timestamp(self, row, field, default=None):
+        value = row.get(field)
+        if value is None:
+            return default or self.now
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError(f'неверная дата {field}')
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def reference(self, lookup, row, field, required=True):
+        value = row.get(field)
+        if value is None and not required:
+            return None
+        if value not in lookup:
+            raise ValueError(f'{field} {value!r} не найден')
+        return lookup[value]
+
+    def insert_posts(self, rows):
+        posts = []
+        sources = []
+        for row in rows:
+            try:
+                pub_date = self.timestamp(row, 'pub_date')
+                post = Post(
+                    text=row['text'],
+                    author_id=self.reference(self.user_ids, row, 'author'),
+                    group_id=self.reference(
+                        self.group_ids, row, 'group', required=False
+                    ),
+                    pub_date=pub_date,
+                    updated=self.timestamp(row, 'updated', pub_date),
+                )
+            except (KeyError, TypeError, ValueError) as error:
+                self.skip(row['line'], error)
+                continue
+            posts.append(post)
+            sources.append(row.get('id'))
+            self.authors.add(row['author'])
+            if row.get('group'):
+                self.groups.add(row['group'])
+        if not posts:
+            return
+        since = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Post.objects.bulk_create(posts)
+        # bulk_create в SQLite не возвращает pk, но транзакция
+        # держит блокировку записи: все записи после since - наши,
+        # в порядке вставки.
+        post_ids = list(
+            Post.objects.filter(pk__gt=since).order_by('pk').values_list(
+                'pk', flat=True
+            )
+        )
+        self.remember_posts(sources, post_ids)
+        fan_out_posts(post_ids[0], post_ids[-1])
+        self.created['post'] += len(post_ids)
+
+    def insert_comments(self, rows):
+        comments = []
+        for row in rows:
+            try:
+                comments.append(Comment(
+                    post_id=self.reference(self.post_ids, row, 'post'),
+                    author_id=self.reference(self.user_ids, row, 'author'),
+                    text=row['text'],
+                    created=self.timestamp(row, 'created'),
+                ))
+            except (KeyError, TypeError, ValueError) as error:
+                self.skip(row['line'], error)
+        Comment.objects.bulk_create(comments)
+        self.created['comment'] += len(comments)
+
+    def insert_likes(self, rows):
+        likes = []
+        for row in rows:
+            try:
+                likes.append(Likes(
+                    post_id=self.reference(self.post_ids, row, 'post'),
+                    user_id=self.reference(self.user_ids, row, 'user'),
+                ))
+            except (TypeError, ValueError) as error:
+                self.skip(row['line'], error)
+        if not likes:
+            return
+        since = Likes.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Likes.objects.bulk_create(likes, ignore_conflicts=True)
+        # Уже поставленные лайки пропущены без ошибки: считаем только
+        # вставленные строки - они, как и записи, идут после since.
+        self.created['like'] += Likes.objects.filter(pk__gt=since).count()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import (repair_archive_counters, repair_author_counters,
+                            repair_post_counters)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики лайков, комментариев, записей '
+        'и архива по месяцам и исправляет разъехавшиеся.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Сколько строк сверять за один проход.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько счетчиков разъехалось.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        posts = repair_post_counters(batch_size, dry_run)
+        authors = repair_author_counters(batch_size, dry_run)
+        months = repair_archive_counters(dry_run)
+        verb = 'Разъехалось' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: записей - {posts}, авторов - {authors}, '
+            f'месяцев архива - {months}'
+        ))
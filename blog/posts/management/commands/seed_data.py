@@ -0,0 +1,239 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts.counters import (repair_archive_counters, repair_author_counters,
+                            repair_post_counters)
+from posts.management.bulk import explicit_timestamps
+from posts.models import (Comment, Follow, Group, Likes, Post,
+                          TimelineEntry, User)
+from posts.timeline import rebuild_timelines
+
+DEFAULT_BATCH_SIZE = 5000
+USERNAME_PREFIX = 'seed_'
+NO_GROUP_SHARE = 0.2
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу правдоподобными данными для нагрузочных '
+        'замеров: степенное распределение подписчиков, записей '
+        'и активности вокруг популярных записей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя.'
+        )
+        parser.add_argument(
+            '--comments', type=int, default=None,
+            help='Всего комментариев (по умолчанию 2 на запись).'
+        )
+        parser.add_argument(
+            '--likes', type=int, default=None,
+            help='Всего лайков (по умолчанию 5 на запись).'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона: чем больше, тем сильнее '
+                 'активность сосредоточена у немногих авторов и записей.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты записей.'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        if options['seed'] is not None:
+            self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days']).total_seconds()
+        posts = options['posts']
+        comments = options['comments']
+        likes = options['likes']
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            group_ids = self.create_groups(options['groups'])
+            with explicit_timestamps(
+                    Post._meta.get_field('pub_date'),
+                    Post._meta.get_field('updated'),
+                    Comment._meta.get_field('created')):
+                post_ids = self.create_posts(posts, user_ids, group_ids)
+                self.create_follows(options['follows'], user_ids)
+                self.create_comments(
+                    posts * 2 if comments is None else comments,
+                    user_ids, post_ids
+                )
+            self.create_likes(
+                posts * 5 if likes is None else likes, user_ids, post_ids
+            )
+            self.stdout.write('Пересборка лент и счетчиков...')
+            rebuild_timelines()
+            repair_post_counters(self.batch_size)
+            repair_author_counters(self.batch_size)
+            repair_archive_counters()
+        # Сигналы при bulk_create не срабатывают, версии кеша не
+        # поднимались.
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей - {len(user_ids)}, '
+            f'групп - {len(group_ids)}, записей - {len(post_ids)}, '
+            f'записей в лентах - {TimelineEntry.objects.count()}'
+        ))
+
+    def weighted(self, population):
+        """
+        Функция выбора k элементов с весами 1 / rank ** skew:
+        первые элементы популяции - «звезды».
+        """
+
+        weights = list(accumulate(
+            1 / rank ** self.skew for rank in range(1, len(population) + 1)
+        ))
+
+        def choose(k):
+            return self.random.choices(population, cum_weights=weights, k=k)
+        return choose
+
+    def past_date(self):
+        return self.now - timedelta(
+            seconds=self.random.random() * self.period
+        )
+
+    def bulk_create(self, model, objects, **kwargs):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, **kwargs
+        )
+
+    def created_ids(self, model, since_pk):
+        return list(
+            model.objects.filter(pk__gt=since_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )
+        )
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+
+    def create_users(self, count):
+        since = self.last_pk(User)
+        # Пароль для всех один и непригодный: хешировать его
+        # для каждого пользователя слишком долго.
+        password = make_password(None)
+        self.bulk_create(User, [
+            User(
+                username=f'{USERNAME_PREFIX}{since + i}',
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                password=password,
+            )
+            for i in range(count)
+        ])
+        user_ids = self.created_ids(User, since)
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def create_groups(self, count):
+        since = self.last_pk(Group)
+        self.bulk_create(Group, [
+            Group(
+                title=self.faker.sentence(nb_words=3)[:200],
+                slug=f'{USERNAME_PREFIX}group_{since + i}',
+                description=self.faker.paragraph(),
+            )
+            for i in range(count)
+        ])
+        return self.created_ids(Group, since)
+
+    def create_posts(self, count, user_ids, group_ids):
+        since = self.last_pk(Post)
+        authors = self.weighted(user_ids)
+        if group_ids:
+            groups = self.weighted(group_ids)
+        else:
+            def groups(k):
+                return [None] * k
+        texts = [self.faker.paragraph(nb_sentences=5) for _ in range(100)]
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            self.bulk_create(Post, [
+                Post(
+                    text=self.random.choice(texts),
+                    author_id=author_id,
+                    group_id=(
+                        None if self.random.random() < NO_GROUP_SHARE
+                        else group_id
+                    ),
+                    pub_date=pub_date,
+                    updated=pub_date,
+                )
+                for author_id, group_id, pub_date in zip(
+                    authors(size), groups(size),
+                    (self.past_date() for _ in range(size))
+                )
+            ])
+        # Популярными (первыми в списке) станут случайные записи.
+        post_ids = self.created_ids(Post, since)
+        self.random.shuffle(post_ids)
+        return post_ids
+
+    def create_follows(self, per_user, user_ids):
+        if per_user <= 0:
+            return
+        # Популярность не совпадает с плодовитостью: иначе у каждого
+        # самого плодовитого автора оказались бы и все подписчики.
+        authors = self.weighted(self.random.sample(user_ids, len(user_ids)))
+        for start in range(0, len(user_ids), self.batch_size):
+            follows = []
+            for user_id in user_ids[start:start + self.batch_size]:
+                count = int(self.random.expovariate(1 / per_user))
+                follows.extend(
+                    Follow(user_id=user_id, author_id=author_id)
+                    for author_id in set(authors(count)) - {user_id}
+                )
+            self.bulk_create(Follow, follows, ignore_conflicts=True)
+
+    def create_comments(self, count, user_ids, post_ids):
+        posts = self.weighted(post_ids)
+        texts = [self.faker.sentence() for _ in range(100)]
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            self.bulk_create(Comment, [
+                Comment(
+                    post_id=post_id,
+                    author_id=self.random.choice(user_ids),
+                    text=self.random.choice(texts),
+                    created=self.past_date(),
+                )
+                for post_id in posts(size)
+            ])
+
+    def create_likes(self, count, user_ids, post_ids):
+        posts = self.weighted(post_ids)
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            self.bulk_create(Likes, [
+                Likes(post_id=post_id, user_id=self.random.choice(user_ids))
+                for post_id in posts(size)
+            ], ignore_conflicts=True)
@@ -0,0 +1,48 @@
+"""Страницы с самыми тяжелыми объектами для замеров и проверок."""
+
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+
+
+def heavy_targets():
+    """
+    Самые тяжелые объекты каждого вида: самая большая группа,
+    самый плодовитый автор, самая обсуждаемая запись и лента
+    пользователя с наибольшим числом подписок. Возвращает словарь
+    {имя: (url, пользователь или None)}.
+    """
+
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    if post is None:
+        raise CommandError('Нет записей: сначала запустите seed_data.')
+    group = Group.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    author = User.objects.filter(
+        stats__isnull=False
+    ).order_by('-stats__posts_count').first() or post.author
+    reader_id = Follow.objects.values('user').annotate(
+        total=Count('pk')
+    ).order_by('-total').values_list('user', flat=True).first()
+    targets = {
+        'index': (reverse('posts:index'), None),
+        'profile': (
+            reverse('posts:profile', args=[author.username]), None
+        ),
+        'post_detail': (
+            reverse('posts:post_detail', args=[post.pk]), None
+        ),
+    }
+    if group is not None:
+        targets['group_posts'] = (
+            reverse('posts:group_list', args=[group.slug]), None
+        )
+    if reader_id is not None:
+        targets['follow_index'] = (
+            reverse('posts:follow_index'),
+            User.objects.get(pk=reader_id)
+        )
+    return targets
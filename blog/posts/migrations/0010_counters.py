@@ -0,0 +1,58 @@
+# Generated by Django 3.2.1 on 2026-10-18 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Likes = apps.get_model('posts', 'Likes')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+
+    def count_of(model):
+        return Coalesce(Subquery(
+            model.objects.filter(post=OuterRef('pk')).values('post').annotate(total=Count('pk')).values('total')
+        ), 0)
+
+    Post.objects.update(likes_count=count_of(Likes), comments_count=count_of(Comment))
+    AuthorStats.objects.bulk_create([
+        AuthorStats(author_id=row['author'], posts_count=row['total'])
+        for row in Post.objects.order_by().values('author').annotate(total=Count('pk'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
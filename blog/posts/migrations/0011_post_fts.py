@@ -0,0 +1,26 @@
+# Generated by Django 3.2.1 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from posts import search
+
+    search.rebuild(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from posts import search
+
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
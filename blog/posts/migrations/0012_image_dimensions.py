@@ -0,0 +1,46 @@
+# Generated by Django 3.2.1 on 2026-10-18 19:36
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def fill_image_dimensions(apps, schema_editor):
+    # Без размеров в базе ImageField открывает файл при каждой загрузке
+    # записи. values_list не создает экземпляры модели, поэтому и здесь
+    # каждый файл читается один раз.
+    Post = apps.get_model('posts', 'Post')
+    images = Post.objects.exclude(image='').values_list('pk', 'image')
+    for pk, name in images.iterator():
+        try:
+            with default_storage.open(name) as image:
+                width, height = get_image_dimensions(image)
+        except OSError:
+            continue
+        Post.objects.filter(pk=pk).update(image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, height_field='image_height', upload_to='posts/', verbose_name='Картинка', width_field='image_width'),
+        ),
+        migrations.RunPython(fill_image_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.1 on 2026-10-18 20:40
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def fill_archive(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MonthlyArchive = apps.get_model('posts', 'MonthlyArchive')
+    MonthlyArchive.objects.bulk_create([
+        MonthlyArchive(year=row['year'], month=row['month'], posts_count=row['total'])
+        for row in Post.objects.order_by().annotate(
+            year=ExtractYear('pub_date'), month=ExtractMonth('pub_date')
+        ).values('year', 'month').annotate(total=Count('pk'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+            ],
+            options={
+                'verbose_name': 'Месяц архива',
+                'verbose_name_plural': 'Архив по месяцам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyarchive',
+            constraint=models.UniqueConstraint(fields=('year', 'month'), name='unique_archive_month'),
+        ),
+        migrations.RunPython(fill_archive, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+from datetime import date, timedelta
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -5,6 +7,9 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 FIRST_FIFTEEN_CHARS_OF_TEXT = 15
+# Сохранения в первые минуты после публикации (миниатюры, размеры
+# картинки) правкой не считаются.
+EDIT_GRACE_PERIOD = timedelta(minutes=1)
 
 
 class Group(models.Model):
@@ -33,15 +38,21 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='posts',
         verbose_name='Автор'
     )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
+        db_index=False,
         blank=True,
         null=True,
         related_name='posts',
@@ -52,16 +63,58 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        width_field='image_width',
+        height_field='image_height'
+    )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина картинки'
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота картинки'
+    )
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Лайков'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев'
     )
 
     def __str__(self):
         return self.text[:FIRST_FIFTEEN_CHARS_OF_TEXT]
 
+    @property
+    def was_edited(self):
+        return self.updated - self.pub_date > EDIT_GRACE_PERIOD
+
     class Meta:
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
         ordering = ('-pub_date',)
+        # Ленты идут по (ключ, pk) от новых к старым, поэтому индексы
+        # составные с pub_date. Одиночные индексы внешних ключей
+        # были бы их префиксами и только замедляли бы запись.
+        indexes = (
+            models.Index(fields=('-pub_date',), name='post_pub_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('group', '-pub_date'),
+                name='post_group_pub_date_idx'
+            ),
+        )
 
 
 class Comment(models.Model):
@@ -70,6 +123,7 @@ class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='comments',
         verbose_name='Запись',
     )
@@ -97,6 +151,12 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', '-created'),
+                name='comment_post_created_idx'
+            ),
+        )
 
 
 class Follow(models.Model):
@@ -105,12 +165,14 @@ class Follow(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='follower',
         verbose_name='Подписчик'
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
         related_name='following',
         verbose_name='Автор',
     )
@@ -123,6 +185,12 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_following')
         ]
+        indexes = (
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx'
+            ),
+        )
 
 
 class Likes(models.Model):
@@ -145,3 +213,103 @@ class Likes(models.Model):
                 fields=['user', 'post'],
                 name='unique_like')
         ]
+
+
+class AuthorStats(models.Model):
+    """Счетчики автора, которые дорого считать на лету."""
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Записей'
+    )
+
+    def __str__(self):
+        return f'{self.author}: {self.posts_count}'
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class MonthlyArchive(models.Model):
+    """
+    Число записей за месяц для архива. Обновляется сигналами при
+    создании и удалении записей, чтобы архив не считался GROUP BY
+    по всей таблице записей.
+    """
+
+    year = models.PositiveSmallIntegerField(verbose_name='Год')
+    month = models.PositiveSmallIntegerField(verbose_name='Месяц')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Записей'
+    )
+
+    def __str__(self):
+        return f'{self.month:02}.{self.year}: {self.posts_count}'
+
+    @property
+    def date(self):
+        return date(self.year, self.month, 1)
+
+    class Meta:
+        verbose_name = 'Месяц архива'
+        verbose_name_plural = 'Архив по месяцам'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year', 'month'],
+                name='unique_archive_month'
+            )
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: строка на каждую пару
+    (подписчик, запись автора, на которого он подписан).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Запись'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        ordering = ('-pub_date',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='timeline_user_pub_date_idx'),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'),
+        ]
@@ -0,0 +1,200 @@
+"""
+Полнотекстовый поиск по записям на SQLite FTS5.
+
+Индекс - виртуальная таблица posts_post_fts с внешним содержимым
+(сам текст хранится только в posts_post). Синхронизацию держат
+триггеры на posts_post, поэтому в индекс попадают и bulk_create,
+и update(). Триггеры переустанавливаются после каждого migrate:
+SQLite пересоздает таблицу при изменении схемы и теряет их.
+"""
+
+import re
+
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.models import Post
+from posts.utils import FORWARD, POSTS_PER_PAGE, CursorPaginator
+
+FTS_TABLE = 'posts_post_fts'
+SNIPPET_TOKENS = 24
+SNIPPET_ELLIPSIS = '…'
+# Управляющие символы не встречаются в тексте записей, поэтому ими
+# удобно отметить совпадения до экранирования HTML.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+INSTALL_SQL = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+)
+
+UNINSTALL_SQL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    """Создает индекс и триггеры, если их еще нет."""
+
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def install_after_migrate(sender, using, **kwargs):
+    """Возвращает триггеры, потерянные при пересоздании posts_post."""
+
+    using = connections[using]
+    if not is_supported(using):
+        return
+    tables = using.introspection.table_names()
+    if FTS_TABLE in tables and Post._meta.db_table in tables:
+        install(using)
+
+
+def uninstall(using=connection):
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+def rebuild(using=connection):
+    """Перестраивает индекс по текущему содержимому posts_post."""
+
+    install(using)
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"
+        )
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский ввод в безопасный запрос FTS5:
+    каждое слово берется в кавычки, последнее ищется по префиксу.
+    """
+
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids_sql():
+    """Подзапрос id записей, подходящих под MATCH %s."""
+
+    return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet).replace(MARK_START, '<mark>').replace(
+            MARK_END, '</mark>'
+        )
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Курсорная пагинация по (rank, rowid): ранг bm25 для одного
+    запроса детерминирован, поэтому следующая страница начинается
+    ровно там, где закончилась предыдущая.
+    """
+
+    def __init__(self, match, per_page=POSTS_PER_PAGE):
+        super().__init__(None, per_page, key='search_rank')
+        self.match = match
+
+    def _valid_key(self, key_value):
+        return isinstance(key_value, (int, float))
+
+    def _key_of(self, row):
+        return row.search_rank, row.pk
+
+    def _fetch(self, direction, key_value, pk, limit):
+        operator, order = (
+            ('>', 'ASC') if direction == FORWARD else ('<', 'DESC')
+        )
+        params = [MARK_START, MARK_END, SNIPPET_ELLIPSIS, SNIPPET_TOKENS,
+                  self.match]
+        where = ''
+        if key_value is not None:
+            where = (
+                f'AND (rank {operator} %s '
+                f'OR (rank = %s AND rowid {operator} %s))'
+            )
+            params += [key_value, key_value, pk]
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''SELECT rowid, rank, snippet({FTS_TABLE}, 0, %s, %s, %s, %s)
+                FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {where}
+                ORDER BY rank {order}, rowid {order} LIMIT %s''',
+                params
+            )
+            hits = cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for post_id, _, _ in hits]
+        )
+        rows = []
+        for post_id, rank, snippet in hits:
+            post = posts.get(post_id)
+            if post is None:
+                continue
+            post.search_rank = rank
+            post.snippet = _highlight(snippet)
+            rows.append(post)
+        return rows
+
+    @property
+    def total(self):
+        return None
+
+
+def search_posts(text, cursor=None, query_params=None,
+                 per_page=POSTS_PER_PAGE):
+    """Страница найденных записей, лучшие совпадения первыми."""
+
+    match = build_match_query(text)
+    if not match or not is_supported():
+        return None
+    return SearchPaginator(match, per_page).get_page(
+        cursor, query_params=query_params
+    )
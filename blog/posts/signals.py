@@ -0,0 +1,199 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts import caching, counters, timeline
+from posts.archive import month_of
+from posts.models import Comment, Follow, Group, Likes, Post, User
+from posts.thumbnails import strip_metadata
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    """Новая запись попадает в ленты подписчиков автора."""
+
+    if created and not raw:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленту попадают записи автора."""
+
+    if created and not raw:
+        timeline.backfill_follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    """После отписки записи автора уходят из ленты."""
+
+    timeline.remove_follow(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает прежние группу и дату: кеш сбрасывается и у прежней
+    группы, а запись может перейти в другой месяц архива.
+    """
+
+    instance._previous_group_id = instance._previous_pub_date = None
+    if instance.pk and not raw:
+        instance._previous_group_id, instance._previous_pub_date = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'pub_date'
+            ).first() or (None, None)
+        )
+
+
+@receiver(pre_save, sender=Post)
+def strip_image_metadata(sender, instance, raw=False, **kwargs):
+    """Новая картинка сохраняется уже без EXIF."""
+
+    if not raw and instance.image and not instance.image._committed:
+        stripped = strip_metadata(instance.image)
+        if stripped is not instance.image:
+            instance.image = stripped
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_versions(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш ленты, автора, групп и самой записи."""
+
+    if raw:
+        return
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    } - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    ) if group_ids else []
+    caching.bump(
+        caching.GLOBAL,
+        caching.author_scope(instance.author.username),
+        caching.post_scope(instance.pk),
+        *(caching.group_scope(slug) for slug in slugs)
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_post_version(sender, instance, raw=False, **kwargs):
+    """Комментарии сбрасывают кеш своей записи."""
+
+    if not raw:
+        caching.bump(caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+def bump_like_versions(sender, instance, raw=False, **kwargs):
+    """
+    Лайк сбрасывает кеш страниц поставившего его и страниц, где
+    запись показана со счетчиком лайков: главной (от нее же зависит
+    страница записи), архива, автора и группы. Область записи не
+    трогаем: счетчик лежит вне закешированной карточки.
+    """
+
+    if raw:
+        return
+    scopes = [caching.user_scope(instance.user_id)]
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if post is not None:
+        username, slug = post
+        scopes += [caching.GLOBAL, caching.author_scope(username)]
+        if slug:
+            scopes.append(caching.group_scope(slug))
+    caching.bump(*scopes)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_author_version(sender, instance, raw=False, **kwargs):
+    """Подписка и отписка сбрасывают кеш профиля автора."""
+
+    if not raw:
+        caching.bump(caching.author_scope(instance.author.username))
+
+
+@receiver(post_save, sender=User)
+def bump_user_author_version(sender, instance, raw=False,
+                             update_fields=None, **kwargs):
+    """
+    Имя автора есть в его профиле и на карточках записей. Вход
+    обновляет только last_login - кеш от этого не сбрасывается.
+    """
+
+    if raw or update_fields == frozenset({'last_login'}):
+        return
+    caching.bump(caching.author_scope(instance.username))
+
+
+@receiver(post_save, sender=Group)
+def bump_group_version(sender, instance, raw=False, **kwargs):
+    """Название и описание группы есть на ее странице и в ее лентах."""
+
+    if not raw:
+        caching.bump(caching.group_scope(instance.slug))
+
+
+@receiver(post_save, sender=Post)
+def count_archive_month(sender, instance, created, raw=False, **kwargs):
+    """Новая запись или смена даты обновляют архив по месяцам."""
+
+    if raw:
+        return
+    previous = getattr(instance, '_previous_pub_date', None)
+    if created:
+        counters.change_month_count(instance.pub_date, 1)
+    elif previous and month_of(previous) != month_of(instance.pub_date):
+        counters.change_month_count(previous, -1)
+        counters.change_month_count(instance.pub_date, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_archive_month(sender, instance, **kwargs):
+    counters.change_month_count(instance.pub_date, -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def count_author_posts(sender, instance, created=False, raw=False,
+                       **kwargs):
+    """
+    Счетчики ведутся сигналами, а не во view: удаление через админку
+    или каскадом тоже их сдвигает. bulk_create и QuerySet.update
+    сигналов не шлют - после них нужен repair_counters.
+    """
+
+    if raw:
+        return
+    if kwargs['signal'] is post_delete:
+        counters.change_posts_count(instance.author_id, -1)
+    elif created:
+        counters.change_posts_count(instance.author_id, 1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def count_comments(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if kwargs['signal'] is post_delete:
+        counters.change_post_counter(instance.post_id, counters.COMMENTS, -1)
+    elif created:
+        counters.change_post_counter(instance.post_id, counters.COMMENTS, 1)
+
+
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+def count_likes(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if kwargs['signal'] is post_delete:
+        counters.change_post_counter(instance.post_id, counters.LIKES, -1)
+    elif created:
+        counters.change_post_counter(instance.post_id, counters.LIKES, 1)
@@ -0,0 +1,12 @@
+from django import template
+
+from posts.archive import get_archive_months
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/archive_sidebar.html')
+def archive_sidebar():
+    """Последние месяцы с записями из таблицы MonthlyArchive."""
+
+    return {'months': get_archive_months()}
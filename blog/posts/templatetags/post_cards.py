@@ -0,0 +1,79 @@
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from posts import caching
+from posts.likes import mark_liked
+
+register = template.Library()
+
+POST_CARD_TEMPLATE = 'includes/post_card.html'
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _card_key(post, version, show_author_profile_link, show_group):
+    # Имя автора и название группы меняются отдельно от записи, а
+    # версии их областей поднимает каждый лайк: в ключ идет то, что
+    # из них попадает в карточку.
+    shown = []
+    if show_author_profile_link:
+        shown += [post.author.username, post.author.get_full_name()]
+    if show_group and post.group:
+        shown += [post.group.slug, post.group.title]
+    digest = hashlib.md5('|'.join(shown).encode()).hexdigest()
+    variant = f'{int(show_author_profile_link)}{int(show_group)}'
+    return f'post_card:{variant}:{post.pk}:{version}:{digest}'
+
+
+@register.simple_tag
+def prefetch_post_cards(posts, show_author_profile_link=False,
+                        show_group=False):
+    """
+    Достает из кеша карточки всех записей страницы двумя get_many
+    (версии и сами фрагменты), недостающие рендерит и кладет обратно
+    одним set_many. Готовый HTML доступен как post.card_html.
+    """
+
+    posts = list(posts)
+    if not posts:
+        return ''
+    versions = caching.get_versions(
+        [caching.post_scope(post.pk) for post in posts]
+    )
+    keys = {
+        _card_key(
+            post, version, show_author_profile_link, show_group
+        ): post
+        for post, version in zip(posts, versions)
+    }
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, post in keys.items():
+        if key in cached:
+            post.card_html = cached[key]
+            continue
+        post.card_html = missing[key] = render_to_string(
+            POST_CARD_TEMPLATE,
+            {
+                'post': post,
+                'show_author_profile_link': show_author_profile_link,
+                'show_group': show_group,
+            }
+        )
+    if missing:
+        cache.set_many(missing, POST_CARD_CACHE_TIMEOUT)
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_likes(context, posts):
+    """
+    Отмечает post.liked у всех записей страницы одним запросом.
+    Кнопка лайка живет вне карточки: карточка общая для всех
+    пользователей, а отметка - у каждого своя.
+    """
+
+    mark_liked(posts, context['request'].user)
+    return ''
@@ -0,0 +1,74 @@
+import logging
+
+from django import template
+
+from posts.thumbnails import (CARD, JPEG, POST_IMAGE_FALLBACK_WIDTH,
+                              SHAPES, WEBP, get_thumbnails)
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+DEFAULT_SIZES = '(min-width: 992px) 960px, 100vw'
+
+
+def _thumbnails(post, shape=CARD):
+    """Готовые варианты картинки записи по форматам, от узких к широким."""
+
+    thumbnails = {}
+    for image_format, thumbnail in get_thumbnails(
+            post.image, post.image_width, shape):
+        thumbnails.setdefault(image_format, []).append(thumbnail)
+    return thumbnails
+
+
+def _srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails
+    )
+
+
+def _fallback(thumbnails, width):
+    suitable = [
+        thumbnail for thumbnail in thumbnails if thumbnail.width <= width
+    ]
+    return suitable[-1] if suitable else thumbnails[0]
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post, sizes=DEFAULT_SIZES, css_class='card-img h-auto my-2',
+               lazy=True, shape=CARD):
+    """
+    <picture> с вариантами картинки: WebP для браузеров, которые его
+    понимают, и JPEG со srcset для остальных. Размеры img берутся из
+    хранилища sorl, файлы при рендере не открываются. shape - форма
+    вариантов из posts.thumbnails.SHAPES.
+    """
+
+    context = {'sizes': sizes, 'css_class': css_class, 'lazy': lazy}
+    if not post.image:
+        return context
+    try:
+        thumbnails = _thumbnails(post, shape)
+    except Exception:
+        logger.exception('Не удалось получить варианты %s', post.image)
+        return context
+    jpegs = thumbnails[JPEG]
+    context.update(
+        image=_fallback(jpegs, SHAPES[shape][2]),
+        srcset=_srcset(jpegs),
+        webp_srcset=_srcset(thumbnails.get(WEBP, ())),
+    )
+    return context
+
+
+@register.simple_tag
+def post_image_url(post, width=POST_IMAGE_FALLBACK_WIDTH):
+    """Адрес JPEG-варианта картинки не шире width."""
+
+    if not post.image:
+        return ''
+    try:
+        return _fallback(_thumbnails(post)[JPEG], width).url
+    except Exception:
+        logger.exception('Не удалось получить варианты %s', post.image)
+        return ''
@@ -0,0 +1,216 @@
+import json
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.api import MAX_PAGE_SIZE, POST_FIELDS
+from posts.models import Comment, Follow, Group, Post, User
+from posts.thumbnails import generate_thumbnails, has_thumbnails
+from posts.utils import POSTS_PER_PAGE
+
+READER = 'test_api_reader'
+AUTHOR = 'test_api_author'
+OTHER_AUTHOR = 'test_api_other'
+GROUP_SLUG = 'test_api_group'
+GROUP_TITLE = 'Test api group'
+POST_TEXT = 'Test api post'
+COMMENT_TEXT = 'Test api comment'
+POSTS = POSTS_PER_PAGE * 2 + 3
+COMMENTS = 4
+IMAGE = 'api.gif'
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+POSTS_URL = reverse('posts:api_posts')
+GROUPS_URL = reverse('posts:api_groups')
+FOLLOW_URL = reverse('posts:api_follow')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username=READER)
+        cls.author = User.objects.create_user(username=AUTHOR)
+        other = User.objects.create_user(username=OTHER_AUTHOR)
+        cls.group = Group.objects.create(title=GROUP_TITLE, slug=GROUP_SLUG)
+        Group.objects.create(title='A first group', slug='a_first')
+        for i in range(POSTS):
+            Post.objects.create(
+                author=cls.author if i % 2 else other,
+                group=cls.group if i % 3 else None,
+                text=f'{POST_TEXT} {i}'
+            )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text=POST_TEXT,
+            image=SimpleUploadedFile(
+                name=IMAGE, content=SMALL_GIF, content_type='image/gif'
+            )
+        )
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.reader, text=COMMENT_TEXT)
+            for _ in range(COMMENTS)
+        ])
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def get_json(self, url, client=None, status=HTTPStatus.OK, **params):
+        response = (client or self.client).get(url, params)
+        self.assertEqual(response.status_code, status)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    def walk(self, url, client=None, **params):
+        """Все элементы списка, проходя по ссылкам next."""
+
+        page = self.get_json(url, client, **params)
+        items = page['results']
+        while page['next']:
+            page = self.get_json(page['next'], client)
+            items += page['results']
+        return items
+
+    def test_posts_are_paginated_by_cursor(self):
+        """Записи отдаются от новых к старым без пропусков и повторов."""
+
+        page = self.get_json(POSTS_URL)
+        self.assertEqual(len(page['results']), POSTS_PER_PAGE)
+        self.assertIsNone(page['previous'])
+        ids = [item['id'] for item in self.walk(POSTS_URL)]
+        self.assertEqual(
+            ids, list(Post.objects.values_list('pk', flat=True))
+        )
+
+    def test_fields_select_columns(self):
+        """fields сужает ответ и SQL: без автора и группы нет JOIN."""
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.get_json(POSTS_URL, fields='id,text')
+        self.assertEqual(set(page['results'][0]), {'id', 'text'})
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('posts_group', sql)
+        self.assertNotIn('likes_count', sql)
+        item = self.get_json(
+            reverse('posts:api_post', args=[self.post.pk])
+        )
+        self.assertEqual(list(item), list(POST_FIELDS))
+        self.assertEqual(item['author'], AUTHOR)
+
+    def test_image_variants_instead_of_original(self):
+        """
+        Вместо оригинала картинки отдаются ее готовые варианты, пока
+        их нет - пустой список, и сам запрос их не создает.
+        """
+
+        url = reverse('posts:api_post', args=[self.post.pk])
+        self.assertEqual(self.get_json(url, fields='image')['image'], [])
+        self.assertFalse(
+            has_thumbnails(self.post.image.name, self.post.image_width)
+        )
+        generate_thumbnails(self.post.image.name, self.post.image_width)
+        item = self.get_json(url, fields='image')
+        self.assertTrue(item['image'])
+        for variant in item['image']:
+            self.assertEqual(
+                set(variant), {'url', 'width', 'height', 'type'}
+            )
+            self.assertTrue(variant['url'].startswith(settings.MEDIA_URL))
+            self.assertNotIn(IMAGE, variant['url'])
+        self.assertIn('image/jpeg', {v['type'] for v in item['image']})
+        page = self.get_json(FOLLOW_URL, self.authorized_client)
+        self.assertEqual(page['results'][0]['image'], item['image'])
+        self.assertIsNone(page['results'][1]['image'])
+
+    def test_bad_parameters(self):
+        """Неизвестное поле и неверный limit - ответ 400."""
+
+        for params in ({'fields': 'id,password'}, {'fields': ','},
+                       {'limit': '0'}, {'limit': str(MAX_PAGE_SIZE + 1)},
+                       {'limit': 'x'}):
+            with self.subTest(params=params):
+                self.assertIn('error', self.get_json(
+                    POSTS_URL, status=HTTPStatus.BAD_REQUEST, **params
+                ))
+
+    def test_filters_and_limit(self):
+        """Фильтры group и author, размер страницы limit."""
+
+        items = self.walk(
+            POSTS_URL, group=GROUP_SLUG, author=AUTHOR, limit='3'
+        )
+        self.assertEqual(
+            [item['id'] for item in items],
+            list(Post.objects.filter(
+                group=self.group, author=self.author
+            ).values_list('pk', flat=True))
+        )
+        self.assertEqual(
+            len(self.get_json(POSTS_URL, limit='3')['results']), 3
+        )
+
+    def test_post_not_found(self):
+        for name in ('posts:api_post', 'posts:api_comments'):
+            with self.subTest(name=name):
+                self.get_json(
+                    reverse(name, args=[0]), status=HTTPStatus.NOT_FOUND
+                )
+
+    def test_comments_and_groups(self):
+        """Комментарии записи и список групп по названию."""
+
+        comments = self.walk(
+            reverse('posts:api_comments', args=[self.post.pk]), limit='3'
+        )
+        self.assertEqual(len(comments), COMMENTS)
+        self.assertEqual(
+            {(item['post'], item['author']) for item in comments},
+            {(self.post.pk, READER)}
+        )
+        groups = self.get_json(GROUPS_URL, fields='slug')['results']
+        self.assertEqual(groups, [{'slug': 'a_first'}, {'slug': GROUP_SLUG}])
+
+    def test_follow_feed(self):
+        """Лента подписок - только записи авторов из подписок и по входу."""
+
+        self.get_json(FOLLOW_URL, status=HTTPStatus.UNAUTHORIZED)
+        items = self.walk(FOLLOW_URL, self.authorized_client)
+        self.assertEqual(
+            [item['id'] for item in items],
+            list(self.author.posts.values_list('pk', flat=True))
+        )
+        self.assertEqual({item['author'] for item in items}, {AUTHOR})
+
+    def test_read_only(self):
+        """API не принимает изменяющие запросы."""
+
+        self.assertEqual(
+            self.authorized_client.post(POSTS_URL).status_code,
+            HTTPStatus.METHOD_NOT_ALLOWED
+        )
@@ -0,0 +1,334 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import caching
+from posts.management.commands import import_posts
+from posts.models import (AuthorStats, Comment, Follow, Group, Likes, Post,
+                          TimelineEntry, User)
+from posts.thumbnails import has_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+TEST_AUTHOR = 'test_commands_author'
+TEST_POST_TEXT = 'Test post text'
+SEED_USERS = 30
+SEED_POSTS = 200
+IMPORT_READER = 'test_import_reader'
+IMPORT_GROUP = 'test_import_group'
+IMPORT_NEW_USER = 'test_import_new_user'
+IMPORT_PUB_DATE = '2015-03-01T10:00:00+00:00'
+IMPORT_UPDATED = '2015-03-02T10:00:00+00:00'
+SENTINEL_KEY = 'test_commands_sentinel'
+SENTINEL_VALUE = 'kept'
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class RepairCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=TEST_AUTHOR)
+        cls.post = Post.objects.create(text=TEST_POST_TEXT, author=cls.author)
+        Likes.objects.create(user=cls.author, post=cls.post)
+        Comment.objects.create(
+            post=cls.post,
+            author=cls.author,
+            text=TEST_POST_TEXT
+        )
+
+    def test_repair_counters_fixes_drift(self):
+        """repair_counters приводит счетчики к реальным значениям."""
+
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7)
+        call_command('repair_counters', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).posts_count, 1
+        )
+
+    def test_orm_changes_keep_counters(self):
+        """
+        Счетчики сдвигаются и без view: при удалении через ORM,
+        как из админки, и при каскадном удалении.
+        """
+
+        post = Post.objects.create(text=TEST_POST_TEXT, author=self.author)
+        Comment.objects.create(
+            post=post, author=self.author, text=TEST_POST_TEXT
+        )
+        Likes.objects.create(user=self.author, post=post)
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+        Comment.objects.filter(post=post).delete()
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 0))
+        stats = AuthorStats.objects.get(author=self.author)
+        self.assertEqual(stats.posts_count, 2)
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 1)
+        self.assertFalse(Likes.objects.filter(post_id=post.pk).exists())
+        User.objects.get(pk=self.author.pk).delete()
+        self.assertFalse(AuthorStats.objects.exists())
+
+    def test_dry_run_changes_nothing(self):
+        """С --dry-run счетчики не меняются."""
+
+        Post.objects.filter(pk=self.post.pk).update(likes_count=0)
+        out = StringIO()
+        call_command('repair_counters', dry_run=True, stdout=out)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertIn('1', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BackfillThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=User.objects.create_user(username=TEST_AUTHOR),
+            image=SimpleUploadedFile(
+                name='backfill.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_backfill_creates_missing_thumbnails(self):
+        """backfill_thumbnails создает миниатюры, которых еще нет."""
+
+        image = self.post.image.name, self.post.image_width
+        self.assertFalse(has_thumbnails(*image))
+        out = StringIO()
+        call_command('backfill_thumbnails', workers=1, stdout=out)
+        self.assertTrue(has_thumbnails(*image))
+        self.assertIn('1', out.getvalue())
+        call_command('backfill_thumbnails', workers=1, stdout=out)
+        self.assertIn('Все миниатюры на месте', out.getvalue())
+
+
+class SeedAndBenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed_data', users=SEED_USERS, groups=3, posts=SEED_POSTS,
+            follows=5, seed=1, stdout=StringIO()
+        )
+
+    def test_seed_data_is_consistent(self):
+        """seed_data создает данные с согласованными лентами и счетчиками."""
+
+        self.assertEqual(User.objects.count(), SEED_USERS)
+        self.assertEqual(Post.objects.count(), SEED_POSTS)
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            sum(
+                Post.objects.filter(author_id=author_id).count()
+                for author_id in Follow.objects.values_list(
+                    'author_id', flat=True
+                )
+            )
+        )
+        out = StringIO()
+        call_command('repair_counters', dry_run=True, stdout=out)
+        self.assertIn('записей - 0, авторов - 0', out.getvalue())
+
+    def test_benchmark_writes_report(self):
+        """benchmark_views сохраняет p50/p95 каждой страницы в JSON."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'bench.json')
+        call_command(
+            'benchmark_views', iterations=2, warmup=0, output=path,
+            stdout=StringIO()
+        )
+        with open(path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report['database']['posts'], SEED_POSTS)
+        self.assertEqual(set(report['results']), {
+            'index', 'group_posts', 'profile', 'post_detail', 'follow_index'
+        })
+        for result in report['results'].values():
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_query_plans_use_indexes(self):
+        """
+        Запросы основных страниц обходятся без полных проходов, а
+        общий кеш и хранилище сессий проверка не трогает.
+        """
+
+        cache.set(SENTINEL_KEY, SENTINEL_VALUE)
+        sessions = Session.objects.count()
+        out = StringIO()
+        call_command('check_query_plans', strict=True, stdout=out)
+        self.assertIn('Проблемных запросов: 0', out.getvalue())
+        self.assertEqual(cache.get(SENTINEL_KEY), SENTINEL_VALUE)
+        self.assertEqual(Session.objects.count(), sessions)
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=TEST_AUTHOR)
+        cls.reader = User.objects.create_user(username=IMPORT_READER)
+        cls.group = Group.objects.create(title=IMPORT_GROUP, slug=IMPORT_GROUP)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'import.jsonl')
+
+    def import_rows(self, rows, command='import_posts', **options):
+        with open(self.path, 'w', encoding='utf-8') as output:
+            for row in rows:
+                output.write(
+                    row if isinstance(row, str) else json.dumps(row)
+                )
+                output.write('\n')
+        out, err = StringIO(), StringIO()
+        call_command(command, self.path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_lookups_do_not_outlive_batch(self):
+        """
+        Ссылки на записи из прошлых пачек находятся, но таблицы
+        поиска после каждой пачки пусты: память не растет с файлом.
+        """
+
+        rows = [
+            {'type': 'post', 'id': f'p{i}', 'author': TEST_AUTHOR,
+             'text': TEST_POST_TEXT}
+            for i in range(SEED_USERS)
+        ] + [
+            {'type': 'comment', 'post': f'p{i}', 'author': IMPORT_READER,
+             'text': TEST_POST_TEXT}
+            for i in range(SEED_USERS)
+        ]
+        command = import_posts.Command()
+        self.import_rows(rows, command=command, batch_size=7)
+        self.assertEqual(
+            Comment.objects.filter(post__author=self.author).count(),
+            SEED_USERS
+        )
+        self.assertEqual(
+            set(Post.objects.values_list('comments_count', flat=True)), {1}
+        )
+        self.assertEqual(
+            (command.post_ids, command.user_ids, command.group_ids),
+            ({}, {}, {})
+        )
+
+    def test_import_keeps_timestamps_and_derived_data(self):
+        """
+        Даты из файла сохраняются, ленты, счетчики и версии кеша
+        обновляются, плохие строки пропускаются.
+        """
+
+        version = caching.get_versions([caching.GLOBAL])
+        rows = [
+            {'type': 'post', 'id': 1, 'author': TEST_AUTHOR,
+             'group': IMPORT_GROUP, 'text': TEST_POST_TEXT,
+             'pub_date': IMPORT_PUB_DATE, 'updated': IMPORT_UPDATED},
+            {'type': 'post', 'id': 2, 'author': TEST_AUTHOR,
+             'text': TEST_POST_TEXT},
+            {'type': 'post', 'id': 3, 'author': 'missing',
+             'text': TEST_POST_TEXT},
+            'not json',
+            {'type': 'comment', 'post': 1, 'author': IMPORT_READER,
+             'text': TEST_POST_TEXT, 'created': IMPORT_PUB_DATE},
+            {'type': 'comment', 'post': 3, 'author': IMPORT_READER,
+             'text': TEST_POST_TEXT},
+            {'type': 'like', 'post': 1, 'user': IMPORT_READER},
+            {'type': 'like', 'post': 1, 'user': IMPORT_READER},
+            {'type': 'like', 'post': 2, 'user': TEST_AUTHOR},
+        ]
+        out, err = self.import_rows(rows, batch_size=2)
+        self.assertIn('Записей - 2', out)
+        self.assertIn('строк/с', out)
+        self.assertEqual(err.count('пропущена'), 3)
+        post = Post.objects.get(group=self.group)
+        self.assertEqual(post.pub_date.isoformat(), IMPORT_PUB_DATE)
+        self.assertEqual(post.updated.isoformat(), IMPORT_UPDATED)
+        self.assertTrue(post.was_edited)
+        self.assertEqual(
+            post.comments.get().created.isoformat(), IMPORT_PUB_DATE
+        )
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+        self.assertFalse(
+            Post.objects.get(group=None).was_edited
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).posts_count, 2
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+        self.assertNotEqual(
+            caching.get_versions([caching.GLOBAL]), version
+        )
+
+    def test_repeated_likes_not_counted(self):
+        """В отчет попадают только вставленные лайки, без повторов."""
+
+        rows = [
+            {'type': 'post', 'id': 1, 'author': TEST_AUTHOR,
+             'text': TEST_POST_TEXT},
+            {'type': 'like', 'post': 1, 'user': IMPORT_READER},
+            {'type': 'like', 'post': 1, 'user': IMPORT_READER},
+            {'type': 'like', 'post': 1, 'user': IMPORT_READER},
+            {'type': 'like', 'post': 1, 'user': TEST_AUTHOR},
+        ]
+        for batch_size in (1, len(rows)):
+            with self.subTest(batch_size=batch_size):
+                Post.objects.all().delete()
+                out, _ = self.import_rows(rows, batch_size=batch_size)
+                report = out.splitlines()[-1]
+                self.assertIn('лайков - 2', report)
+                self.assertEqual(Likes.objects.count(), 2)
+
+    def test_create_users(self):
+        """С --create-users неизвестные авторы создаются."""
+
+        rows = [{'type': 'post', 'author': IMPORT_NEW_USER,
+                 'text': TEST_POST_TEXT}]
+        self.import_rows(rows)
+        self.assertFalse(Post.objects.exists())
+        self.import_rows(rows, create_users=True)
+        user = User.objects.get(username=IMPORT_NEW_USER)
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(user.posts.count(), 1)
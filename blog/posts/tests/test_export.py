@@ -0,0 +1,126 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.export import COLUMNS, export_chunks
+from posts.models import Comment, Follow, Likes, Post, User
+
+TEST_ADMIN = 'test_export_admin'
+TEST_AUTHOR = 'test_export_author'
+TEST_POST_TEXT = 'Текст, с "кавычками"\nи переносом'
+POSTS = 7
+CHUNK_SIZE = 3
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username=TEST_ADMIN, email='admin@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(username=TEST_AUTHOR)
+        for i in range(POSTS):
+            post = Post.objects.create(
+                author=cls.author, text=f'{TEST_POST_TEXT} {i}'
+            )
+        Comment.objects.create(
+            post=post, author=cls.admin, text=TEST_POST_TEXT
+        )
+        Likes.objects.create(post=post, user=cls.admin)
+        Follow.objects.create(user=cls.admin, author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.directory = directory
+
+    def test_csv_and_jsonl_match_table(self):
+        """Обе выгрузки содержат все строки таблицы по порядку pk."""
+
+        expected = list(
+            Post.objects.order_by('pk').values_list('id', 'text')
+        )
+        text = ''.join(export_chunks(Post.objects.all(), 'csv', CHUNK_SIZE))
+        header, *rows = csv.reader(StringIO(text))
+        self.assertEqual(header, list(COLUMNS[Post]))
+        self.assertEqual(
+            [(int(row[0]), row[3]) for row in rows], expected
+        )
+        lines = ''.join(
+            export_chunks(Post.objects.all(), 'jsonl', CHUNK_SIZE)
+        ).splitlines()
+        self.assertEqual(
+            [(item['id'], item['text']) for item in map(json.loads, lines)],
+            expected
+        )
+
+    def test_reads_in_chunks(self):
+        """Таблица читается кусками, а не загружается целиком."""
+
+        chunks = export_chunks(Post.objects.all(), 'jsonl', CHUNK_SIZE)
+        self.assertEqual(
+            [chunk.count('\n') for chunk in chunks], [3, 3, 1]
+        )
+
+    def test_command_writes_gzip(self):
+        """export_data пишет каждую таблицу, с .gz - сжатой."""
+
+        for dataset, model in (('posts', Post), ('comments', Comment),
+                               ('likes', Likes), ('follows', Follow)):
+            with self.subTest(dataset=dataset):
+                path = os.path.join(self.directory, f'{dataset}.jsonl.gz')
+                call_command(
+                    'export_data', dataset, format='jsonl', output=path,
+                    chunk_size=CHUNK_SIZE, stdout=StringIO()
+                )
+                with gzip.open(path, 'rt', encoding='utf-8') as file:
+                    ids = [json.loads(line)['id'] for line in file]
+                self.assertEqual(
+                    ids, list(
+                        model.objects.order_by('pk').values_list(
+                            'pk', flat=True
+                        )
+                    )
+                )
+        out = StringIO()
+        call_command('export_data', 'follows', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+    def test_admin_action_streams_export(self):
+        """Действие админки отдает выбранное потоком, gzip - по запросу."""
+
+        client = self.client
+        client.force_login(self.admin)
+        selected = list(Post.objects.values_list('pk', flat=True)[:2])
+        url = reverse('admin:posts_post_changelist')
+        data = {'action': 'export_jsonl', '_selected_action': selected}
+        response = client.post(url, data, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('post.jsonl', response['Content-Disposition'])
+        lines = gzip.decompress(
+            b''.join(response.streaming_content)
+        ).decode().splitlines()
+        self.assertEqual(
+            sorted(json.loads(line)['id'] for line in lines),
+            sorted(selected)
+        )
+        response = client.post(
+            reverse('admin:posts_likes_changelist'),
+            {'action': 'export_csv',
+             '_selected_action': Likes.objects.values_list('pk', flat=True)}
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines()[0],
+            ','.join(COLUMNS[Likes])
+        )
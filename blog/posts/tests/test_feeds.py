@@ -0,0 +1,161 @@
+from http import HTTPStatus
+from xml.dom import minidom
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.feeds import FEED_ITEMS
+from posts.models import Group, Post, User
+
+GROUP_SLUG = 'test_feed_group'
+OTHER_GROUP_SLUG = 'test_feed_other'
+AUTHOR = 'test_feed_author'
+OTHER_AUTHOR = 'test_feed_other_author'
+AUTHOR_FIRST_NAME = 'Лев'
+AUTHOR_LAST_NAME = 'Толстой'
+GROUP_TITLE = 'Test feed group'
+GROUP_DESCRIPTION = 'Test feed description'
+POST_TEXT = 'Test feed post'
+POSTS = FEED_ITEMS + 5
+
+GROUP_RSS_URL = reverse('posts:group_rss', args=[GROUP_SLUG])
+GROUP_ATOM_URL = reverse('posts:group_atom', args=[GROUP_SLUG])
+PROFILE_RSS_URL = reverse('posts:profile_rss', args=[AUTHOR])
+PROFILE_ATOM_URL = reverse('posts:profile_atom', args=[AUTHOR])
+FEED_URLS = (GROUP_RSS_URL, GROUP_ATOM_URL, PROFILE_RSS_URL, PROFILE_ATOM_URL)
+# Сессия не создается: читалка приходит без cookie.
+FEED_QUERIES = 2
+
+
+class FeedsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username=AUTHOR,
+            first_name=AUTHOR_FIRST_NAME,
+            last_name=AUTHOR_LAST_NAME
+        )
+        other_author = User.objects.create_user(username=OTHER_AUTHOR)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION
+        )
+        other_group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=OTHER_GROUP_SLUG
+        )
+        for i in range(POSTS):
+            Post.objects.create(
+                author=cls.author, text=f'{POST_TEXT} {i}', group=cls.group
+            )
+        cls.foreign_post = Post.objects.create(
+            author=other_author, text=POST_TEXT, group=other_group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def items(self, url, tag):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return minidom.parseString(response.content).getElementsByTagName(
+            tag
+        )
+
+    def link(self, item):
+        # В RSS ссылка - текст <link>, в Atom - атрибут href.
+        link = item.getElementsByTagName('link')[0]
+        return link.getAttribute('href') or link.firstChild.nodeValue
+
+    def test_feeds_list_latest_posts(self):
+        """Ленты отдают последние FEED_ITEMS записей группы и автора."""
+
+        latest = Post.objects.filter(author=self.author)[:FEED_ITEMS]
+        links = [
+            f'http://testserver{reverse("posts:post_detail", args=[post.pk])}'
+            for post in latest
+        ]
+        for url, tag in ((GROUP_RSS_URL, 'item'), (PROFILE_RSS_URL, 'item'),
+                         (GROUP_ATOM_URL, 'entry'),
+                         (PROFILE_ATOM_URL, 'entry')):
+            with self.subTest(url=url):
+                items = self.items(url, tag)
+                self.assertEqual(len(items), FEED_ITEMS)
+                self.assertEqual(
+                    [self.link(item) for item in items], links
+                )
+
+    def test_feed_contents(self):
+        """В ленте название группы и полное имя автора."""
+
+        response = self.client.get(GROUP_ATOM_URL)
+        self.assertContains(response, GROUP_TITLE)
+        self.assertContains(response, GROUP_DESCRIPTION)
+        self.assertContains(
+            response, f'{AUTHOR_FIRST_NAME} {AUTHOR_LAST_NAME}'
+        )
+        self.assertContains(
+            self.client.get(PROFILE_RSS_URL), AUTHOR_LAST_NAME
+        )
+
+    def test_unknown_group_and_author(self):
+        """Лента несуществующей группы или автора - 404."""
+
+        for url in (reverse('posts:group_rss', args=['missing']),
+                    reverse('posts:profile_atom', args=['missing'])):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+                )
+
+    def test_polling_is_cached(self):
+        """Повторный опрос не ходит в базу, с ETag получает 304."""
+
+        for url in FEED_URLS:
+            with self.subTest(url=url):
+                with self.assertNumQueries(FEED_QUERIES):
+                    etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    self.assertEqual(
+                        self.client.get(url).status_code, HTTPStatus.OK
+                    )
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+
+    def test_changes_invalidate_feeds(self):
+        """Новая запись и правка группы попадают в ленты сразу."""
+
+        etags = {url: self.client.get(url)['ETag'] for url in FEED_URLS}
+        Post.objects.create(
+            author=self.author, text='Fresh post', group=self.group
+        )
+        for url in FEED_URLS:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertContains(response, 'Fresh post')
+        etag = self.client.get(GROUP_RSS_URL)['ETag']
+        self.group.title = 'Renamed group'
+        self.group.save()
+        response = self.client.get(GROUP_RSS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed group')
+
+    def test_pages_link_feeds(self):
+        """Страницы группы и профиля ссылаются на свои ленты."""
+
+        for page, feeds in (
+                (reverse('posts:group_list', args=[GROUP_SLUG]),
+                 (GROUP_RSS_URL, GROUP_ATOM_URL)),
+                (reverse('posts:profile', args=[AUTHOR]),
+                 (PROFILE_RSS_URL, PROFILE_ATOM_URL))):
+            response = self.client.get(page)
+            for feed in feeds:
+                with self.subTest(feed=feed):
+                    self.assertContains(response, f'href="{feed}"')
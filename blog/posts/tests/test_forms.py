@@ -2,11 +2,15 @@ import shutil
 import tempfile
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from posts.models import Group, Post, User
+from posts.thumbnails import has_thumbnails
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -113,6 +117,24 @@ class PostFormTest(TestCase):
         self.assertEqual(post.group.id, form_data['group'])
         self.assertEqual(post.image, f'{POSTS_MEDIA_FOLDER}{TEST_IMAGE_NAME}')
 
+    @override_settings(THUMBNAIL_PREGENERATE_WORKERS=0)
+    def test_thumbnails_ready_after_create(self):
+        """Миниатюры картинки готовятся сразу после создания записи."""
+
+        cache.clear()
+        uploaded_image = SimpleUploadedFile(
+            name='thumb.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authorized_client.post(
+                POST_CREATE_URL,
+                data={'text': NEW_TEXT, 'image': uploaded_image},
+            )
+        post = Post.objects.get(text=NEW_TEXT)
+        self.assertTrue(has_thumbnails(post.image.name, post.image_width))
+
     def test_author_can_edit_post(self):
         """Автор поста может редактировать текст и менять группу."""
 
@@ -130,6 +152,24 @@ class PostFormTest(TestCase):
         self.assertEqual(post_change.group.id, form_data['group'])
         self.assertRedirects(response_edit, self.POST_DETAIL_URL)
 
+    def test_edit_keeps_concurrent_counters(self):
+        """
+        Правка пишет только поля формы одним UPDATE и не затирает
+        счетчики, сдвинутые параллельно.
+        """
+
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_post_author.post(
+                self.POST_EDIT_URL, data={'text': CHANGED_TEXT}
+            )
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('likes_count', updates[0])
+        self.assertNotIn('comments_count', updates[0])
+
     def test_write_comment_can_only_authorized_user(self):
         """Писать комментарии может только авторизованный пользвоатель."""
 
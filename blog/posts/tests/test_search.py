@@ -0,0 +1,83 @@
+from http import HTTPStatus
+
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+from posts.search import build_match_query
+
+TEST_AUTHOR = 'test_search_author'
+TEST_ADMIN = 'test_search_admin'
+SEARCH_URL = reverse('posts:search')
+ADMIN_POSTS_URL = reverse('admin:posts_post_changelist')
+MATCHING_POSTS = 12
+POSTS_ON_FIRST_PAGE = 10
+
+
+class PostSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username=TEST_AUTHOR)
+        Post.objects.bulk_create([
+            Post(text=f'Пушистые котики номер {i}', author=author)
+            for i in range(MATCHING_POSTS)
+        ] + [
+            Post(text='Про собак <script>alert(1)</script>', author=author),
+            Post(text='котики котики котики', author=author),
+        ])
+        cls.admin = User.objects.create_superuser(
+            username=TEST_ADMIN, password='password'
+        )
+
+    def test_match_query_is_quoted(self):
+        """Ввод пользователя не может сломать синтаксис FTS5."""
+
+        self.assertEqual(
+            build_match_query('кот "OR" NEAR('), '"кот" "OR" "NEAR"*'
+        )
+        self.assertEqual(build_match_query('  *** '), '')
+
+    def test_ranked_results_with_cursor_pages(self):
+        """Лучшее совпадение первым, страницы по курсору без повторов."""
+
+        response = self.client.get(SEARCH_URL, {'q': 'котик'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(page_obj), POSTS_ON_FIRST_PAGE)
+        self.assertEqual(page_obj[0].text, 'котики котики котики')
+        self.assertContains(response, '<mark>котики</mark>')
+        seen = {post.pk for post in page_obj}
+        response = self.client.get(SEARCH_URL + page_obj.next_url)
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            len(page_obj), MATCHING_POSTS + 1 - POSTS_ON_FIRST_PAGE
+        )
+        self.assertFalse(seen & {post.pk for post in page_obj})
+
+    def test_snippet_is_escaped(self):
+        """HTML из текста записи экранируется в сниппете."""
+
+        response = self.client.get(SEARCH_URL, {'q': 'собак'})
+        self.assertNotContains(response, '<script>')
+        self.assertContains(response, '&lt;script&gt;')
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении записей."""
+
+        Post.objects.filter(text__startswith='Про собак').update(
+            text='Про хомяков'
+        )
+        response = self.client.get(SEARCH_URL, {'q': 'хомяк'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+        Post.objects.filter(text='Про хомяков').delete()
+        response = self.client.get(SEARCH_URL, {'q': 'хомяк'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит записи через индекс."""
+
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(ADMIN_POSTS_URL, {'q': 'собак'})
+        self.assertEqual(response.context['cl'].result_count, 1)
@@ -0,0 +1,211 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+
+from posts.models import Group, Likes, Post, User
+from posts.thumbnails import generate_thumbnails, has_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+TEST_AUTHOR = 'test_cards_author'
+TEST_POST_TEXT = 'Test post text'
+CHANGED_TEXT = 'Changed post text'
+CHANGED_NAME = 'Changed name'
+CHANGED_TITLE = 'Changed group'
+TEST_READER = 'test_cards_reader'
+GROUP_SLUG = 'test_cards_group'
+POSTS_COUNT = 3
+IMAGE_SIZE = (1000, 400)
+EXIF_ARTIST_TAG = 0x013B
+EXIF_ORIENTATION_TAG = 0x0112
+ROTATED_90 = 6
+
+CARDS_TEMPLATE = Template(
+    '{% load post_cards %}'
+    '{% prefetch_post_cards posts show_author_profile_link=True '
+    'show_group=True %}'
+    '{% for post in posts %}{{ post.card_html }}{% endfor %}'
+)
+IMAGE_TEMPLATE = Template('{% load post_images %}{% post_image post %}')
+TEASER_TEMPLATE = Template(
+    '{% load post_images %}'
+    '{% post_image post sizes="200px" shape="teaser" %}'
+)
+
+
+def make_jpeg(orientation=1):
+    exif = Image.Exif()
+    exif[EXIF_ARTIST_TAG] = 'Test artist'
+    exif[EXIF_ORIENTATION_TAG] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', IMAGE_SIZE).save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class PostCardsTagTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username=TEST_AUTHOR)
+        group = Group.objects.create(title='Group', slug=GROUP_SLUG)
+        Post.objects.bulk_create([
+            Post(text=f'{TEST_POST_TEXT} {i}', author=author, group=group)
+            for i in range(POSTS_COUNT)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        posts = list(Post.objects.select_related('author', 'group'))
+        return CARDS_TEMPLATE.render(Context({'posts': posts}))
+
+    def test_cards_rendered_once_and_reused(self):
+        """Карточки берутся из кеша, пока запись не изменилась."""
+
+        first = self.render()
+        self.assertIn(TEST_POST_TEXT, first)
+        self.assertIn(GROUP_SLUG, first)
+        Post.objects.update(text=CHANGED_TEXT)
+        self.assertEqual(self.render(), first)
+
+    def test_saved_post_card_rerendered(self):
+        """Сохранение записи сбрасывает только ее карточку."""
+
+        self.render()
+        Post.objects.update(text=CHANGED_TEXT)
+        post = Post.objects.first()
+        post.save()
+        html = self.render()
+        self.assertEqual(html.count(CHANGED_TEXT), 1)
+        self.assertEqual(html.count(TEST_POST_TEXT), POSTS_COUNT - 1)
+
+    def test_author_and_group_changes_rerender_cards(self):
+        """Новые имя автора и название группы видны в карточках."""
+
+        self.render()
+        author = User.objects.get(username=TEST_AUTHOR)
+        author.first_name = CHANGED_NAME
+        author.save()
+        self.assertEqual(self.render().count(CHANGED_NAME), POSTS_COUNT)
+        Group.objects.filter(slug=GROUP_SLUG).update(title=CHANGED_TITLE)
+        self.assertEqual(self.render().count(CHANGED_TITLE), POSTS_COUNT)
+
+    def test_like_keeps_card_cached(self):
+        """Лайк не сбрасывает карточку: счетчик лежит вне нее."""
+
+        first = self.render()
+        Post.objects.update(text=CHANGED_TEXT)
+        Likes.objects.create(
+            post=Post.objects.first(),
+            user=User.objects.create_user(username=TEST_READER)
+        )
+        self.assertEqual(self.render(), first)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageTagTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=User.objects.create_user(username=TEST_AUTHOR),
+            image=SimpleUploadedFile(
+                name='photo.jpg',
+                content=make_jpeg(),
+                content_type='image/jpeg'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_dimensions_stored_on_model(self):
+        """Размеры картинки сохраняются в записи."""
+
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), IMAGE_SIZE)
+
+    def test_responsive_markup(self):
+        """Тег отдает srcset без вариантов шире оригинала."""
+
+        html = IMAGE_TEMPLATE.render(Context({'post': self.post}))
+        self.assertIn('<picture>', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="960" height="339"', html)
+        self.assertIn(' 480w', html)
+        self.assertIn(' 960w', html)
+        self.assertNotIn(' 1440w', html)
+
+    @override_settings(THUMBNAIL_PREGENERATE_WORKERS=0)
+    def test_teaser_pregenerated(self):
+        """
+        Эскиз рекомендуемой записи входит в заранее готовящиеся
+        варианты: при рендере новых миниатюр не создается.
+        """
+
+        post = Post.objects.get(pk=self.post.pk)
+        generate_thumbnails(post.image.name, post.image_width)
+        self.assertTrue(has_thumbnails(post.image.name, post.image_width))
+        keys = set(default.kvstore._find_keys(identity='image'))
+        html = TEASER_TEMPLATE.render(Context({'post': post}))
+        self.assertEqual(set(default.kvstore._find_keys('image')), keys)
+        self.assertIn('width="200" height="210"', html)
+        self.assertIn(' 400w', html)
+        self.assertIn('sizes="200px"', html)
+
+    def test_variants_have_no_exif(self):
+        """В вариантах картинки нет EXIF оригинала."""
+
+        IMAGE_TEMPLATE.render(Context({'post': self.post}))
+        names = [
+            default.kvstore._get(key).name
+            for key in default.kvstore._find_keys(identity='image')
+        ]
+        names.remove(self.post.image.name)
+        self.assertTrue(names)
+        for name in names:
+            with default.storage.open(name) as thumbnail:
+                self.assertNotIn(
+                    EXIF_ARTIST_TAG, Image.open(thumbnail).getexif()
+                )
+
+    def test_original_has_no_exif(self):
+        """Загруженный оригинал сохраняется без EXIF."""
+
+        with default.storage.open(self.post.image.name) as original:
+            self.assertFalse(Image.open(original).getexif())
+
+    def test_exif_orientation_applied(self):
+        """Поворот из EXIF применяется к картинке до его удаления."""
+
+        post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=self.post.author,
+            image=SimpleUploadedFile(
+                name='rotated.jpg',
+                content=make_jpeg(orientation=ROTATED_90),
+                content_type='image/jpeg'
+            )
+        )
+        self.assertEqual(
+            (post.image_width, post.image_height), IMAGE_SIZE[::-1]
+        )
+        with default.storage.open(post.image.name) as original:
+            image = Image.open(original)
+            self.assertEqual(image.size, IMAGE_SIZE[::-1])
+            self.assertFalse(image.getexif())
@@ -0,0 +1,82 @@
+from django.test import RequestFactory, TestCase
+
+from posts.models import Post, User
+from posts.utils import (CursorPaginator, decode_cursor, encode_cursor,
+                         get_pages)
+
+TEST_AUTHOR = 'test_utils_author'
+TEST_POST_TEXT = 'Test post text'
+PER_PAGE = 3
+POSTS_COUNT = 8
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username=TEST_AUTHOR)
+        Post.objects.bulk_create([
+            Post(text=f'{TEST_POST_TEXT} {i}', author=author)
+            for i in range(POSTS_COUNT)
+        ])
+        cls.expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)
+        )
+        cls.paginator = CursorPaginator(Post.objects.all(), PER_PAGE)
+
+    def test_forward_pages_cover_all_posts_once(self):
+        """Переход по next-курсорам обходит все записи без повторов."""
+
+        seen = []
+        page = self.paginator.get_page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen += [post.pk for post in page]
+            if not page.has_next():
+                break
+            page = self.paginator.get_page(page.next_cursor)
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_to_previous_page(self):
+        """previous-курсор возвращает на предыдущую страницу."""
+
+        first = self.paginator.get_page()
+        second = self.paginator.get_page(first.next_cursor)
+        back = self.paginator.get_page(second.previous_cursor)
+        self.assertEqual(
+            [post.pk for post in back], [post.pk for post in first]
+        )
+        self.assertFalse(back.has_previous())
+
+    def test_last_page(self):
+        """Курсор последней страницы отдает самые старые записи."""
+
+        page = self.paginator.get_page(encode_cursor('p'))
+        self.assertEqual(
+            [post.pk for post in page], self.expected[-PER_PAGE:]
+        )
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_broken_cursor_gives_first_page(self):
+        """Битый курсор не ломает страницу, а отдает первую."""
+
+        for cursor in ('garbage', encode_cursor('x'), '%%%'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                page = self.paginator.get_page(cursor)
+                self.assertEqual(
+                    [post.pk for post in page], self.expected[:PER_PAGE]
+                )
+
+    def test_total_and_links_keep_other_params(self):
+        """Ссылки страницы сохраняют прочие GET-параметры."""
+
+        request = RequestFactory().get('/', {'q': 'text'})
+        page = get_pages(request, Post.objects.all(), per_page=PER_PAGE)
+        self.assertEqual(page.paginator.total, POSTS_COUNT)
+        self.assertFalse(page.paginator.total_is_estimate)
+        self.assertIn('q=text', page.next_url)
+        self.assertIn(f'cursor={page.next_cursor}', page.next_url)
+        self.assertEqual(page.first_url, '?q=text')
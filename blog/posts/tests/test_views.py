@@ -1,28 +1,54 @@
+import asyncio
+import pickle
+import re
 import shutil
 import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from io import StringIO
 from http import HTTPStatus
 
+from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.paginator import Page
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.http import Http404, HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
 from django.urls import reverse
+from django.utils.http import http_date
 
+from core.testing import QueryBudgetMixin
+from posts import async_views, caching, urls, views
+from posts.authors import get_author
+from posts.featured import FEATURED_POSTS_COUNT, get_featured_posts
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post, User
+from posts.likes import mark_liked
+from posts.models import (AuthorStats, Comment, Follow, Group, Likes,
+                          MonthlyArchive, Post, TimelineEntry, User)
+from posts.utils import CursorPage
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 GROUP_SLUG = 'test_group'
 TEST_USER = 'test_views1'
 TEST_AUTHOR = 'test_post_author'
+TEST_AUTHOR_EMAIL = 'author@example.com'
+TEST_AUTHOR_FIRST_NAME = 'Лев'
+CONCURRENT_REQUESTS = 4
+RENDER_DELAY = 0.2
 TEST_POST_TEXT = 'Test post text'
 TEST_GROUP_TITLE = 'Test group title'
 TEST_GROUP_DESCRIPTION = 'Test group description'
 UNFOLLOWING_USER = 'unfollowing'
 POSTS_ON_FIRST_PAGE = 10
 POSTS_ON_SECOND_PAGE = 3
+COMMENTS_ON_FIRST_PAGE = 20
+COMMENTS_ON_SECOND_PAGE = 5
 TEST_POST_IMAGE = 'posts/small.gif'
+ARCHIVE_OLD_DATE = datetime(2015, 3, 10, tzinfo=timezone.utc)
 
 SMALL_GIF = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
@@ -42,6 +68,47 @@ UNFOLLOW_URL = reverse('posts:profile_unfollow', args=[TEST_AUTHOR])
 FOLLOW_INDEX_URL = reverse('posts:follow_index')
 SUBSCRIBE_URSELF = reverse('posts:profile_follow', args=[TEST_USER])
 
+BUDGET_READER = 'test_budget_reader'
+BUDGET_AUTHOR = 'test_budget_author'
+BUDGET_GROUP_SLUG = 'test_budget_group'
+BUDGET_POSTS = 25
+BUDGET_COMMENTS_PER_POST = 3
+# Верхние границы числа запросов к базе на холодном кеше, включая
+# сессию и пользователя. Новый URL в posts.urls должен получить здесь
+# свой бюджет.
+QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_list': 5,
+    'posts:group_rss': 4,
+    'posts:group_atom': 4,
+    'posts:search': 4,
+    'posts:archive_year': 6,
+    'posts:archive_month': 6,
+    'posts:profile': 6,
+    'posts:profile_rss': 4,
+    'posts:profile_atom': 4,
+    'posts:post_detail': 5,
+    'posts:post_create': 3,
+    'posts:post_edit': 5,
+    'posts:post_delete': 18,
+    'posts:add_comment': 3,
+    'posts:comments': 2,
+    'posts:follow_index': 4,
+    'posts:profile_follow': 4,
+    'posts:profile_unfollow': 7,
+    'posts:post_like': 6,
+    'posts:post_unlike': 8,
+    'posts:api_posts': 3,
+    'posts:api_post': 3,
+    'posts:api_comments': 3,
+    'posts:api_groups': 3,
+    'posts:api_follow': 3,
+}
+
+CSRF_TOKEN = re.compile(rb'csrfmiddlewaretoken" value="[^"]*"')
+ASYNC_VIEWS = ('index', 'group_posts', 'profile', 'post_detail',
+               'follow_index')
+
 INDEX_TEMPLATE = 'posts/index.html'
 GROUP_TEMPLATE = 'posts/group_list.html'
 PROFILE_TEMPLATE = 'posts/profile.html'
@@ -75,6 +142,10 @@ class PostsViewsTests(TestCase):
         )
         cls.POST_DETAIL_URL = reverse('posts:post_detail', args=[cls.post.pk])
         cls.POST_EDIT_URL = reverse('posts:post_edit', args=[cls.post.pk])
+        cls.POST_LIKE_URL = reverse('posts:post_like', args=[cls.post.pk])
+        cls.POST_UNLIKE_URL = reverse('posts:post_unlike', args=[cls.post.pk])
+        cls.ADD_COMMENT_URL = reverse('posts:add_comment', args=[cls.post.pk])
+        cls.COMMENTS_URL = reverse('posts:comments', args=[cls.post.pk])
 
     @classmethod
     def tearDownClass(cls):
@@ -196,9 +267,9 @@ class PostsViewsTests(TestCase):
                     )
 
     def test_first_and_second_page_contains_correct_count_of_records(self):
-        """Количество постов на первой странице index/, group_list/
-        и profile/ = 10, на второй = 3 . Страница доступна,
-        у страницы нужный тип и != None.
+        """Количество постов на первой странице index/, group_list/,
+        profile/ и follow/ = 10, на второй (по курсору) = 3. Страница
+        доступна, у страницы нужный тип и != None.
         """
 
         Post.objects.bulk_create([
@@ -210,36 +281,76 @@ class PostsViewsTests(TestCase):
             ) for i in range(POSTS_ON_FIRST_PAGE + 2)
         ])
         Follow.objects.create(user=self.user, author=self.post.author)
-        pages = (
-            (INDEX_URL, POSTS_ON_FIRST_PAGE),
-            (GROUP_URL, POSTS_ON_FIRST_PAGE),
-            (PROFILE_URL, POSTS_ON_FIRST_PAGE),
-            (FOLLOW_INDEX_URL, POSTS_ON_FIRST_PAGE),
-            (INDEX_URL + '?page=2', POSTS_ON_SECOND_PAGE),
-            (GROUP_URL + '?page=2', POSTS_ON_SECOND_PAGE),
-            (PROFILE_URL + '?page=2', POSTS_ON_SECOND_PAGE),
-            (FOLLOW_INDEX_URL + '?page=2', POSTS_ON_SECOND_PAGE)
-        )
-        for url, posts_per_page in pages:
-            response = self.authorized_client.get(url)
-            page_obj = response.context.get('page_obj')
-            self.assertEqual(response.status_code, HTTPStatus.OK)
-            self.assertIsNotNone(page_obj)
-            self.assertIsInstance(page_obj, Page)
-            self.assertEqual(len(response.context['page_obj']), posts_per_page)
+        for url in (INDEX_URL, GROUP_URL, PROFILE_URL, FOLLOW_INDEX_URL):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                page_obj = response.context.get('page_obj')
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIsNotNone(page_obj)
+                self.assertIsInstance(page_obj, CursorPage)
+                self.assertEqual(len(page_obj), POSTS_ON_FIRST_PAGE)
+                response = self.authorized_client.get(
+                    url + page_obj.next_url
+                )
+                page_obj = response.context.get('page_obj')
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIsInstance(page_obj, CursorPage)
+                self.assertEqual(len(page_obj), POSTS_ON_SECOND_PAGE)
+                self.assertFalse(page_obj.has_next())
 
     def test_cache_index_page(self):
-        """Главная страница кешируется."""
+        """
+        Главная страница кешируется, а новая запись сбрасывает кеш
+        через версию, не дожидаясь истечения таймаута.
+        """
 
-        response1 = self.client.get(INDEX_URL + '?page=2')
+        response1 = self.client.get(INDEX_URL)
+        Post.objects.filter(pk=self.post.pk).update(text='Changed quietly')
+        response2 = self.client.get(INDEX_URL)
+        self.assertEqual(response1.content, response2.content)
         Post.objects.create(
             text=self.post.text,
             author=self.post.author,
         )
-        response2 = self.client.get(INDEX_URL + '?page=2')
+        response3 = self.client.get(INDEX_URL)
+        self.assertNotEqual(response1.content, response3.content)
+
+    def test_cached_pages_are_per_visitor(self):
+        """
+        Закешированная страница одного пользователя не достается
+        другому и гостю, даже при одинаковых версиях их областей.
+        """
+
+        cache.set_many({
+            f'{caching.VERSION_KEY_PREFIX}:{caching.user_scope(user.pk)}': 1
+            for user in (self.user, self.ufollowing_user)
+        }, None)
+        for url in (INDEX_URL, GROUP_URL, PROFILE_URL):
+            with self.subTest(url=url):
+                self.assertContains(self.authorized_client.get(url), TEST_USER)
+                other = self.unfollowing_user.get(url)
+                self.assertContains(other, UNFOLLOWING_USER)
+                self.assertNotContains(other, TEST_USER)
+                self.assertNotContains(self.client.get(url), TEST_USER)
+
+    def test_group_cache_reset_by_its_posts_only(self):
+        """
+        Кеш группы сбрасывается записью этой группы, в том числе
+        при переносе записи в другую группу.
+        """
+
+        other_group = Group.objects.create(title='Other', slug='other')
+        response1 = self.client.get(GROUP_URL)
+        Post.objects.create(text='Other group post', author=self.user,
+                            group=other_group)
+        Post.objects.filter(pk=self.post.pk).update(text='Changed quietly')
+        response2 = self.client.get(GROUP_URL)
         self.assertEqual(response1.content, response2.content)
-        cache.clear()
-        response3 = self.client.get(INDEX_URL + '?page=2')
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = other_group
+        post.save()
+        response3 = self.client.get(GROUP_URL)
+        self.assertNotContains(response3, 'Changed quietly')
         self.assertNotEqual(response1.content, response3.content)
 
     def test_authorized_user_can_follow(self):
@@ -307,3 +418,668 @@ class PostsViewsTests(TestCase):
         followers_count = follower.follower.all().count()
         self.authorized_client.get(SUBSCRIBE_URSELF)
         self.assertEqual(followers_count, 0)
+
+    def test_follow_backfills_and_unfollow_cleans_feed(self):
+        """
+        Подписка добавляет в ленту прежние записи автора,
+        отписка убирает их из ленты.
+        """
+
+        self.authorized_client.get(FOLLOW_URL)
+        response = self.authorized_client.get(FOLLOW_INDEX_URL)
+        self.assertEqual(response.context['page_obj'][0], self.post)
+        self.authorized_client.get(UNFOLLOW_URL)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+        response = self.authorized_client.get(FOLLOW_INDEX_URL)
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_deleted_post_leaves_feed(self):
+        """Удаленная запись пропадает из ленты подписчиков."""
+
+        Follow.objects.create(user=self.user, author=self.post.author)
+        post = Post.objects.create(
+            text=TEST_POST_TEXT,
+            author=self.post.author
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        post_id = post.pk
+        post.delete()
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user,
+            post_id=post_id).exists()
+        )
+
+    def test_like_and_comment_counters(self):
+        """Лайки и комментарии меняют счетчики записи."""
+
+        self.authorized_client.get(self.POST_LIKE_URL)
+        self.authorized_client.get(self.POST_LIKE_URL)
+        self.unfollowing_user.get(self.POST_LIKE_URL)
+        self.authorized_client.post(
+            self.ADD_COMMENT_URL,
+            data={'text': TEST_POST_TEXT}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(self.post.comments_count, 1)
+        self.authorized_client.get(self.POST_UNLIKE_URL)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_like_state_on_cached_index(self):
+        """Лайк сразу виден на закешированной главной поставившему его."""
+
+        response = self.authorized_client.get(INDEX_URL)
+        self.assertContains(response, self.POST_LIKE_URL)
+        response = self.authorized_client.get(
+            self.POST_LIKE_URL, {'next': INDEX_URL}
+        )
+        self.assertRedirects(response, INDEX_URL)
+        response = self.authorized_client.get(INDEX_URL)
+        self.assertContains(response, self.POST_UNLIKE_URL)
+        self.assertNotContains(response, self.POST_LIKE_URL)
+
+    def test_like_count_on_cached_lists_for_others(self):
+        """
+        Чужой лайк сразу меняет счетчик на закешированных лентах
+        другого пользователя и гостя, а старый ETag перестает
+        подходить.
+        """
+
+        urls = (INDEX_URL, GROUP_URL, PROFILE_URL)
+        before = {
+            url: (self.unfollowing_user.get(url), self.client.get(url))
+            for url in urls
+        }
+        self.authorized_client.get(self.POST_LIKE_URL)
+        for url, (other_page, guest_page) in before.items():
+            with self.subTest(url=url):
+                self.assertContains(guest_page, '&#9825; 0')
+                self.assertContains(self.client.get(url), '&#9825; 1')
+                self.assertEqual(
+                    self.client.get(
+                        url, HTTP_IF_NONE_MATCH=guest_page['ETag']
+                    ).status_code,
+                    HTTPStatus.OK
+                )
+                self.assertNotEqual(
+                    self.unfollowing_user.get(url).content,
+                    other_page.content
+                )
+
+    def test_like_ignores_foreign_next(self):
+        """Лайк не уводит на чужой сайт по ?next=."""
+
+        response = self.authorized_client.get(
+            self.POST_LIKE_URL, {'next': 'https://example.com/'}
+        )
+        self.assertRedirects(response, self.POST_DETAIL_URL)
+
+    def test_like_state_loaded_in_one_query(self):
+        """Отметки лайков для всей страницы - один запрос."""
+
+        posts = [
+            Post.objects.create(author=self.user, text=TEST_POST_TEXT)
+            for _ in range(3)
+        ]
+        Likes.objects.create(user=self.user, post=posts[1])
+        with self.assertNumQueries(1):
+            mark_liked(posts, self.user)
+        self.assertEqual(
+            [post.liked for post in posts], [False, True, False]
+        )
+
+    def test_comments_paginated(self):
+        """Первые комментарии на странице записи, остальные - фрагментом."""
+
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text=f'Comment {i}')
+            for i in range(COMMENTS_ON_FIRST_PAGE + COMMENTS_ON_SECOND_PAGE)
+        ])
+        response = self.authorized_client.get(self.POST_DETAIL_URL)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_ON_FIRST_PAGE)
+        self.assertContains(response, self.COMMENTS_URL + comments.next_url)
+        response = self.authorized_client.get(
+            self.COMMENTS_URL + comments.next_url
+        )
+        self.assertTemplateNotUsed(response, POST_DETAIL_TEMPLATE)
+        self.assertEqual(
+            len(response.context['comments']), COMMENTS_ON_SECOND_PAGE
+        )
+        self.assertFalse(response.context['comments'].has_next())
+
+    def test_posts_counter_of_author(self):
+        """Создание и удаление записи меняют счетчик записей автора."""
+
+        self.authorized_client.post(
+            POST_CREATE_URL,
+            data={'text': TEST_POST_TEXT}
+        )
+        stats = AuthorStats.objects.get(author=self.user)
+        self.assertEqual(stats.posts_count, 1)
+        post = Post.objects.get(author=self.user)
+        self.authorized_client.get(
+            reverse('posts:post_delete', args=[post.pk])
+        )
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 0)
+
+    def test_index_with_fewer_posts_than_featured(self):
+        """Главная открывается, даже если записей меньше трех или нет."""
+
+        for posts_left in (1, 0):
+            with self.subTest(posts_left=posts_left):
+                if not posts_left:
+                    Post.objects.all().delete()
+                cache.clear()
+                response = self.client.get(INDEX_URL)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    len(response.context['featured_posts']), posts_left
+                )
+
+    def test_featured_posts_single_query_and_cached(self):
+        """Рекомендуемые записи берутся одним запросом и кешируются."""
+
+        Post.objects.bulk_create([
+            Post(text=TEST_POST_TEXT, author=self.post.author)
+            for i in range(FEATURED_POSTS_COUNT + 1)
+        ])
+        cache.clear()
+        with self.assertNumQueries(1):
+            featured = get_featured_posts()
+            for post in featured:
+                post.author.username, post.group
+        self.assertEqual(len(featured), FEATURED_POSTS_COUNT)
+        with self.assertNumQueries(0):
+            get_featured_posts()
+
+    def test_profile_queries_do_not_grow_with_posts(self):
+        """
+        Профиль выбирает только текущую страницу: число запросов не
+        зависит от числа записей автора, а автор со счетчиком берется
+        из кеша, пока у автора нет новых записей.
+        """
+
+        author = self.post.author
+        # Миниатюры картинок ходят в свое хранилище - без них.
+        Post.objects.filter(pk=self.post.pk).update(image='')
+        for posts_count, on_page in (
+                (1, 1), (POSTS_ON_FIRST_PAGE * 3, POSTS_ON_FIRST_PAGE)):
+            Post.objects.bulk_create([
+                Post(text=TEST_POST_TEXT, author=author)
+                for _ in range(
+                    posts_count - Post.objects.filter(author=author).count()
+                )
+            ])
+            cache.clear()
+            with self.subTest(posts_count=posts_count):
+                with self.assertNumQueries(2):
+                    response = self.client.get(PROFILE_URL)
+                self.assertEqual(len(response.context['page_obj']), on_page)
+        with self.assertNumQueries(0):
+            get_author(author.username)
+        self.authorized_post_author.post(
+            POST_CREATE_URL, data={'text': TEST_POST_TEXT}
+        )
+        self.assertEqual(
+            get_author(author.username).stats.posts_count,
+            AuthorStats.objects.get(author=author).posts_count
+        )
+
+    def test_cached_author_has_no_private_fields(self):
+        """В кеш автора не попадают пароль, почта и права."""
+
+        User.objects.filter(pk=self.post.author.pk).update(
+            email=TEST_AUTHOR_EMAIL
+        )
+        author = get_author(TEST_AUTHOR)
+        self.assertEqual(author.username, TEST_AUTHOR)
+        self.assertTrue({
+            'password', 'email', 'is_superuser', 'is_staff', 'last_login'
+        } <= author.get_deferred_fields())
+        cached = pickle.dumps(get_author(TEST_AUTHOR))
+        self.assertNotIn(TEST_AUTHOR_EMAIL.encode(), cached)
+        self.assertNotIn(self.post.author.password.encode(), cached)
+
+    def test_cached_author_follows_name_change(self):
+        """Новое имя автора сразу видно в закешированном профиле."""
+
+        url = reverse('posts:profile', args=[TEST_AUTHOR])
+        self.authorized_client.get(url)
+        author = User.objects.get(username=TEST_AUTHOR)
+        author.first_name = TEST_AUTHOR_FIRST_NAME
+        author.save()
+        self.assertEqual(
+            get_author(TEST_AUTHOR).first_name, TEST_AUTHOR_FIRST_NAME
+        )
+        self.assertContains(
+            self.authorized_client.get(url), TEST_AUTHOR_FIRST_NAME
+        )
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username=BUDGET_READER)
+        author = User.objects.create_user(username=BUDGET_AUTHOR)
+        group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=BUDGET_GROUP_SLUG
+        )
+        Follow.objects.create(user=cls.reader, author=author)
+        for i in range(BUDGET_POSTS):
+            post = Post.objects.create(
+                text=f'{TEST_POST_TEXT} {i}',
+                author=author,
+                group=group
+            )
+            Comment.objects.bulk_create([
+                Comment(post=post, author=cls.reader, text=TEST_POST_TEXT)
+                for _ in range(BUDGET_COMMENTS_PER_POST)
+            ])
+            Likes.objects.create(user=cls.reader, post=post)
+        own_post = Post.objects.create(text=TEST_POST_TEXT, author=cls.reader)
+        cls.url_args = {
+            'posts:group_list': [BUDGET_GROUP_SLUG],
+            'posts:group_rss': [BUDGET_GROUP_SLUG],
+            'posts:group_atom': [BUDGET_GROUP_SLUG],
+            'posts:profile': [BUDGET_AUTHOR],
+            'posts:profile_rss': [BUDGET_AUTHOR],
+            'posts:profile_atom': [BUDGET_AUTHOR],
+            'posts:post_detail': [post.pk],
+            'posts:post_edit': [own_post.pk],
+            'posts:post_delete': [own_post.pk],
+            'posts:add_comment': [post.pk],
+            'posts:comments': [post.pk],
+            'posts:profile_follow': [BUDGET_AUTHOR],
+            'posts:profile_unfollow': [BUDGET_AUTHOR],
+            'posts:post_like': [post.pk],
+            'posts:post_unlike': [post.pk],
+            'posts:api_post': [post.pk],
+            'posts:api_comments': [post.pk],
+            'posts:archive_year': [post.pub_date.year],
+            'posts:archive_month': [post.pub_date.year, post.pub_date.month],
+        }
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_every_url_has_budget(self):
+        """У каждого URL приложения posts есть бюджет запросов."""
+
+        self.assertBudgetsCoverUrls(
+            QUERY_BUDGETS, urls.urlpatterns, urls.app_name
+        )
+
+    def test_views_stay_within_budget(self):
+        """Ни один view не выходит за свой бюджет запросов."""
+
+        for name, budget in QUERY_BUDGETS.items():
+            url = reverse(name, args=self.url_args.get(name, []))
+            if name == 'posts:search':
+                url += '?q=Test'
+            with self.subTest(url=name):
+                cache.clear()
+                with self.assertMaxQueries(budget, name):
+                    self.client.get(url)
+
+
+class AsyncViewsTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username=BUDGET_READER)
+        cls.author = User.objects.create_user(username=BUDGET_AUTHOR)
+        group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=BUDGET_GROUP_SLUG
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(POSTS_ON_FIRST_PAGE + POSTS_ON_SECOND_PAGE):
+            cls.post = Post.objects.create(
+                text=f'{TEST_POST_TEXT} {i}',
+                author=cls.author,
+                group=group
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text=TEST_POST_TEXT
+        )
+        Likes.objects.create(user=cls.reader, post=cls.post)
+        cls.view_args = {
+            'index': ('posts:index', {}),
+            'group_posts': (
+                'posts:group_list', {'slug': BUDGET_GROUP_SLUG}
+            ),
+            'profile': ('posts:profile', {'username': BUDGET_AUTHOR}),
+            'post_detail': ('posts:post_detail', {'post_id': cls.post.pk}),
+            'follow_index': ('posts:follow_index', {}),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def call(self, view, url_name, kwargs, user):
+        request = self.factory.get(reverse(url_name, kwargs=kwargs))
+        request.user = user
+        if asyncio.iscoroutinefunction(view):
+            return async_to_sync(view)(request, **kwargs)
+        return view(request, **kwargs)
+
+    def test_same_pages_as_sync_views(self):
+        """Асинхронные версии отдают те же страницы."""
+
+        for user in (AnonymousUser(), self.reader, self.author):
+            for name in ASYNC_VIEWS:
+                url_name, kwargs = self.view_args[name]
+                if name == 'follow_index' and not user.is_authenticated:
+                    continue
+                with self.subTest(view=name, user=user):
+                    pages = []
+                    for module in (views, async_views):
+                        cache.clear()
+                        response = self.call(
+                            getattr(module, name), url_name, kwargs, user
+                        )
+                        self.assertEqual(response.status_code, HTTPStatus.OK)
+                        pages.append(CSRF_TOKEN.sub(b'', response.content))
+                    self.assertEqual(*pages)
+
+    def test_cached_page_reused(self):
+        """Закешированная страница отдается без запросов к записям."""
+
+        url_name, kwargs = self.view_args['index']
+        first = self.call(
+            async_views.index, url_name, kwargs, AnonymousUser()
+        )
+        with self.assertNumQueries(0):
+            second = self.call(
+                async_views.index, url_name, kwargs, AnonymousUser()
+            )
+        self.assertEqual(first.content, second.content)
+
+    def test_follow_index_requires_login(self):
+        response = self.call(
+            async_views.follow_index, 'posts:follow_index', {},
+            AnonymousUser()
+        )
+        self.assertRedirects(
+            response,
+            f'{reverse(settings.LOGIN_URL)}?next={FOLLOW_INDEX_URL}',
+            fetch_redirect_response=False
+        )
+
+    def test_missing_objects_not_found(self):
+        for name, kwargs in (
+                ('group_posts', {'slug': 'missing'}),
+                ('profile', {'username': 'missing'}),
+                ('post_detail', {'post_id': self.post.pk + 1})):
+            with self.subTest(view=name):
+                request = self.factory.get('/')
+                request.user = self.reader
+                with self.assertRaises(Http404):
+                    async_to_sync(getattr(async_views, name))(
+                        request, **kwargs
+                    )
+
+    def test_async_views_stay_within_budget(self):
+        """Параллельные выборки не добавляют запросов."""
+
+        for name in ASYNC_VIEWS:
+            url_name, kwargs = self.view_args[name]
+            with self.subTest(view=name):
+                cache.clear()
+                with self.assertMaxQueries(QUERY_BUDGETS[url_name], name):
+                    self.call(
+                        getattr(async_views, name), url_name, kwargs,
+                        self.reader
+                    )
+
+
+class PageCacheMissTest(SimpleTestCase):
+    """После подъема версии пропущенную страницу рендерят один раз."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def request(self):
+        request = RequestFactory().get(INDEX_URL)
+        request.user = AnonymousUser()
+        return request
+
+    def test_concurrent_misses_render_once(self):
+        @caching.cache_page_versioned(
+            60, 'test_miss', lambda: [caching.GLOBAL]
+        )
+        def view(request):
+            self.calls.append(1)
+            time.sleep(RENDER_DELAY)
+            return HttpResponse(TEST_POST_TEXT)
+
+        caching.bump(caching.GLOBAL)
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(view(self.request()))
+            ) for _ in range(CONCURRENT_REQUESTS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(
+            {response.content for response in responses},
+            {TEST_POST_TEXT.encode()}
+        )
+
+    def test_concurrent_async_misses_render_once(self):
+        @caching.cache_page_versioned(
+            60, 'test_async_miss', lambda: [caching.GLOBAL]
+        )
+        async def view(request):
+            self.calls.append(1)
+            await asyncio.sleep(RENDER_DELAY)
+            return HttpResponse(TEST_POST_TEXT)
+
+        async def requests():
+            return await asyncio.gather(*(
+                view(self.request()) for _ in range(CONCURRENT_REQUESTS)
+            ))
+
+        caching.bump(caching.GLOBAL)
+        responses = async_to_sync(requests)()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(
+            {response.content for response in responses},
+            {TEST_POST_TEXT.encode()}
+        )
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=TEST_USER)
+        cls.author = User.objects.create_user(username=TEST_AUTHOR)
+        cls.group = Group.objects.create(
+            title=TEST_GROUP_TITLE,
+            slug=GROUP_SLUG
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text=TEST_POST_TEXT,
+            group=cls.group
+        )
+        cls.POST_DETAIL_URL = reverse('posts:post_detail', args=[cls.post.pk])
+        cls.urls = (INDEX_URL, GROUP_URL, PROFILE_URL, cls.POST_DETAIL_URL)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def etag(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return response['ETag']
+
+    def test_not_modified_without_queries(self):
+        """Повторный запрос с ETag получает 304 без обращений к базе."""
+
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.etag(self.client, url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                self.assertFalse(response.content)
+
+    def test_changes_invalidate_etag(self):
+        """Правка, комментарий и лайк меняют ETag страницы записи."""
+
+        changes = (
+            lambda: self.post.save(),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.user, text=TEST_POST_TEXT
+            ),
+            lambda: Likes.objects.create(post=self.post, user=self.user),
+        )
+        for change in changes:
+            etag = self.etag(self.authorized_client, self.POST_DETAIL_URL)
+            change()
+            response = self.authorized_client.get(
+                self.POST_DETAIL_URL, HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user_and_page(self):
+        """Страницы разных пользователей и курсоров не совпадают."""
+
+        etags = {
+            self.etag(self.client, INDEX_URL),
+            self.etag(self.authorized_client, INDEX_URL),
+            self.etag(self.client, f'{INDEX_URL}?cursor=x'),
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_if_modified_since(self):
+        """Last-Modified - время последнего подъема версий областей."""
+
+        past = time.time() - 60
+        scopes = views.post_scopes(self.post.pk)
+        caching.get_versions(scopes)
+        cache.set_many({
+            f'{caching.MODIFIED_KEY_PREFIX}:{scope}': past
+            for scope in scopes
+        }, None)
+        response = self.client.get(self.POST_DETAIL_URL)
+        self.assertEqual(response['Last-Modified'], http_date(past))
+        response = self.client.get(
+            self.POST_DETAIL_URL, HTTP_IF_MODIFIED_SINCE=http_date(past)
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        caching.bump(caching.post_scope(self.post.pk))
+        response = self.client.get(
+            self.POST_DETAIL_URL, HTTP_IF_MODIFIED_SINCE=http_date(past)
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_updated_tracks_edits(self):
+        """Дата изменения записи меняется правкой, но не лайком."""
+
+        Likes.objects.create(post=self.post, user=self.user)
+        self.post.refresh_from_db()
+        self.assertFalse(self.post.was_edited)
+        updated = self.post.updated
+        self.post.pub_date -= timedelta(hours=1)
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated, updated)
+        self.assertTrue(self.post.was_edited)
+        self.assertContains(
+            self.client.get(self.POST_DETAIL_URL), 'Изменено:'
+        )
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=TEST_AUTHOR)
+        cls.post = Post.objects.create(author=cls.author, text=TEST_POST_TEXT)
+        cls.old_post = Post.objects.create(
+            author=cls.author, text=TEST_POST_TEXT
+        )
+        cls.old_post.pub_date = ARCHIVE_OLD_DATE
+        cls.old_post.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def month_counts(self):
+        return set(
+            MonthlyArchive.objects.filter(posts_count__gt=0).values_list(
+                'year', 'month', 'posts_count'
+            )
+        )
+
+    def test_archive_counts_follow_posts(self):
+        """Создание, перенос в другой месяц и удаление меняют архив."""
+
+        now = self.post.pub_date
+        self.assertEqual(self.month_counts(), {
+            (now.year, now.month, 1),
+            (ARCHIVE_OLD_DATE.year, ARCHIVE_OLD_DATE.month, 1),
+        })
+        Post.objects.get(pk=self.old_post.pk).delete()
+        Post.objects.create(author=self.author, text=TEST_POST_TEXT)
+        self.assertEqual(self.month_counts(), {(now.year, now.month, 2)})
+        out = StringIO()
+        call_command('repair_counters', dry_run=True, stdout=out)
+        self.assertIn('месяцев архива - 0', out.getvalue())
+
+    def test_archive_pages(self):
+        """Страницы года и месяца показывают только записи периода."""
+
+        month_url = reverse(
+            'posts:archive_month',
+            args=[ARCHIVE_OLD_DATE.year, ARCHIVE_OLD_DATE.month]
+        )
+        for url in (month_url, reverse(
+                'posts:archive_year', args=[ARCHIVE_OLD_DATE.year])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    [post.pk for post in response.context['page_obj']],
+                    [self.old_post.pk]
+                )
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:archive_month', args=[2020, 13])
+            ).status_code,
+            HTTPStatus.NOT_FOUND
+        )
+
+    def test_sidebar_lists_months(self):
+        """Боковая колонка главной - месяцы из таблицы архива."""
+
+        response = self.client.get(INDEX_URL)
+        self.assertContains(response, reverse(
+            'posts:archive_month',
+            args=[ARCHIVE_OLD_DATE.year, ARCHIVE_OLD_DATE.month]
+        ))
+        self.assertContains(response, 'Март 2015')
+        self.assertNotContains(response, 'Апрель 2020')
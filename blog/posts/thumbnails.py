@@ -0,0 +1,217 @@
+"""
+Фоновая подготовка миниатюр для картинок записей.
+
+sorl создает миниатюру при первом рендере шаблона, и этот запрос
+платит за декодирование и ресайз картинки. Здесь те же миниатюры
+готовятся заранее: после коммита записи с новой картинкой задача
+уходит в ограниченный пул потоков, а для уже загруженных картинок
+есть команда backfill_thumbnails.
+
+Для каждой картинки готовятся варианты нескольких ширин в WebP и
+JPEG для srcset: в пропорциях карточки записи и эскиза рекомендуемой
+записи на главной. Pillow не переносит EXIF в сохраняемые миниатюры,
+а сам оригинал лежит в MEDIA_ROOT и доступен по ссылке, поэтому
+strip_metadata убирает EXIF из него еще до сохранения: ни геотегов,
+ни данных камеры нет ни в вариантах, ни в загруженном файле.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+
+# Пропорции карточки записи и ширины вариантов для srcset.
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FALLBACK_WIDTH = 960
+# Эскиз рекомендуемой записи: 200x210 и вдвое больше для экранов
+# высокой плотности.
+TEASER_IMAGE_RATIO = (200, 210)
+TEASER_IMAGE_WIDTHS = (200, 400)
+TEASER_IMAGE_FALLBACK_WIDTH = 200
+CARD = 'card'
+TEASER = 'teaser'
+# Форма -> (пропорции, ширины, ширина для src).
+SHAPES = {
+    CARD: (POST_IMAGE_RATIO, POST_IMAGE_WIDTHS, POST_IMAGE_FALLBACK_WIDTH),
+    TEASER: (
+        TEASER_IMAGE_RATIO, TEASER_IMAGE_WIDTHS, TEASER_IMAGE_FALLBACK_WIDTH
+    ),
+}
+JPEG = 'JPEG'
+WEBP = 'WEBP'
+DEFAULT_WORKERS = 2
+EXIF_ORIENTATION_TAG = 0x0112
+# Форматы, которые Pillow пересохраняет без потери кадров.
+STRIPPED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_workers(),
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def get_workers():
+    return getattr(settings, 'THUMBNAIL_PREGENERATE_WORKERS', DEFAULT_WORKERS)
+
+
+def get_formats():
+    """Форматы вариантов: WebP, если Pillow собран с libwebp, и JPEG."""
+
+    return (WEBP, JPEG) if features.check('webp') else (JPEG,)
+
+
+def get_widths(image_width=None, widths=POST_IMAGE_WIDTHS):
+    """
+    Ширины вариантов для картинки: шире оригинала не растягиваем,
+    но самый узкий вариант есть всегда.
+    """
+
+    if not image_width:
+        return widths
+    suitable = tuple(width for width in widths if width <= image_width)
+    return suitable or widths[:1]
+
+
+def get_variants(image_width=None, shapes=tuple(SHAPES)):
+    """Пары (geometry, options) для get_thumbnail по всем формам."""
+
+    variants = []
+    for shape in shapes:
+        (ratio_width, ratio_height), widths, _ = SHAPES[shape]
+        variants += [
+            (
+                f'{width}x{round(width * ratio_height / ratio_width)}',
+                {'crop': 'center', 'upscale': True, 'format': image_format},
+            )
+            for image_format in get_formats()
+            for width in get_widths(image_width, widths)
+        ]
+    return variants
+
+
+def get_thumbnails(name, image_width=None, shape=CARD):
+    """
+    Пары (формат, миниатюра) вариантов формы shape, от узких к
+    широким. Готовые варианты sorl берет из хранилища ключей.
+    """
+
+    return [
+        (options['format'], get_thumbnail(name, geometry, **options))
+        for geometry, options in get_variants(image_width, [shape])
+    ]
+
+
+def has_thumbnails(name, image_width=None):
+    """Есть ли в хранилище sorl все варианты картинки."""
+
+    # Публичного способа спросить о миниатюрах у sorl нет, список
+    # ключей лежит под identity='thumbnails' (sorl закреплен в
+    # requirements.txt).
+    thumbnails = default.kvstore._get(
+        ImageFile(name).key, identity='thumbnails'
+    )
+    return len(thumbnails or ()) >= len(get_variants(image_width))
+
+
+def get_ready_thumbnails(name, image_width=None, shape=CARD):
+    """
+    Как get_thumbnails, но только если все варианты уже готовы, иначе
+    пустой список: миниатюры при этом не создаются.
+    """
+
+    if not has_thumbnails(name, image_width):
+        return []
+    return get_thumbnails(name, image_width, shape)
+
+
+def generate_thumbnails(name, image_width=None):
+    """
+    Создает недостающие варианты картинки. Готовые sorl берет
+    из хранилища ключей, поэтому повторный вызов почти бесплатен.
+    """
+
+    for geometry, options in get_variants(image_width):
+        get_thumbnail(name, geometry, **options)
+
+
+def strip_metadata(upload):
+    """
+    Загруженная картинка без EXIF или сам upload, если убирать нечего.
+    Поворот из EXIF применяется к пикселям, иначе без тега картинка
+    ляжет на бок; без поворота JPEG пересохраняется с прежними
+    таблицами квантования (quality='keep').
+    """
+
+    upload.seek(0)
+    with Image.open(upload) as image:
+        exif = image.getexif()
+        if image.format not in STRIPPED_FORMATS or not exif:
+            return upload
+        options = {'exif': b''}
+        if 'icc_profile' in image.info:
+            options['icc_profile'] = image.info['icc_profile']
+        image_format = image.format
+        if exif.get(EXIF_ORIENTATION_TAG, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        elif image_format == JPEG:
+            options['quality'] = 'keep'
+        buffer = BytesIO()
+        image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue(), name=upload.name)
+
+
+def _run(name, image_width):
+    try:
+        generate_thumbnails(name, image_width)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры для %s', name)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(name)
+        # Поток живет вне цикла запроса, соединение закрываем сами.
+        connections.close_all()
+
+
+def submit(name, image_width=None):
+    """
+    Ставит картинку в очередь пула. Одна и та же картинка не
+    обрабатывается двумя потоками одновременно.
+    """
+
+    if get_workers() <= 0:
+        generate_thumbnails(name, image_width)
+        return
+    with _executor_lock:
+        if name in _in_flight:
+            return
+        _in_flight.add(name)
+    _get_executor().submit(_run, name, image_width)
+
+
+def schedule_thumbnails(post):
+    """Готовит миниатюры картинки записи после коммита транзакции."""
+
+    if not post.image:
+        return
+    name, image_width = post.image.name, post.image_width
+    transaction.on_commit(lambda: submit(name, image_width))
@@ -1,15 +1,32 @@
+from django.conf import settings
 from django.urls import path
 
-from posts import views
+from posts import api, async_views, feeds, views
 
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'posts'
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('group/<slug:slug>/', views.group_posts, name='group_list'),
-    path('profile/<str:username>/', views.profile, name='profile'),
-    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('', read_views.index, name='index'),
+    path('group/<slug:slug>/', read_views.group_posts, name='group_list'),
+    path('group/<slug:slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('group/<slug:slug>/atom/', feeds.group_atom, name='group_atom'),
+    path('search/', views.search, name='search'),
+    path('archive/<int:year>/', views.archive, name='archive_year'),
+    path(
+        'archive/<int:year>/<int:month>/',
+        views.archive,
+        name='archive_month'
+    ),
+    path('profile/<str:username>/', read_views.profile, name='profile'),
+    path('profile/<str:username>/rss/', feeds.profile_rss, name='profile_rss'),
+    path(
+        'profile/<str:username>/atom/',
+        feeds.profile_atom,
+        name='profile_atom'
+    ),
+    path('posts/<int:post_id>/', read_views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/delete/', views.post_delete, name='post_delete'),
@@ -18,7 +35,12 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
-    path('follow/', views.follow_index, name='follow_index'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comments,
+        name='comments'
+    ),
+    path('follow/', read_views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -30,5 +52,14 @@ urlpatterns = [
         name='profile_unfollow'
     ),
     path('posts/<int:post_id>/like', views.post_like, name='post_like'),
-    path('posts/<int:post_id>/unlike', views.post_unlike, name='post_unlike')
+    path('posts/<int:post_id>/unlike', views.post_unlike, name='post_unlike'),
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post, name='api_post'),
+    path(
+        'api/posts/<int:post_id>/comments/',
+        api.comments,
+        name='api_comments'
+    ),
+    path('api/groups/', api.groups, name='api_groups'),
+    path('api/follow/', api.follow, name='api_follow'),
 ]
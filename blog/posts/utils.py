@@ -1,8 +1,231 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
 
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
-def get_pages(request, post_list):
-    posts_per_page = 10
-    paginator = Paginator(post_list, posts_per_page)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+POSTS_PER_PAGE = 10
+TOTAL_ESTIMATE_LIMIT = 1000
+CURSOR_PARAM = 'cursor'
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(direction, key_value=None, pk=None):
+    """
+    Упаковывает позицию в непрозрачный токен для URL. Ключ - дата
+    или число (например, ранг полнотекстового поиска).
+    """
+
+    payload = [direction]
+    if key_value is not None:
+        if hasattr(key_value, 'isoformat'):
+            key_value = key_value.isoformat()
+        payload += [key_value, pk]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_key(key_value):
+    if isinstance(key_value, str):
+        return parse_datetime(key_value)
+    if isinstance(key_value, bool) or not isinstance(key_value, (int, float)):
+        return None
+    return key_value
+
+
+def decode_cursor(token):
+    """
+    Распаковывает токен в (направление, значение ключа, pk).
+    Для битого или чужого токена возвращает None.
+    """
+
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(payload, list) or not payload:
+        return None
+    direction = payload[0]
+    if direction not in (FORWARD, BACKWARD):
+        return None
+    if len(payload) == 1:
+        return direction, None, None
+    if len(payload) != 3 or not isinstance(payload[2], int):
+        return None
+    key_value = _decode_key(payload[1])
+    if key_value is None:
+        return None
+    return direction, key_value, payload[2]
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (key, pk) от новых записей к старым.
+
+    В отличие от Paginator не выполняет COUNT(*) и OFFSET: каждая
+    страница - это диапазонный запрос по индексу, поэтому стоимость
+    пятисотой страницы такая же, как у первой.
+    """
+
+    def __init__(self, object_list, per_page=POSTS_PER_PAGE,
+                 key='pub_date', total=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.key = key
+        self._total = total
+
+    @cached_property
+    def total(self):
+        """
+        Количество записей. Если его не передали явно, считается
+        не дальше TOTAL_ESTIMATE_LIMIT, чтобы не сканировать таблицу.
+        """
+
+        if self._total is not None:
+            return self._total() if callable(self._total) else self._total
+        return self.object_list[:TOTAL_ESTIMATE_LIMIT].count()
+
+    @property
+    def total_is_estimate(self):
+        return self._total is None and self.total >= TOTAL_ESTIMATE_LIMIT
+
+    def _key_of(self, row):
+        if isinstance(row, dict):
+            return row[self.key], row['pk']
+        return getattr(row, self.key), row.pk
+
+    def _forward(self, key_value, pk):
+        queryset = self.object_list.order_by(f'-{self.key}', '-pk')
+        if key_value is None:
+            return queryset
+        return queryset.filter(
+            Q(**{f'{self.key}__lt': key_value})
+            | Q(**{self.key: key_value, 'pk__lt': pk})
+        )
+
+    def _backward(self, key_value, pk):
+        queryset = self.object_list.order_by(self.key, 'pk')
+        if key_value is None:
+            return queryset
+        return queryset.filter(
+            Q(**{f'{self.key}__gt': key_value})
+            | Q(**{self.key: key_value, 'pk__gt': pk})
+        )
+
+    def _valid_key(self, key_value):
+        return isinstance(key_value, datetime)
+
+    def _fetch(self, direction, key_value, pk, limit):
+        """Строки страницы в порядке обхода в направлении direction."""
+
+        if direction == FORWARD:
+            return list(self._forward(key_value, pk)[:limit])
+        return list(self._backward(key_value, pk)[:limit])
+
+    def get_page(self, cursor=None, query_params=None):
+        """Возвращает страницу по токену; битый токен - первая страница."""
+
+        position = decode_cursor(cursor)
+        if position is None or (
+                position[1] is not None and not self._valid_key(position[1])):
+            position = FORWARD, None, None
+        direction, key_value, pk = position
+        rows = self._fetch(direction, key_value, pk, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == FORWARD:
+            has_next, has_previous = has_more, key_value is not None
+        else:
+            rows = rows[::-1]
+            has_next, has_previous = key_value is not None, has_more
+        return CursorPage(
+            rows, self,
+            next_cursor=self._cursor_after(
+                FORWARD, rows, -1, has_next, key_value, pk),
+            previous_cursor=self._cursor_after(
+                BACKWARD, rows, 0, has_previous, key_value, pk),
+            query_params=query_params,
+        )
+
+    def _cursor_after(self, direction, rows, index, needed, key_value, pk):
+        if not needed:
+            return None
+        if rows:
+            return encode_cursor(direction, *self._key_of(rows[index]))
+        # Ушли за край выборки: шагаем обратно от той же позиции.
+        return encode_cursor(direction, key_value, pk)
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации."""
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None, query_params=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query_params = query_params
+
+    def __repr__(self):
+        return f'<CursorPage: {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(BACKWARD)
+
+    def _url(self, cursor):
+        params = self.query_params.copy() if self.query_params else None
+        if params is None:
+            return f'?{CURSOR_PARAM}={cursor}' if cursor else '?'
+        params.pop(CURSOR_PARAM, None)
+        if cursor:
+            params[CURSOR_PARAM] = cursor
+        return f'?{params.urlencode()}'
+
+    @property
+    def first_url(self):
+        return self._url(None)
+
+    @property
+    def previous_url(self):
+        return self._url(self.previous_cursor)
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor)
+
+    @property
+    def last_url(self):
+        return self._url(self.last_cursor)
+
+
+def get_pages(request, post_list, key='pub_date', total=None,
+              per_page=POSTS_PER_PAGE):
+    paginator = CursorPaginator(post_list, per_page, key=key, total=total)
+    return paginator.get_page(
+        request.GET.get(CURSOR_PARAM), query_params=request.GET
+    )
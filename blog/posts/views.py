@@ -1,14 +1,55 @@
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Prefetch
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import url_has_allowed_host_and_scheme
 
+from core.db import retry_on_locked
+
+from posts import caching
+from posts.archive import period_range
+from posts.authors import get_author
+from posts.featured import get_featured_posts
 from posts.forms import CommentForm, PostForm
-from posts.models import Comment, Follow, Group, Likes, Post, User
-from posts.utils import get_pages
+from posts.likes import mark_liked
+from posts.models import (Comment, Follow, Group, Likes, MonthlyArchive, Post,
+                          User)
+from posts.search import search_posts
+from posts.thumbnails import schedule_thumbnails
+from posts.timeline import get_timeline
+from posts.utils import CURSOR_PARAM, get_pages
+
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+COMMENTS_PER_PAGE = 20
+
+
+def index_scopes():
+    return [caching.GLOBAL]
+
+
+def group_scopes(slug):
+    return [caching.group_scope(slug)]
+
+
+def profile_scopes(username):
+    return [caching.author_scope(username)]
+
 
+def archive_scopes(year, month=None):
+    return [caching.GLOBAL]
 
-@cache_page(5, key_prefix='index_page')
+
+def post_scopes(post_id):
+    # Общая область - из-за числа записей автора на странице.
+    return [caching.post_scope(post_id), caching.GLOBAL]
+
+
+@caching.conditional_page(index_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='index_page',
+    scopes=index_scopes
+)
 def index(request):
     """Главная страница."""
 
@@ -19,92 +60,153 @@ def index(request):
             'page_obj': get_pages(
                 request,
                 Post.objects.select_related('author', 'group').all()),
-            'last_post': Post.objects.latest('pub_date'),
-            'last_second_post': Post.objects.all().order_by('-pub_date')[1],  # подумать над другим способом передать переменную в шаблон и в целом над логикой
-            'last_third_post': Post.objects.all().order_by('-pub_date')[2],  # подумать над другим способом передать переменную в шаблон
+            'featured_posts': get_featured_posts(),
         }
     )
 
 
-@cache_page(10, key_prefix='group_page')
+@caching.conditional_page(group_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='group_page',
+    scopes=group_scopes
+)
 def group_posts(request, slug):
     """Страница сообщества."""
 
+    group = get_object_or_404(Group, slug=slug)
     return render(
         request,
         'posts/group_list.html',
         {
             'page_obj': get_pages(
                 request,
-                get_object_or_404(
-                    Group.objects.prefetch_related('posts'),
-                    slug=slug).posts.all()
+                group.posts.select_related('author', 'group')
             ),
-            'group': get_object_or_404(Group, slug=slug),
+            'group': group,
         }
     )
 
 
-def profile(request, username):
-    """Страница профиля."""
+@caching.conditional_page(archive_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='archive_page',
+    scopes=archive_scopes
+)
+def archive(request, year, month=None):
+    """Записи за год или за месяц."""
 
-    author = get_object_or_404(
-        User.objects.prefetch_related('posts__group'), username=username
+    try:
+        start, end = period_range(year, month)
+    except (ValueError, OverflowError):
+        raise Http404('Такого месяца нет')
+    return render(
+        request,
+        'posts/archive.html',
+        {
+            # Диапазон по pub_date идет по индексу post_pub_date_idx.
+            'page_obj': get_pages(
+                request,
+                Post.objects.select_related('author', 'group').filter(
+                    pub_date__gte=start, pub_date__lt=end
+                )
+            ),
+            'period': start,
+            'month': month,
+            'months': MonthlyArchive.objects.filter(
+                year=year, posts_count__gt=0
+            ).order_by('month'),
+        }
     )
-    if (request.user.is_authenticated) and (request.user != author) and not (
-            Follow.objects.filter(user=request.user, author=author).exists()):
-        return render(
-            request,
-            'posts/profile.html',
-            {
-                'author': author,
-                'page_obj': get_pages(request, author.posts.all()),
-            }
-        )
+
+
+def search(request):
+    """Поиск по записям."""
+
+    query = request.GET.get('q', '').strip()
     return render(
         request,
-        'posts/profile.html',
+        'posts/search.html',
         {
-            'author': author,
-            'page_obj': get_pages(request, author.posts.all()),
-            'following': True,
+            'query': query,
+            'page_obj': search_posts(
+                query,
+                request.GET.get(CURSOR_PARAM),
+                query_params=request.GET
+            ),
         }
     )
 
 
+@caching.conditional_page(profile_scopes)
+@caching.cache_page_versioned(
+    PAGE_CACHE_TIMEOUT,
+    key_prefix='profile_page',
+    scopes=profile_scopes
+)
+def profile(request, username):
+    """Страница профиля."""
+
+    author = get_author(username)
+    if author is None:
+        raise Http404('Такого автора нет')
+    context = {
+        'author': author,
+        # Только текущая страница: записи автора по индексу author_id,
+        # автор уже есть, группы - тем же запросом.
+        'page_obj': get_pages(
+            request,
+            Post.objects.filter(author=author).select_related('group')
+        ),
+    }
+    if not request.user.is_authenticated or request.user == author or (
+            Follow.objects.filter(user=request.user, author=author).exists()):
+        context['following'] = True
+    return render(request, 'posts/profile.html', context)
+
+
+@caching.conditional_page(post_scopes)
 def post_detail(request, post_id):
     """Страница записи."""
 
-    post = get_object_or_404(Post.objects.annotate(
-        posts_count=Count('author__posts', distinct=True),
-        comments_count=Count('comments', distinct=True)
-    ).prefetch_related(Prefetch(
-        'comments',
-        queryset=Comment.objects.select_related('author'))), pk=post_id)
-    if (request.user.is_authenticated) and not (
-        Likes.objects.filter(
-            user=request.user,
-            post=get_object_or_404(Post, pk=post_id)).exists()):
-        return render(
-            request,
-            'posts/post_detail.html',
-            {
-                'post': post,
-                'form': CommentForm(request.POST or None),
-            }
-        )
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
+    mark_liked([post], request.user)
     return render(
         request,
         'posts/post_detail.html',
         {
             'post': post,
+            'comments': _get_comments(request, post_id),
             'form': CommentForm(request.POST or None),
-            'liked': True
         }
     )
 
 
+def comments(request, post_id):
+    """Фрагмент со следующей страницей комментариев записи."""
+
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return render(
+        request,
+        'includes/comments_page.html',
+        {'post': post, 'comments': _get_comments(request, post_id)}
+    )
+
+
+def _get_comments(request, post_id):
+    return get_pages(
+        request,
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        key='created',
+        per_page=COMMENTS_PER_PAGE
+    )
+
+
 @login_required
+@retry_on_locked
 def post_create(request):
     """Страница создания записи."""
 
@@ -116,11 +218,14 @@ def post_create(request):
         return render(request, 'posts/create_post.html', {'form': form})
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    with transaction.atomic():
+        post.save()
+        schedule_thumbnails(post)
     return redirect('posts:profile', username=request.user)
 
 
 @login_required
+@retry_on_locked
 def post_edit(request, post_id):
     """Страница редактирования записи."""
 
@@ -135,13 +240,23 @@ def post_edit(request, post_id):
     if not form.is_valid():
         context = {'form': form, 'is_edit': True}
         return render(request, 'posts/create_post.html', context)
-    post = form.save()
-    post.author = request.user
-    post.save()
+    post = form.save(commit=False)
+    # Только поля формы: счетчики лайков и комментариев в той же строке
+    # параллельно сдвигаются через F(), их прежние значения не пишем.
+    fields = [*form.changed_data, 'updated']
+    if 'image' in form.changed_data:
+        fields += ['image_width', 'image_height']
+    # Одна транзакция: при «database is locked» запрос повторяется
+    # целиком.
+    with transaction.atomic():
+        post.save(update_fields=fields)
+        if 'image' in form.changed_data:
+            schedule_thumbnails(post)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@retry_on_locked
 def add_comment(request, post_id):
     """Добавление комментария."""
 
@@ -152,7 +267,10 @@ def add_comment(request, post_id):
     comment = form.save(commit=False)
     comment.author = request.user
     comment.post = post
-    comment.save()
+    with transaction.atomic():
+        # Счетчик комментариев записи сдвигает сигнал - в той же
+        # транзакции.
+        comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -160,18 +278,13 @@ def add_comment(request, post_id):
 def follow_index(request):
     """Страница подписок."""
 
-    return render(
-        request,
-        'posts/follow.html',
-        {
-            'page_obj': get_pages(
-                request,
-                Post.objects.filter(author__following__user=request.user))
-        }
-    )
+    page_obj = get_pages(request, get_timeline(request.user))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    return render(request, 'posts/follow.html', {'page_obj': page_obj})
 
 
 @login_required
+@retry_on_locked
 def profile_follow(request, username):
     """Подписаться на автора записи."""
 
@@ -184,6 +297,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@retry_on_locked
 def profile_unfollow(request, username):
     """Отписаться от автора записи."""
 
@@ -196,27 +310,42 @@ def profile_unfollow(request, username):
 
 
 @login_required
+@retry_on_locked
 def post_delete(request, post_id):
     """Удаление записи."""
 
     post = get_object_or_404(Post, pk=post_id)
     if request.user == post.author:
-        get_object_or_404(Post, pk=post_id).delete()
+        post.delete()
     return redirect('posts:profile', username=request.user.username)
 
 
+def _redirect_back(request, post_id):
+    """Возвращает на страницу из ?next=, иначе на страницу записи."""
+
+    next_url = request.GET.get('next')
+    if next_url and url_has_allowed_host_and_scheme(
+            next_url, allowed_hosts={request.get_host()},
+            require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
 @login_required
+@retry_on_locked
 def post_like(request, post_id):
     """Поставить лайк на запись."""
 
-    Likes.objects.get_or_create(
-        user=request.user,
-        post=get_object_or_404(Post, pk=post_id)
-    )
-    return redirect('posts:post_detail', post_id=post_id)
+    with transaction.atomic():
+        Likes.objects.get_or_create(
+            user=request.user,
+            post=get_object_or_404(Post, pk=post_id)
+        )
+    return _redirect_back(request, post_id)
 
 
 @login_required
+@retry_on_locked
 def post_unlike(request, post_id):
     """Убрать лайк с записи."""
 
@@ -225,4 +354,4 @@ def post_unlike(request, post_id):
         user=request.user,
         post=get_object_or_404(Post, pk=post_id)
     ).delete()
-    return redirect('posts:post_detail', post_id=post_id)
+    return _redirect_back(request, post_id)